@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Structured Access Log
+One JSON object per request (route template, method, path, normalized
+query parameters, status, latency and response bytes) appended to a JSONL
+file, such as requests.jsonl, which replay_requests.py turns back into
+load. Request threads only append to an in-memory buffer; a background
+thread encodes and writes the buffered lines once a second in a single
+write, so a slow disk never holds up a response. If the writer falls
+behind by more than max_pending entries, new entries are dropped and
+counted instead of growing memory.
+
+The log is off unless a path is configured: serve.py --access-log, or
+PRODUCTS_API_ACCESS_LOG for the debug server and the ASGI lifespan. It is
+started by those entry points (serve.py workers after their warm-up),
+never on import, so tests and benchmarks that import the API write
+nothing. The file is appended to and never rotated; rotate it externally
+or turn the log off again once enough traffic is captured.
+"""
+
+import os
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+
+import serialization
+
+logger = logging.getLogger(__name__)
+
+
+def access_log_path():
+    """Where the servers write the access log, or None when it is off"""
+    return os.environ.get('PRODUCTS_API_ACCESS_LOG') or None
+
+
+def normalize_params(args):
+    """Query parameters sorted by name, empty values dropped, as [name, value] pairs"""
+    return sorted([key, value] for key, value in args.items(multi=True) if value != '')
+
+
+class AccessLog:
+    """Buffered JSONL writer with a background flushing thread"""
+
+    def __init__(self, path, flush_interval=1.0, max_pending=10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._stopping = threading.Event()
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._thread = threading.Thread(target=self._run, name='access-log', daemon=True)
+        self._thread.start()
+
+    def record(self, request, status, latency, response_bytes, route):
+        """Buffer one request; called on the request thread, never blocks"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append({
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'method': request.method,
+            'route': route,
+            'path': request.path,
+            'params': normalize_params(request.args),
+            'status': status,
+            'latency_ms': round(latency * 1000, 3),
+            'bytes': response_bytes
+        })
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Write every buffered entry in one append"""
+        lines = []
+        while self._pending:
+            lines.append(serialization.dumps(self._pending.popleft()) + b"\n")
+        if not lines:
+            return
+        try:
+            os.write(self._fd, b"".join(lines))
+            self.written += len(lines)
+        except OSError as e:
+            self.dropped += len(lines)
+            logger.warning(f"Could not write access log {self.path}: {e}")
+
+    def close(self, timeout=5.0):
+        """Stop the writer after a final flush"""
+        self._stopping.set()
+        self._thread.join(timeout)
+        os.close(self._fd)
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'written': self.written,
+            'pending': len(self._pending),
+            'dropped': self.dropped
+        }
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+API Test Fixtures
+Shared set-up for the tests that drive products_api through the Flask test
+client: a synthetic scratch catalog with the refactored, migrated schema,
+and ApiTestCase, which points the API at it with fresh caches and indexes
+and puts back every module global it replaced once the class is done.
+"""
+
+import itertools
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import logging
+
+import create_database
+import products_api
+import query_builder
+from columnar_index import ColumnarIndex, columnar_index_enabled
+from db_pool import ConnectionPool
+from listing_counts import CountCache, CatalogStatistics
+from migrations import apply_migrations
+from refactor_database import DatabaseRefactor
+from response_cache import ResponseCache
+from slow_queries import SlowQueryLog
+from suggest_index import SuggestIndex
+
+CATEGORIES = ['Jeans', 'Tops & Tees', 'Sweaters', 'Shorts', 'Swim', 'Active',
+              'Socks', 'Outerwear & Coats', 'Pants', 'Accessories']
+BRANDS = [f'Brand {i}' for i in range(40)]
+
+# Module globals of products_api that ApiTestCase replaces and restores
+API_GLOBALS = ('pool', 'export_pool', 'columnar_index', 'suggest_index', 'count_cache', 'catalog_stats',
+               'response_cache', 'slow_query_log', 'access_log')
+
+# A products scan without any index is the plan we never want to see
+FULL_SCAN = re.compile(r'^SCAN (p|products)$')
+
+
+def build_test_database(db_path, product_count=5000):
+    """Build the refactored, migrated schema and fill it with synthetic rows"""
+    conn = sqlite3.connect(db_path)
+    create_database.create_products_table(conn)
+
+    rng = random.Random(7)
+    rows = []
+    for product_id in range(1, product_count + 1):
+        category = rng.choice(CATEGORIES)
+        brand = rng.choice(BRANDS)
+        retail_price = round(rng.uniform(5, 300), 2)
+        rows.append((
+            product_id, round(retail_price * 0.55, 2), category,
+            f"{brand} {category} {product_id}", brand, retail_price,
+            rng.choice(['Men', 'Women']), f"SKU{product_id:08d}", rng.randint(1, 10)
+        ))
+    conn.executemany("""
+        INSERT INTO products (id, cost, category, name, brand, retail_price,
+                              department, sku, distribution_center_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+    refactor = DatabaseRefactor(db_path)
+    refactor.connect()
+    refactor.create_departments_table()
+    refactor.populate_departments_table(refactor.extract_unique_departments())
+    refactor.add_department_id_column()
+    refactor.update_products_with_department_ids()
+    apply_migrations(refactor.connection)
+    refactor.close()
+
+
+def insert_products(db_path, rows):
+    """Add (id, cost, category, name, brand, retail_price, department, sku, dc) rows"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany("""
+            INSERT INTO products (id, cost, category, name, brand, retail_price,
+                                  department, sku, distribution_center_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def sorts_products(plan):
+    """
+    True if the plan sorts product rows in a temp B-tree. The final ORDER BY
+    of a listing statement only re-sorts the rows of its page subquery, so
+    it does not count.
+    """
+    details = {row[0]: row[3] for row in plan}
+    return any('TEMP B-TREE' in row[3] and details.get(row[1], 'CO-ROUTINE page') == 'CO-ROUTINE page'
+               for row in plan)
+
+
+def is_bounded_rowid_walk(sql, plan):
+    """
+    True for a page read by walking products in id order under a LIMIT.
+
+    For broad filters sorted by id the planner rightly prefers reading the
+    table in rowid order and stopping once the page is full over sorting an
+    index range; that only reads a page's worth of rows, so it is allowed.
+    """
+    return (re.search(r'ORDER BY p\.id (ASC|DESC)\s+LIMIT', sql) is not None
+            and not sorts_products(plan))
+
+
+def listing_urls(base, filter_values):
+    """Every filter combination x sort field x sort order for a listing route"""
+    names = list(filter_values)
+    for size in range(len(names) + 1):
+        for combo in itertools.combinations(names, size):
+            filters = "&".join(f"{name}={filter_values[name]}" for name in combo)
+            for sort_by in products_api.VALID_SORT_FIELDS:
+                for sort_order in ('asc', 'desc'):
+                    yield f"{base}?{filters}&sort_by={sort_by}&sort_order={sort_order}&limit=20"
+
+
+class ApiTestCase(unittest.TestCase):
+    """
+    Runs the API against a scratch catalog of product_count products.
+
+    Subclasses tune the set-up with class attributes: pool_options for the
+    ConnectionPool, use_columnar_index (False keeps listings on the SQL
+    path), cache_responses and log_level. build_database can be overridden
+    to fill the catalog differently.
+    """
+
+    product_count = 500
+    pool_options = {}
+    use_columnar_index = True
+    cache_responses = False
+    log_level = logging.INFO
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(cls.log_level)
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.db_path = os.path.join(cls.temp_dir, 'ecommerce.db')
+        cls.build_database(cls.db_path)
+
+        cls.original_globals = {name: getattr(products_api, name) for name in API_GLOBALS}
+        products_api.access_log = None
+        products_api.slow_query_log = SlowQueryLog(path=None)
+        products_api.pool = ConnectionPool(cls.db_path, slow_query_log=products_api.slow_query_log,
+                                           **cls.pool_options)
+        products_api.export_pool = ConnectionPool(cls.db_path, max_size=products_api.EXPORT_POOL_SIZE,
+                                                  timeout=products_api.export_pool.timeout,
+                                                  slow_query_log=products_api.slow_query_log,
+                                                  **cls.pool_options)
+        products_api.columnar_index = (ColumnarIndex() if cls.use_columnar_index and columnar_index_enabled()
+                                       else None)
+        products_api.suggest_index = SuggestIndex()
+        products_api.count_cache = CountCache()
+        products_api.catalog_stats = CatalogStatistics()
+        products_api.response_cache = ResponseCache() if cls.cache_responses else ResponseCache(max_entry_bytes=0)
+        cls.client = products_api.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        products_api.stop_access_log()
+        products_api.pool.close()
+        products_api.export_pool.close()
+        for name, value in cls.original_globals.items():
+            setattr(products_api, name, value)
+        shutil.rmtree(cls.temp_dir)
+        logging.disable(logging.NOTSET)
+
+    @classmethod
+    def build_database(cls, db_path):
+        build_test_database(db_path, product_count=cls.product_count)
+
+
+class QueryPlanTestCase(ApiTestCase):
+    """
+    ApiTestCase that records every SQL statement the API issues, in
+    statements (emptied before each test), for assert_no_full_scans.
+    """
+
+    # The plans under test are those of the SQL path
+    product_count = 5000
+    use_columnar_index = False
+    cache_responses = True
+
+    @classmethod
+    def setUpClass(cls):
+        cls.statements = []
+        cls.pool_options = {
+            'on_connect': lambda conn: conn.set_trace_callback(cls.statements.append),
+            'cached_statements': query_builder.STATEMENT_CACHE_SIZE
+        }
+        super().setUpClass()
+
+    def setUp(self):
+        del self.statements[:]
+        products_api.count_cache.clear()
+        products_api.response_cache.clear()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.get_json()
+
+    def assert_no_full_scans(self):
+        """EXPLAIN every captured statement and collect products table scans"""
+        conn = sqlite3.connect(self.db_path)
+        failures = {}
+        try:
+            for sql in set(self.statements):
+                if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    continue
+                plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+                scans = [row[3] for row in plan if FULL_SCAN.match(row[3])]
+                if scans and not is_bounded_rowid_walk(sql, plan):
+                    failures[" ".join(sql.split())] = [row[3] for row in plan]
+        finally:
+            conn.close()
+        self.assertFalse(failures, "Full table scans:\n" + "\n".join(
+            f"{sql}\n    {plan}" for sql, plan in failures.items()))
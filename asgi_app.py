@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Products API - ASGI Serving Mode
+Serves the Flask routes of products_api from an asyncio server. The event
+loop owns the client sockets, so thousands of idle keep-alive connections
+from the frontend cost no threads; only requests that are actually running
+occupy one of a small, bounded set of worker threads, which call the WSGI
+app and do the SQLite work. Responses are sent back from the event loop,
+and streamed bodies (the product export) are pulled one chunk at a time.
+
+Run with uvicorn (pip install uvicorn):
+    python asgi_app.py --port 5000 --threads 8
+    uvicorn asgi_app:application --port 5000
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import products_api
+
+logger = logging.getLogger(__name__)
+
+# Non-streamed responses are collected in the worker up to this size, so a
+# typical JSON response takes a single hop to the thread pool
+FIRST_HOP_BYTES = 64 * 1024
+
+_END = object()
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and request body into a WSGI environ"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for raw_name, raw_value in scope['headers']:
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = 'HTTP_' + name
+        if key in environ:
+            # HTTP/2 clients send one Cookie field per cookie; those join with "; "
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            environ[key] = f"{environ[key]}{separator}{value}"
+        else:
+            environ[key] = value
+    return environ
+
+
+class AsyncWSGIAdapter:
+    """
+    ASGI application that runs a WSGI app on a bounded thread pool.
+
+    max_threads defaults to the size of the API's connection pool, so a
+    worker thread never waits for a database connection. Requests beyond
+    max_pending (running plus queued) get an immediate 503 instead of piling
+    up behind the pool.
+    """
+
+    def __init__(self, wsgi_app, max_threads=None, max_pending=1024):
+        self.wsgi_app = wsgi_app
+        self.max_threads = max_threads or products_api.pool.max_size
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=self.max_threads,
+                                           thread_name_prefix='api-worker')
+        self.pending = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await loop.run_in_executor(self.executor, products_api.init_database)
+                    products_api.start_access_log()
+                except Exception as e:
+                    logger.error(f"Startup failed: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                products_api.stop_access_log()
+                products_api.pool.close()
+                products_api.export_pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b"".join(chunks)
+
+    def _start(self, environ):
+        """Run the WSGI app in a worker and collect the start of its body"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            # One ASGI entry per header line, so repeated Set-Cookie headers stay separate
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        iterable = self.wsgi_app(environ, start_response)
+        iterator = iter(iterable)
+        chunks = []
+        size = 0
+        finished = False
+        while size < FIRST_HOP_BYTES:
+            chunk = next(iterator, _END)
+            if chunk is _END:
+                finished = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        if finished:
+            self._close(iterable)
+        return response['status'], response['headers'], b"".join(chunks), iterable, iterator, finished
+
+    @staticmethod
+    def _close(iterable):
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+    async def _http(self, scope, receive, send):
+        if self.pending >= self.max_pending:
+            await send({'type': 'http.response.start', 'status': 503,
+                        'headers': [(b'content-type', b'text/plain'), (b'retry-after', b'1')]})
+            await send({'type': 'http.response.body', 'body': b'Server busy'})
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            status, headers, first, iterable, iterator, finished = await loop.run_in_executor(
+                self.executor, self._start, build_environ(scope, body)
+            )
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            if finished:
+                await send({'type': 'http.response.body', 'body': first})
+                return
+
+            # Streamed body: pull the rest chunk by chunk, stopping early if
+            # the client goes away
+            disconnected = asyncio.ensure_future(receive())
+            try:
+                await send({'type': 'http.response.body', 'body': first, 'more_body': True})
+                while not disconnected.done():
+                    chunk = await loop.run_in_executor(self.executor, next, iterator, _END)
+                    if chunk is _END:
+                        break
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                disconnected.cancel()
+                await loop.run_in_executor(self.executor, self._close, iterable)
+        except Exception as e:
+            logger.error(f"Error serving {scope['path']}: {e}")
+            raise
+        finally:
+            self.pending -= 1
+
+
+application = AsyncWSGIAdapter(products_api.app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the products API over ASGI")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=None,
+                        help="worker threads for the WSGI app (default: connection pool size)")
+    parser.add_argument('--keep-alive', type=int, default=75,
+                        help="seconds an idle keep-alive connection is held open")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("uvicorn is not installed; run: pip install uvicorn")
+        sys.exit(1)
+
+    global application
+    if args.threads:
+        application = AsyncWSGIAdapter(products_api.app, max_threads=args.threads)
+
+    print(f"Serving the products API over ASGI on http://{args.host}:{args.port} "
+          f"({application.max_threads} worker threads)")
+    uvicorn.run(application, host=args.host, port=args.port, log_level='warning',
+                timeout_keep_alive=args.keep_alive, lifespan='on')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+ASGI vs WSGI Benchmark
+Starts the products API once on the threaded Werkzeug server (the current
+`app.run` path) and once on uvicorn through asgi_app, then drives both with
+the same keep-alive load from a single asyncio client: many concurrent
+connections each issuing a mix of listing, detail and stats requests, while
+a second set of idle keep-alive connections is held open. Reports throughput
+and latency percentiles per mode.
+
+Usage:
+    python benchmark_asgi.py --database ecommerce.db --connections 200 --requests 50
+"""
+
+import argparse
+import asyncio
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+MODES = ['wsgi', 'asgi']
+
+
+def serve(mode, database, port, threads):
+    """Run the API in this process (used by the benchmark's server subprocesses)"""
+    import logging
+    logging.disable(logging.INFO)
+
+    import products_api
+    from db_pool import ConnectionPool
+
+    products_api.DATABASE = database
+    products_api.pool = ConnectionPool(database, max_size=threads,
+                                       cached_statements=products_api.pool.cached_statements,
+                                       cursor_factory=products_api.pool.cursor_factory,
+                                       slow_query_log=products_api.pool.slow_query_log)
+
+    if mode == 'wsgi':
+        products_api.init_database()
+        products_api.app.run(host='127.0.0.1', port=port, threaded=True)
+    else:
+        import uvicorn
+        import asgi_app
+        application = asgi_app.AsyncWSGIAdapter(products_api.app, max_threads=threads)
+        uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning',
+                    lifespan='on', timeout_keep_alive=120)
+
+
+def build_paths(count, seed):
+    """A reproducible mix of the frontend's read requests"""
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.4:
+            paths.append(f"/api/products?page={rng.randint(1, 200)}&limit=20")
+        elif roll < 0.7:
+            paths.append(f"/api/products/{rng.randint(1, 20000)}")
+        elif roll < 0.85:
+            paths.append(f"/api/departments/{rng.randint(1, 2)}/products"
+                         f"?page={rng.randint(1, 50)}&sort_by=retail_price")
+        else:
+            paths.append(rng.choice(['/api/products/stats', '/api/departments']))
+    return paths
+
+
+async def fetch(reader, writer, path):
+    """Send one GET and read the full response; returns (status, keep_alive)"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode('latin-1').split("\r\n")
+    status_line = lines[0]
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return int(status_line.split()[1]), False
+
+    keep_alive = (status_line.startswith('HTTP/1.1')
+                  and headers.get('connection', '').lower() != 'close')
+    return int(status_line.split()[1]), keep_alive
+
+
+async def run_connection(port, paths, latencies, errors):
+    """Issue paths one after another, reusing the connection while allowed"""
+    reader = writer = None
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive = await fetch(reader, writer, path)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors.append(path)
+            if writer is not None:
+                writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(path)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(port, connections, requests_per_connection, idle_connections, seed):
+    idle = []
+    for _ in range(idle_connections):
+        try:
+            idle.append(await asyncio.open_connection('127.0.0.1', port))
+        except OSError:
+            break
+
+    latencies = []
+    errors = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_connection(port, build_paths(requests_per_connection, seed + index), latencies, errors)
+        for index in range(connections)
+    ))
+    elapsed = time.perf_counter() - started
+
+    for _, writer in idle:
+        writer.close()
+    return latencies, errors, elapsed, len(idle)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def wait_until_ready(port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def benchmark_mode(mode, args, port):
+    server = subprocess.Popen([
+        sys.executable, __file__, '--serve', mode, '--port', str(port),
+        '--database', args.database, '--threads', str(args.threads)
+    ])
+    try:
+        if not wait_until_ready(port):
+            print(f"{mode}: server did not start")
+            return None
+        # Warm the connection pool and the server before measuring
+        asyncio.run(run_load(port, args.threads, 5, 0, args.seed - 1))
+        latencies, errors, elapsed, idle = asyncio.run(run_load(
+            port, args.connections, args.requests, args.idle_connections, args.seed
+        ))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'idle': idle,
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'max': latencies[-1] * 1000 if latencies else float('nan')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the WSGI and ASGI serving modes")
+    parser.add_argument('--database', default='ecommerce.db')
+    parser.add_argument('--connections', type=int, default=200,
+                        help="concurrent keep-alive connections sending requests")
+    parser.add_argument('--requests', type=int, default=50, help="requests per connection")
+    parser.add_argument('--idle-connections', type=int, default=500,
+                        help="extra keep-alive connections held open without requests")
+    parser.add_argument('--threads', type=int, default=8,
+                        help="database connections / ASGI worker threads")
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--modes', default=",".join(MODES))
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.database, args.port, args.threads)
+        return
+
+    results = []
+    for offset, mode in enumerate(args.modes.split(",")):
+        result = benchmark_mode(mode, args, args.port + offset)
+        if result:
+            results.append(result)
+
+    print()
+    print(f"{args.connections} connections x {args.requests} requests, "
+          f"{args.idle_connections} idle connections, {args.threads} threads")
+    print(f"{'mode':<6} {'requests':>9} {'errors':>7} {'idle':>6} {'req/s':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['requests']:>9} {r['errors']:>7} {r['idle']:>6} {r['throughput']:>9.0f} "
+              f"{r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} {r['max']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Database Tuning Benchmark
+Measures read throughput and latency of the API's hot queries under each
+db_tuning profile, once on a quiet database and once while a writer keeps
+rewriting batches of products the way a catalog reload does. Readers and
+the writer are separate processes, like the pre-forked API workers and a
+loader script. Each run works on a fresh copy of the database, so the
+original is never written to.
+
+With the rollback journal ('default') every commit needs the database to
+itself, so readers stall behind the writer; in WAL mode they keep reading
+the last committed snapshot.
+
+Usage:
+    python benchmark_pragmas.py [database] [--readers 4] [--duration 5] [--write-batch 500]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import db_tuning
+import query_builder
+
+CATEGORIES_SQL = "SELECT DISTINCT category FROM products"
+DETAIL_SQL = ("SELECT p.*, d.name AS department_name FROM products p "
+              "LEFT JOIN departments d ON p.department_id = d.id WHERE p.id = ?")
+WRITE_SQL = "UPDATE products SET retail_price = retail_price WHERE id IN ({})"
+
+
+def copy_database(source, target, profile):
+    """Consistent copy of source (WAL included) with the profile's journal mode"""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+        if profile == 'default':
+            dst.execute("PRAGMA journal_mode = DELETE")
+        db_tuning.apply_profile(dst, profile)
+    finally:
+        dst.close()
+        src.close()
+
+
+def read_queries(conn, rng, categories, max_id):
+    """One request's worth of reads: a category listing page or a detail lookup"""
+    if rng.random() < 0.6:
+        shape, params = query_builder.bind_filters({'category': rng.choice(categories)})
+        selected, _ = query_builder.select_columns(None, 'retail_price')
+        sql = query_builder.listing_sql('products', shape, selected, 'retail_price', 'asc')
+        page = rng.randint(0, 20) * 20
+        conn.execute(sql, query_builder.listing_params(params, [21, page], True)).fetchall()
+    else:
+        conn.execute(DETAIL_SQL, (rng.randint(1, max_id),)).fetchall()
+
+
+def reader(database, profile, start, deadline, seed, results):
+    conn = db_tuning.connect(database, profile)
+    rng = random.Random(seed)
+    categories = [row[0] for row in conn.execute(CATEGORIES_SQL)]
+    max_id = conn.execute("SELECT MAX(id) FROM products").fetchone()[0]
+
+    latencies = []
+    errors = 0
+    start.wait()
+    while time.monotonic() < deadline.value:
+        started = time.perf_counter()
+        try:
+            read_queries(conn, rng, categories, max_id)
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    results.put(('reader', latencies, errors))
+
+
+def writer(database, profile, start, deadline, batch_size, results):
+    conn = db_tuning.connect(database, profile)
+    rng = random.Random(0)
+    max_id = conn.execute("SELECT MAX(id) FROM products").fetchone()[0]
+    sql = WRITE_SQL.format(",".join("?" * batch_size))
+
+    commits = 0
+    errors = 0
+    start.wait()
+    while time.monotonic() < deadline.value:
+        try:
+            with conn:
+                conn.execute(sql, [rng.randint(1, max_id) for _ in range(batch_size)])
+            commits += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    results.put(('writer', commits, errors))
+
+
+def run(database, profile, readers, duration, write_batch):
+    """One timed run; returns reads/s, p50 and p99 ms, read errors and commits/s"""
+    context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+    start = context.Event()
+    deadline = context.Value('d', 0.0)
+    results = context.Queue()
+
+    processes = [context.Process(target=reader, args=(database, profile, start, deadline, seed, results))
+                 for seed in range(readers)]
+    if write_batch:
+        processes.append(context.Process(target=writer,
+                                          args=(database, profile, start, deadline, write_batch, results)))
+    for process in processes:
+        process.start()
+
+    # Let every process open its connection before the clock starts
+    time.sleep(0.5)
+    deadline.value = time.monotonic() + duration
+    start.set()
+
+    latencies = []
+    read_errors = 0
+    commits = 0
+    for _ in processes:
+        kind, value, errors = results.get()
+        if kind == 'reader':
+            latencies += value
+            read_errors += errors
+        else:
+            commits = value
+    for process in processes:
+        process.join()
+
+    latencies.sort()
+    def percentile(fraction):
+        return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000 if latencies else 0.0
+    return len(latencies) / duration, percentile(0.5), percentile(0.99), read_errors, commits / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare read throughput under the db_tuning profiles")
+    parser.add_argument('database', nargs='?', default='ecommerce.db')
+    parser.add_argument('--profiles', nargs='+', default=['default', 'serving'],
+                        choices=list(db_tuning.PROFILES))
+    parser.add_argument('--readers', type=int, default=4, help="reader processes")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per run")
+    parser.add_argument('--write-batch', type=int, default=500,
+                        help="products rewritten per writer transaction")
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.duration:.0f}s per run, "
+          f"writer batches of {args.write_batch} products")
+    print(f"  {'profile':<10} {'writer':<7} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'commits/s':>10}")
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for profile in args.profiles:
+            for write_batch in (0, args.write_batch):
+                copy = os.path.join(temp_dir, f"{profile}.db")
+                copy_database(args.database, copy, profile)
+                reads, p50, p99, errors, commits = run(copy, profile, args.readers,
+                                                       args.duration, write_batch)
+                print(f"  {profile:<10} {'yes' if write_batch else 'no':<7} {reads:9.0f} "
+                      f"{p50:8.2f} {p99:8.2f} {errors:7d} {commits:10.1f}")
+                for suffix in ('', '-wal', '-shm', '-journal'):
+                    if os.path.exists(copy + suffix):
+                        os.remove(copy + suffix)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
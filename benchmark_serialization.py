@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Serialization Microbenchmark
+Times the pieces of a listing response on a real 100-row page: turning the
+rows into dicts (sqlite3.Row + keys() per row versus tuples zipped with a
+column list read once) and encoding the payload (Flask's stdlib provider
+versus orjson), then the whole /api/products route through the test client
+with each JSON backend. The response cache is disabled so every request
+runs the query.
+
+Usage:
+    python benchmark_serialization.py [database] [--limit 100] [--repeat 2000]
+"""
+
+import argparse
+import logging
+import sqlite3
+import time
+import timeit
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+
+PAGE_QUERY = """
+    SELECT p.id, p.cost, p.category, p.name, p.brand, p.retail_price,
+           p.department, p.sku, p.distribution_center_id, p.created_at,
+           d.name as department_name, d.description as department_description
+    FROM products p
+    LEFT JOIN departments d ON p.department_id = d.id
+    ORDER BY p.id
+    LIMIT ?
+"""
+
+
+def dict_from_row_keys(row):
+    """The previous per-row conversion, kept for comparison"""
+    return {key: row[key] for key in row.keys()}
+
+
+def best_of(function, repeat, rounds=5):
+    """Best mean time per call in microseconds"""
+    return min(timeit.repeat(function, number=repeat, repeat=rounds)) / repeat * 1e6
+
+
+def report(label, micros, baseline=None):
+    speedup = f"{baseline / micros:5.2f}x" if baseline else ""
+    print(f"  {label:<44} {micros:10.1f} us {speedup:>8}")
+
+
+def benchmark_materialization(database, limit, repeat):
+    print(f"Row materialization ({limit} rows, fetch included)")
+    conn = sqlite3.connect(database)
+
+    def keys_per_row():
+        conn.row_factory = sqlite3.Row
+        return [dict_from_row_keys(row) for row in conn.execute(PAGE_QUERY, (limit,)).fetchall()]
+
+    def zip_tuples():
+        conn.row_factory = None
+        cursor = conn.execute(PAGE_QUERY, (limit,))
+        return serialization.rows_to_dicts(serialization.column_names(cursor), cursor.fetchall())
+
+    assert keys_per_row() == zip_tuples()
+    baseline = best_of(keys_per_row, repeat)
+    report("sqlite3.Row + keys() per row", baseline)
+    report("tuples zipped with cursor.description", best_of(zip_tuples, repeat), baseline)
+
+    conn.row_factory = None
+    cursor = conn.execute(PAGE_QUERY, (limit,))
+    rows = serialization.rows_to_dicts(serialization.column_names(cursor), cursor.fetchall())
+    conn.close()
+    return rows
+
+
+def benchmark_encoding(rows, repeat):
+    print(f"JSON encoding ({len(rows)} rows)")
+    payload = {'products': rows, 'pagination': {'page': 1, 'limit': len(rows), 'has_next': True}}
+
+    app = Flask(__name__)
+    results = {}
+    for backend in serialization.JSON_BACKENDS:
+        if backend == 'orjson' and serialization.orjson is None:
+            print("  orjson is not installed; skipped")
+            continue
+        serialization.install_json_provider(app, backend)
+        with app.app_context():
+            results[backend] = best_of(lambda: app.json.response(payload), repeat)
+
+    baseline = results['stdlib']
+    report("Flask jsonify, stdlib json", baseline)
+    if 'orjson' in results:
+        report("Flask jsonify, orjson provider", results['orjson'], baseline)
+        assert (serialization.OrjsonProvider(app).dumps(payload)
+                == DefaultJSONProvider(app).dumps(payload, separators=(',', ':')))
+
+
+def benchmark_route(database, limit, repeat):
+    print(f"GET /api/products?limit={limit} through the test client")
+    logging.disable(logging.INFO)
+    import products_api
+    from db_pool import ConnectionPool
+    from response_cache import ResponseCache
+
+    products_api.pool = ConnectionPool(database)
+    products_api.response_cache = ResponseCache(max_entry_bytes=0)
+    client = products_api.app.test_client()
+    url = f"/api/products?limit={limit}&count=none"
+
+    results = {}
+    for backend in serialization.JSON_BACKENDS:
+        if backend == 'orjson' and serialization.orjson is None:
+            continue
+        serialization.install_json_provider(products_api.app, backend)
+        client.get(url)
+        results[backend] = best_of(lambda: client.get(url), max(repeat // 10, 10))
+
+    baseline = results['stdlib']
+    report("stdlib json", baseline)
+    if 'orjson' in results:
+        report("orjson", results['orjson'], baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for response serialization")
+    parser.add_argument('database', nargs='?', default='ecommerce.db')
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = benchmark_materialization(args.database, args.limit, args.repeat)
+    benchmark_encoding(rows, args.repeat)
+    benchmark_route(args.database, args.limit, args.repeat)
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Catalog Version Tracking
+Reads the catalog revision counter maintained by triggers (see
+migrations.migration_004_catalog_revision). PRAGMA data_version tells a
+connection whether anyone else has committed since it last looked, so a warm
+pooled connection only re-reads the revision row after an actual write.
+
+SQLite triggers run once per row, so a statement changing many products
+bumps the counter many times. The bumps rewrite one row of a one-page
+table inside the writer's transaction, and readers only ever see the
+committed value, so a bulk write still looks like a single change to the
+caches and in-memory indexes keyed on the revision.
+"""
+
+from datetime import datetime, timezone
+
+
+def get_catalog_revision(conn):
+    """
+    Return (revision, last_modified) for the catalog.
+
+    last_modified is a timezone-aware UTC datetime with one second
+    resolution, suitable for the Last-Modified header.
+    """
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+    cache = getattr(conn, 'cache', None)
+    if cache is not None:
+        cached = cache.get('catalog_revision')
+        if cached is not None and cached[0] == data_version:
+            return cached[1], cached[2]
+
+    revision, updated_at = conn.execute(
+        "SELECT revision, updated_at FROM catalog_revision WHERE id = 1"
+    ).fetchone()
+    last_modified = datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+    if cache is not None:
+        cache['catalog_revision'] = (data_version, revision, last_modified)
+    return revision, last_modified
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Columnar Product Index
+An optional in-memory copy of the products listing held as NumPy arrays, so
+the common /api/products listings skip SQL entirely. Category, brand and
+department are dictionary-encoded to small integer codes, prices are float
+arrays, and every sort field has a precomputed permutation of the rows in
+(field, id) order. A listing is then a boolean mask over the columns, taken
+in the order of the sort permutation and sliced for the page. The same
+masks give the /api/products/facets counts with one bincount per facet.
+
+Only offset-paginated listings filtered by category, department, brand and
+price are served here; text search, relevance sorting and keyset cursors go
+to SQLite as before. The index is rebuilt in the background whenever the
+catalog revision changes (see snapshot_index.py), with SQLite answering
+until the new snapshot is ready, and disabled when NumPy is not installed
+or PRODUCTS_API_COLUMNAR_INDEX is set to 0.
+"""
+
+import os
+import time
+import logging
+
+import query_builder
+from facets import FACETS
+from serialization import column_names
+from snapshot_index import SnapshotIndex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Columns stored as small integer codes, with the distinct values in sort order
+DICTIONARY_COLUMNS = ('category', 'brand', 'department')
+
+# Columns stored as float arrays, NULL as NaN (which fails every comparison,
+# like NULL does in SQL)
+PRICE_COLUMNS = ('retail_price', 'cost')
+
+# Filters the index can answer; anything else goes to SQLite
+SUPPORTED_FILTERS = DICTIONARY_COLUMNS + ('min_price', 'max_price')
+
+
+def columnar_index_enabled():
+    """True when NumPy is installed and the index is not switched off"""
+    setting = os.environ.get('PRODUCTS_API_COLUMNAR_INDEX', '1').lower()
+    return np is not None and setting not in ('0', 'false', 'off', 'no')
+
+
+def _sort_key(value):
+    # NULL sorts first, like SQLite; text compares by code point, which is
+    # the byte order of SQLite's BINARY collation on UTF-8
+    return (value is not None, value)
+
+
+def _rank(column):
+    """
+    Number the distinct values of column in sort order. Returns the value to
+    code mapping and the code of every row.
+    """
+    distinct = sorted(set(column), key=_sort_key)
+    lookup = {value: code for code, value in enumerate(distinct)}
+    return lookup, np.array([lookup[value] for value in column], dtype=np.int32)
+
+
+def _combine(conditions, exclude=None):
+    """AND of the filter masks except the exclude facet's; None if there are none"""
+    masks = [condition for name, condition in conditions.items() if name != exclude]
+    if not masks:
+        return None
+    return np.logical_and.reduce(masks) if len(masks) > 1 else masks[0]
+
+
+class _Snapshot:
+    """Immutable arrays for one catalog revision"""
+
+    def __init__(self, columns, rows):
+        self.columns = {name: position for position, name in enumerate(columns)}
+        self.rows = rows
+        self.size = len(rows)
+
+        values = {name: [row[position] for row in rows] for name, position in self.columns.items()}
+        ids = np.array(values['id'], dtype=np.int64)
+
+        self.codes = {}
+        self.dictionaries = {}
+        for name in DICTIONARY_COLUMNS:
+            self.dictionaries[name], self.codes[name] = _rank(values[name])
+
+        self.prices = {
+            name: np.array([np.nan if value is None else value for value in values[name]],
+                           dtype=np.float64)
+            for name in PRICE_COLUMNS
+        }
+
+        # Facet values by code; the price facet counts PRICE_BUCKETS numbers,
+        # with NaN in the last bucket like the SQL CASE puts NULL there
+        self.facet_values = {name: list(self.dictionaries[name]) for name in DICTIONARY_COLUMNS}
+        self.facet_values['price'] = list(range(len(query_builder.PRICE_BUCKETS)))
+        self.codes['price'] = np.searchsorted(
+            np.array(query_builder.PRICE_BUCKETS[1:], dtype=np.float64),
+            self.prices['retail_price'], side='right'
+        )
+
+        # Row positions in (field, id) order; descending is the reverse.
+        # Ranks sort like the values themselves, NULLs and all.
+        self.orders = {'id': np.argsort(ids, kind='stable')}
+        for name in query_builder.VALID_SORT_FIELDS:
+            if name == 'id':
+                continue
+            ranks = self.codes[name] if name in DICTIONARY_COLUMNS else _rank(values[name])[1]
+            self.orders[name] = np.lexsort((ids, ranks))
+
+    def conditions(self, filters):
+        """Boolean mask of each active filter, keyed by facet"""
+        conditions = {}
+        for name in DICTIONARY_COLUMNS:
+            value = filters.get(name)
+            if value is None or value == '':
+                continue
+            code = self.dictionaries[name].get(value)
+            conditions[name] = ((self.codes[name] == code) if code is not None
+                                else np.zeros(self.size, dtype=bool))
+
+        prices = self.prices['retail_price']
+        for name, compare in (('min_price', np.greater_equal), ('max_price', np.less_equal)):
+            value = filters.get(name)
+            if value is None:
+                continue
+            condition = compare(prices, value)
+            conditions['price'] = condition if 'price' not in conditions else conditions['price'] & condition
+        return conditions
+
+    def mask(self, filters):
+        """Boolean mask of the rows matching filters, or None for no filters"""
+        return _combine(self.conditions(filters))
+
+
+class ColumnarIndex(SnapshotIndex):
+    """
+    In-memory listing engine over a snapshot of the products listing.
+
+    Snapshots are replaced whole on reload, so a query running in another
+    thread keeps reading the arrays it started with.
+    """
+
+    def supports(self, filters, sort_by='id', keyset=None):
+        """True if the listing can be answered without SQL"""
+        if keyset is not None or sort_by not in query_builder.VALID_SORT_FIELDS:
+            return False
+        return all(name in SUPPORTED_FILTERS for name, value in filters.items()
+                   if value is not None and value != '')
+
+    def _load(self, conn):
+        """Read every listing row with the same joins and columns as the SQL path"""
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(query_builder.export_sql(()))
+        columns = column_names(cursor)
+        rows = cursor.fetchall()
+        cursor.close()
+
+        self._snapshot = _Snapshot(columns, rows)
+        self.loads += 1
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"Loaded columnar index for {len(rows)} products in {self.load_seconds:.2f}s")
+
+    def query(self, filters, sort_by, sort_order, offset, limit, selected):
+        """
+        One listing page. Returns (total_count, rows), rows being dicts of
+        the selected columns, like the SQL path produces.
+        """
+        snapshot = self._snapshot
+        order = snapshot.orders[sort_by]
+        if sort_order == 'desc':
+            order = order[::-1]
+
+        mask = snapshot.mask(filters)
+        if mask is None:
+            total_count = snapshot.size
+            page = order[offset:offset + limit]
+        else:
+            # Positions in sort order of the matching rows; only the page's
+            # slice of them is mapped back to rows
+            hits = np.flatnonzero(mask[order])
+            total_count = len(hits)
+            page = order[hits[offset:offset + limit]]
+
+        positions = [(name, snapshot.columns[name]) for name in selected]
+        rows = [{name: row[position] for name, position in positions}
+                for row in map(snapshot.rows.__getitem__, page.tolist())]
+        return total_count, rows
+
+    def facet_counts(self, filters):
+        """
+        Counts per value of each facet, each under every filter but its own.
+        Returns (total_count, counts) in the form of facets.count_groups.
+        """
+        snapshot = self._snapshot
+        conditions = snapshot.conditions(filters)
+        mask = _combine(conditions)
+        total_count = snapshot.size if mask is None else int(np.count_nonzero(mask))
+
+        counts = {}
+        for name in FACETS:
+            codes = snapshot.codes[name]
+            mask = _combine(conditions, exclude=name)
+            tallies = np.bincount(codes if mask is None else codes[mask],
+                                  minlength=len(snapshot.facet_values[name]))
+            values = snapshot.facet_values[name]
+            counts[name] = {values[code]: int(tallies[code]) for code in np.flatnonzero(tallies)}
+        return total_count, counts
+
+    def stats(self):
+        """Size and load time of the current snapshot, for monitoring"""
+        snapshot = self._snapshot
+        return {
+            'products': snapshot.size if snapshot is not None else 0,
+            'revision': self._revision,
+            'loads': self.loads,
+            'load_seconds': round(self.load_seconds, 3),
+            'rebuilding': self.rebuilding,
+            'rebuild_errors': self.rebuild_errors
+        }
@@ -9,10 +9,12 @@ import csv
 import os
 import sys
 
+import db_tuning
+
 def create_database_connection(db_name="ecommerce.db"):
-    """Create a database connection to SQLite database"""
+    """Create a database connection to SQLite database, tuned for bulk loading"""
     try:
-        conn = sqlite3.connect(db_name)
+        conn = db_tuning.connect(db_name, 'bulk_load')
         print(f"Successfully connected to {db_name}")
         return conn
     except sqlite3.Error as e:
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+SQLite Connection Pool
+Keeps a bounded set of warm SQLite connections for the products API so that
+requests don't pay for opening the database file, parsing the schema and
+starting with a cold page cache every time.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+from db_tuning import DEFAULT_PROFILE, apply_profile
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PoolConnection(sqlite3.Connection):
+    """
+    sqlite3 connection class used by the pool.
+
+    Carries a small per-connection cache that lives as long as the warm
+    connection does (e.g. the last seen catalog revision), and hands out
+    cursors of the pool's cursor_factory, conn.execute() included. The
+    pool's slow_query_log is left here for those cursors to report to.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = {}
+        self.cursor_factory = sqlite3.Cursor
+        self.slow_query_log = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+class PooledConnection:
+    """A pooled sqlite3 connection together with its bookkeeping timestamps"""
+
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+    def age(self, now):
+        return now - self.created_at
+
+    def idle_for(self, now):
+        return now - self.last_used
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of reusable SQLite connections.
+
+    Connections are shared between worker threads (one thread at a time per
+    connection), handed out LIFO so the warmest connection is reused first,
+    health-checked after sitting idle and recycled once they reach max_age.
+    A fork is detected through the process id and drops every inherited
+    connection, so pre-forked workers each build their own pool. Every new
+    connection gets the db_tuning profile named by profile.
+    """
+
+    def __init__(self, database, max_size=8, max_age=300.0,
+                 health_check_interval=30.0, timeout=5.0,
+                 row_factory=sqlite3.Row, on_connect=None, cached_statements=128,
+                 profile=DEFAULT_PROFILE, cursor_factory=sqlite3.Cursor,
+                 slow_query_log=None):
+        self.database = database
+        self.max_size = max_size
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.row_factory = row_factory
+        self.on_connect = on_connect
+        self.cached_statements = cached_statements
+        self.profile = profile
+        self.cursor_factory = cursor_factory
+        self.slow_query_log = slow_query_log
+
+        self._idle = deque()
+        self._open = 0
+        self._pid = os.getpid()
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._counters = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'timeouts': 0
+        }
+
+    def _connect(self):
+        """Open a new connection configured for the API"""
+        conn = sqlite3.connect(self.database, check_same_thread=False, factory=PoolConnection,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = self.row_factory
+        conn.cursor_factory = self.cursor_factory
+        conn.slow_query_log = self.slow_query_log
+        apply_profile(conn, self.profile)
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return PooledConnection(conn)
+
+    def _discard(self, pooled):
+        """Close a connection and free its slot (caller holds the lock)"""
+        self._open -= 1
+        try:
+            pooled.conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+
+    def _check_fork(self):
+        """Forget connections inherited from a parent process (caller holds the lock)"""
+        pid = os.getpid()
+        if pid != self._pid:
+            # The parent still owns these handles; never close them here
+            self._idle.clear()
+            self._open = 0
+            self._pid = pid
+
+    def _is_healthy(self, pooled, now):
+        """Validate a connection that has been idle for a while"""
+        if pooled.idle_for(now) < self.health_check_interval:
+            return True
+        try:
+            pooled.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            self._counters['failed_health_checks'] += 1
+            return False
+
+    def acquire(self):
+        """Check out a connection, opening a new one if the pool has room"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+
+                now = time.monotonic()
+                while self._idle:
+                    pooled = self._idle.pop()
+                    if pooled.age(now) >= self.max_age:
+                        self._counters['recycled'] += 1
+                        self._discard(pooled)
+                    elif not self._is_healthy(pooled, now):
+                        self._discard(pooled)
+                    else:
+                        self._counters['reused'] += 1
+                        return pooled
+
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"Timed out waiting for a database connection (max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+        # Open outside the lock so slow opens don't stall other threads
+        try:
+            pooled = self._connect()
+        except sqlite3.Error:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters['created'] += 1
+        return pooled
+
+    def release(self, pooled):
+        """Return a connection to the pool, or close it if it should not be reused"""
+        conn = pooled.conn
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            reusable = True
+        except sqlite3.Error as e:
+            logger.warning(f"Discarding pooled connection after rollback failure: {e}")
+            reusable = False
+
+        with self._cond:
+            if os.getpid() != self._pid:
+                # Checked out before a fork; the new process never counted it
+                return
+            now = time.monotonic()
+            if not reusable or self._closed or pooled.age(now) >= self.max_age:
+                if reusable and not self._closed:
+                    self._counters['recycled'] += 1
+                self._discard(pooled)
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        pooled = self.acquire()
+        try:
+            yield pooled.conn
+        finally:
+            self.release(pooled)
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._cond:
+            self._check_fork()
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+    def stats(self):
+        """Snapshot of pool usage for health checks and monitoring"""
+        with self._cond:
+            return {
+                'database': str(self.database),
+                'max_size': self.max_size,
+                'profile': self.profile,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                **self._counters
+            }
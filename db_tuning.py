@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+SQLite Tuning Profiles
+Named sets of PRAGMAs applied to every connection the API and the loader
+scripts open, so they all agree on how the database file is used. Both
+profiles put the database in WAL mode: readers keep reading the last
+committed snapshot while a loader writes, instead of waiting behind the
+rollback journal's exclusive lock, and synchronous=NORMAL is durable across
+application crashes in WAL mode while skipping an fsync per commit.
+
+'serving' is for the API's pooled read connections: memory-mapped reads,
+a moderate page cache per connection (there are pool_size of them per
+worker) and a short busy timeout. 'bulk_load' is for the scripts that
+rewrite the catalog: a large page cache and a long busy timeout. 'default'
+leaves SQLite's own settings alone, for comparison. The API's profile can
+be chosen with PRODUCTS_API_DB_PROFILE.
+"""
+
+import os
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs per profile, applied in this order. cache_size is negative KiB,
+# mmap_size bytes, busy_timeout milliseconds.
+PROFILES = {
+    'serving': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    },
+    'bulk_load': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -128 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000
+    },
+    'default': {}
+}
+
+DEFAULT_PROFILE = 'serving'
+
+
+def serving_profile():
+    """Profile for the API's connections: PRODUCTS_API_DB_PROFILE or 'serving'"""
+    name = os.environ.get('PRODUCTS_API_DB_PROFILE', DEFAULT_PROFILE)
+    if name not in PROFILES:
+        raise ValueError(f"Unknown database profile {name!r}; choose from {', '.join(PROFILES)}")
+    return name
+
+
+def apply_profile(conn, profile=DEFAULT_PROFILE):
+    """
+    Apply a tuning profile to an open connection.
+
+    The journal mode is stored in the database file, so it is only changed
+    when it differs. Switching needs a moment with no other connection in a
+    transaction; if that fails (or the file is read-only) the connection
+    keeps the current mode and a warning is logged.
+    """
+    for pragma, value in PROFILES[profile].items():
+        if pragma == 'journal_mode':
+            current = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if current.lower() == value.lower():
+                continue
+            try:
+                conn.execute(f"PRAGMA journal_mode = {value}")
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Could not switch journal mode from {current} to {value}: {e}")
+        else:
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+def connect(database, profile=DEFAULT_PROFILE, **kwargs):
+    """sqlite3.connect with a tuning profile applied"""
+    conn = sqlite3.connect(database, **kwargs)
+    apply_profile(conn, profile)
+    return conn
+
+
+def current_settings(conn):
+    """The connection's values of every PRAGMA the profiles set, for monitoring"""
+    settings = {}
+    for pragma in dict.fromkeys(pragma for profile in PROFILES.values() for pragma in profile):
+        # mmap_size has no value on builds (or databases) without mmap support
+        row = conn.execute(f"PRAGMA {pragma}").fetchone()
+        settings[pragma] = row[0] if row else None
+    return settings
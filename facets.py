@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Product Facets
+Result counts per category, brand, department and retail price bucket for
+the /api/products filters. Each facet is counted under every filter except
+its own, so with a category selected the other categories still show how
+many products they would list. The counts come from one pass over the
+catalog: mask arithmetic in the columnar index when it can serve the
+filters, otherwise a single grouped scan in SQLite combined here.
+"""
+
+from collections import Counter
+
+from query_builder import FACET_COLUMNS, PRICE_BUCKETS, bind_filters, facet_sql, facet_params
+
+FACETS = FACET_COLUMNS + ('price',)
+
+
+def count_groups(rows, filters):
+    """
+    Combine facet_sql rows into facet counts.
+
+    A row counts towards a facet when it passes every other filter: either
+    it passes all of them, or that facet's own filter is the only one it
+    fails. Returns (total_count, counts), counts mapping each facet to
+    {value: count} with price keyed by bucket number.
+    """
+    counts = {name: Counter() for name in FACETS}
+    total_count = 0
+    for category, brand, department, price_bucket, in_price, count in rows:
+        values = {'category': category, 'brand': brand, 'department': department,
+                  'price': price_bucket}
+        failed = [name for name in FACET_COLUMNS
+                  if filters.get(name) not in (None, '', values[name])]
+        if not in_price:
+            failed.append('price')
+
+        if not failed:
+            total_count += count
+            for name in FACETS:
+                counts[name][values[name]] += count
+        elif len(failed) == 1:
+            counts[failed[0]][values[failed[0]]] += count
+    return total_count, counts
+
+
+def count_facets(conn, filters, fts5=False):
+    """Facet counts from one grouped scan in SQLite; see count_groups"""
+    shape, params = bind_filters(filters, fts5)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(facet_sql(shape), facet_params(shape, params))
+    return count_groups(cursor.fetchall(), filters)
+
+
+def format_facets(counts, limit):
+    """
+    Response body for facet counts: the values of each facet by descending
+    count, at most limit of them, and every price bucket.
+    """
+    facets = {}
+    for name in FACET_COLUMNS:
+        ranked = sorted(counts[name].items(), key=lambda item: (-item[1], str(item[0])))
+        facets[name] = [{'value': value, 'count': count} for value, count in ranked[:limit] if count]
+
+    upper_bounds = PRICE_BUCKETS[1:] + (None,)
+    facets['price'] = [
+        {'min': low, 'max': high, 'count': counts['price'].get(number, 0)}
+        for number, (low, high) in enumerate(zip(PRICE_BUCKETS, upper_bounds))
+    ]
+    return facets
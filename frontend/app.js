@@ -13,20 +13,29 @@ let currentDepartmentPage = 1;
 let departmentTotalPages = 1;
 let currentDepartmentCategory = '';
 
+// Columns the product grids render (createProductCard, displayDepartmentProducts)
+const PRODUCT_CARD_FIELDS = 'category,department,name,brand,sku,retail_price,cost';
+const DEPARTMENT_CARD_FIELDS = 'category,department_name,name,brand,retail_price,cost';
+
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
     loadDepartments();
-    loadCategories();
     loadProducts(1);
     setupEventListeners();
 });
 
 // Setup event listeners
 function setupEventListeners() {
-    // Search input with debounce
+    // Search input: quick typeahead suggestions, the listing once typing pauses
     let searchTimeout;
+    let suggestTimeout;
     document.getElementById('searchInput').addEventListener('input', function() {
         clearTimeout(searchTimeout);
+        clearTimeout(suggestTimeout);
+        const query = this.value.trim();
+        suggestTimeout = setTimeout(() => {
+            loadSuggestions(query);
+        }, 100);
         searchTimeout = setTimeout(() => {
             loadProducts(1);
         }, 500);
@@ -93,14 +102,18 @@ function setupDepartmentEventListeners() {
     });
 }
 
-// Load categories for filter dropdown
-async function loadCategories() {
+// Load category counts for the filter dropdown under the current filters
+async function loadCategories(filters = {}) {
     try {
-        const response = await fetch(`${API_BASE_URL}/api/products/stats`);
+        const queryParams = new URLSearchParams({ ...filters, limit: 100 });
+        queryParams.delete('sort_by');
+        queryParams.delete('sort_order');
+
+        const response = await fetch(`${API_BASE_URL}/api/products/facets?${queryParams}`);
         const data = await response.json();
         
-        if (data.top_categories) {
-            allCategories = data.top_categories;
+        if (response.ok && data.facets) {
+            allCategories = data.facets.category;
             populateCategoryFilter();
         }
     } catch (error) {
@@ -108,6 +121,31 @@ async function loadCategories() {
     }
 }
 
+// Fill the search box's suggestion list for the text typed so far
+async function loadSuggestions(query) {
+    const list = document.getElementById('searchSuggestions');
+    if (!query) {
+        list.replaceChildren();
+        return;
+    }
+    try {
+        const queryParams = new URLSearchParams({ q: query, limit: 8 });
+        const response = await fetch(`${API_BASE_URL}/api/products/suggest?${queryParams}`);
+        const data = await response.json();
+        
+        if (response.ok && data.suggestions) {
+            list.replaceChildren(...data.suggestions.map(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.value;
+                option.label = `${suggestion.type} (${suggestion.count})`;
+                return option;
+            }));
+        }
+    } catch (error) {
+        console.error('Error loading suggestions:', error);
+    }
+}
+
 // Load departments
 async function loadDepartments() {
     try {
@@ -149,14 +187,22 @@ function populateDepartmentNavigation() {
 // Populate category filter dropdown
 function populateCategoryFilter() {
     const categorySelect = document.getElementById('categoryFilter');
+    const selected = categorySelect.value;
     categorySelect.innerHTML = '<option value="">All Categories</option>';
     
-    allCategories.forEach(category => {
+    const categories = [...allCategories];
+    if (selected && !categories.some(category => category.value === selected)) {
+        // Keep the current choice even when nothing matches it any more
+        categories.push({ value: selected, count: 0 });
+    }
+    
+    categories.forEach(category => {
         const option = document.createElement('option');
-        option.value = category.category;
-        option.textContent = `${category.category} (${category.count})`;
+        option.value = category.value;
+        option.textContent = `${category.value} (${category.count})`;
         categorySelect.appendChild(option);
     });
+    categorySelect.value = selected;
 }
 
 // Load products with filters and pagination
@@ -168,6 +214,7 @@ async function loadProducts(page = 1) {
         const queryParams = new URLSearchParams({
             page: page,
             limit: 12,
+            fields: PRODUCT_CARD_FIELDS,
             ...filters
         });
 
@@ -181,6 +228,7 @@ async function loadProducts(page = 1) {
             
             displayProducts(data.products);
             updatePagination(data.pagination);
+            loadCategories(filters);
         } else {
             showError('Failed to load products: ' + data.message);
         }
@@ -600,6 +648,7 @@ async function loadDepartmentProducts(departmentId, page = 1) {
         const queryParams = new URLSearchParams({
             page: page,
             limit: 12,
+            fields: DEPARTMENT_CARD_FIELDS,
             ...filters
         });
 
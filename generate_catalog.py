@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Synthetic Catalog Generator
+Builds product catalogs of any size (1M, 10M, ...) for scale benchmarks,
+either as a ready-to-serve database (the refactored, migrated schema the
+API expects) or as a CSV with the columns of products.csv that
+create_database.py can load.
+
+The catalog is shaped like the real one: Women and Men departments with
+their own categories, a few thousand brands whose popularity falls off as
+a Zipf distribution (a handful of brands own much of the catalog, most
+have a few products), category popularity skewed the same way, lognormal
+prices around each category's median, and distribution centers weighted
+towards the large ports.
+
+Everything is drawn from one random.Random(seed), row by row, so the same
+seed and options give the same rows on every machine and in both formats.
+The options, row count and a SHA-256 of the rows are recorded in a manifest
+(the catalog_generation table of a database, or <output>.manifest.json
+next to a CSV) so a benchmark result can name the exact data it ran on.
+
+Usage:
+    python generate_catalog.py --products 1M --seed 42 --output catalog_1m.db
+    python generate_catalog.py --products 10M --output catalog_10m.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import create_database
+import db_tuning
+from refactor_database import DatabaseRefactor
+
+# Bump whenever a change to this file changes the rows for a given seed
+GENERATOR_VERSION = 1
+
+DEFAULT_SEED = 42
+DEFAULT_BRANDS = 2500
+DEFAULT_BRAND_SKEW = 0.9
+DEFAULT_CATEGORY_SKEW = 0.6
+BATCH_SIZE = 50000
+
+DEPARTMENTS = [('Women', 0.52), ('Men', 0.48)]
+
+# (category, departments selling it, median retail price, product nouns)
+CATEGORIES = [
+    ('Tops & Tees', ('Women', 'Men'), 25, ('T-Shirt', 'Tank Top', 'Polo', 'Henley')),
+    ('Fashion Hoodies & Sweatshirts', ('Women', 'Men'), 42, ('Hoodie', 'Sweatshirt', 'Zip Hoodie')),
+    ('Sweaters', ('Women', 'Men'), 55, ('Sweater', 'Cardigan', 'Pullover', 'Turtleneck')),
+    ('Jeans', ('Women', 'Men'), 60, ('Jeans', 'Denim Jeans', 'Skinny Jeans', 'Bootcut Jeans')),
+    ('Pants', ('Women', 'Men'), 45, ('Chinos', 'Trousers', 'Cargo Pants', 'Joggers')),
+    ('Shorts', ('Women', 'Men'), 30, ('Shorts', 'Cargo Shorts', 'Board Shorts')),
+    ('Swim', ('Women', 'Men'), 35, ('Swimsuit', 'Bikini', 'Swim Trunks', 'Rash Guard')),
+    ('Active', ('Women', 'Men'), 35, ('Training Top', 'Running Tights', 'Track Jacket', 'Sports Bra')),
+    ('Outerwear & Coats', ('Women', 'Men'), 110, ('Parka', 'Rain Jacket', 'Puffer Jacket', 'Trench Coat')),
+    ('Sleep & Lounge', ('Women', 'Men'), 30, ('Pajama Set', 'Robe', 'Lounge Pants')),
+    ('Accessories', ('Women', 'Men'), 22, ('Belt', 'Scarf', 'Beanie', 'Sunglasses', 'Wallet')),
+    ('Socks', ('Men',), 12, ('Crew Socks', 'Ankle Socks', 'Dress Socks')),
+    ('Underwear', ('Men',), 18, ('Boxer Briefs', 'Trunks', 'Undershirt')),
+    ('Suits & Sport Coats', ('Men',), 150, ('Suit Jacket', 'Sport Coat', 'Tuxedo')),
+    ('Intimates', ('Women',), 22, ('Bra', 'Bralette', 'Panties', 'Shapewear')),
+    ('Dresses', ('Women',), 60, ('Maxi Dress', 'Wrap Dress', 'Shift Dress', 'Cocktail Dress')),
+    ('Skirts', ('Women',), 38, ('Pencil Skirt', 'Midi Skirt', 'Mini Skirt')),
+    ('Leggings', ('Women',), 25, ('Leggings', 'Yoga Leggings', 'Capri Leggings')),
+    ('Pants & Capris', ('Women',), 40, ('Capris', 'Wide Leg Pants', 'Culottes')),
+    ('Blazers & Jackets', ('Women',), 80, ('Blazer', 'Denim Jacket', 'Moto Jacket')),
+    ('Maternity', ('Women',), 40, ('Maternity Dress', 'Maternity Jeans', 'Nursing Top')),
+    ('Plus', ('Women',), 40, ('Plus Tunic', 'Plus Dress', 'Plus Jeans')),
+    ('Jumpsuits & Rompers', ('Women',), 45, ('Jumpsuit', 'Romper', 'Overalls')),
+    ('Suits', ('Women',), 95, ('Pant Suit', 'Skirt Suit')),
+    ('Socks & Hosiery', ('Women',), 12, ('Tights', 'Knee Socks', 'Stockings')),
+    ('Clothing Sets', ('Women',), 50, ('Two Piece Set', 'Lounge Set')),
+]
+
+ADJECTIVES = ['Classic', 'Slim Fit', 'Relaxed', 'Vintage', 'Essential', 'Stretch', 'Lightweight',
+              'Heavyweight', 'Organic Cotton', 'Merino', 'Fleece', 'Linen', 'Ribbed', 'Quilted',
+              'Cropped', 'Oversized', 'Performance', 'Waterproof', 'Striped', 'Printed']
+COLORS = ['Black', 'White', 'Navy', 'Grey', 'Charcoal', 'Olive', 'Burgundy', 'Khaki', 'Blue',
+          'Red', 'Pink', 'Green', 'Brown', 'Cream', 'Indigo']
+
+BRAND_PREFIXES = ['Al', 'Bel', 'Cor', 'Dal', 'El', 'Fen', 'Gar', 'Har', 'Is', 'Jun', 'Kel', 'Lor',
+                  'Mar', 'Nor', 'Or', 'Pel', 'Quin', 'Ros', 'Sal', 'Tor', 'Ul', 'Ver', 'Wil', 'Zen']
+BRAND_SUFFIXES = ['a', 'ano', 'bury', 'dale', 'elle', 'en', 'ford', 'ia', 'ino', 'is', 'ley',
+                  'mont', 'o', 'ova', 'ra', 'ton', 'vale', 'wick']
+BRAND_FORMS = ['{}', '{}', '{}', '{} & Co', '{} Denim', '{} Studio', '{} Outdoor', '{} Basics',
+               '{} Apparel', 'The {} Label']
+
+# Distribution center ids of archive/distribution_centers.csv, big ports first
+DISTRIBUTION_CENTER_WEIGHTS = [(6, 18), (4, 16), (3, 13), (2, 11), (7, 9), (1, 8), (9, 7), (10, 7),
+                               (5, 6), (8, 5)]
+
+# created_at of the first and last product
+CREATED_START = datetime(2022, 1, 1)
+CREATED_SPAN_SECONDS = 3 * 365 * 24 * 3600
+
+CSV_COLUMNS = ['id', 'cost', 'category', 'name', 'brand', 'retail_price', 'department', 'sku',
+               'distribution_center_id', 'created_at']
+
+
+def parse_count(text):
+    """Row count from '250000', '250k', '1M' or '2.5M'"""
+    text = text.strip().lower().replace('_', '')
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    try:
+        count = int(float(text[:-1] if scale > 1 else text) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid product count: {text!r}")
+    if count < 1:
+        raise argparse.ArgumentTypeError("product count must be at least 1")
+    return count
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative weights giving item i a share proportional to 1 / (i + 1) ** skew"""
+    return list(accumulate(1.0 / (rank + 1) ** skew for rank in range(count)))
+
+
+def make_brands(rng, count):
+    """count distinct brand names, in popularity order, each with the departments it sells to"""
+    names = {}
+    while len(names) < count:
+        stem = rng.choice(BRAND_PREFIXES) + rng.choice(BRAND_SUFFIXES)
+        if len(names) > len(BRAND_PREFIXES) * len(BRAND_SUFFIXES) // 2:
+            # Bare stems run out; pair two different ones
+            second = rng.choice(BRAND_PREFIXES) + rng.choice(BRAND_SUFFIXES)
+            if second == stem:
+                continue
+            stem += ' ' + second
+        name = rng.choice(BRAND_FORMS).format(stem)
+        if name not in names:
+            draw = rng.random()
+            names[name] = ('Women',) if draw < 0.4 else ('Men',) if draw < 0.7 else ('Women', 'Men')
+    return list(names.items())
+
+
+class CatalogGenerator:
+    """Deterministic product rows for a seed, size and set of distribution options"""
+
+    def __init__(self, products, seed=DEFAULT_SEED, brands=DEFAULT_BRANDS,
+                 brand_skew=DEFAULT_BRAND_SKEW, category_skew=DEFAULT_CATEGORY_SKEW):
+        self.products = products
+        self.seed = seed
+        self.brand_count = brands
+        self.brand_skew = brand_skew
+        self.category_skew = category_skew
+
+    def options(self):
+        """Everything that determines the rows"""
+        return {
+            'generator_version': GENERATOR_VERSION,
+            'seed': self.seed,
+            'products': self.products,
+            'brands': self.brand_count,
+            'brand_skew': self.brand_skew,
+            'category_skew': self.category_skew
+        }
+
+    def _department_choices(self, rng):
+        """Per department: (categories, cumulative weights), (brands, cumulative weights)"""
+        brands = make_brands(rng, self.brand_count)
+        categories = list(CATEGORIES)
+        rng.shuffle(categories)
+
+        choices = {}
+        for department, _ in DEPARTMENTS:
+            department_categories = [category for category in categories if department in category[1]]
+            department_brands = [name for name, departments in brands if department in departments]
+            choices[department] = (
+                department_categories,
+                zipf_cum_weights(len(department_categories), self.category_skew),
+                department_brands,
+                zipf_cum_weights(len(department_brands), self.brand_skew)
+            )
+        return choices
+
+    def rows(self):
+        """(id, cost, category, name, brand, retail_price, department, sku, distribution_center_id, created_at)"""
+        rng = random.Random(self.seed)
+        choices = self._department_choices(rng)
+        departments = [name for name, _ in DEPARTMENTS]
+        department_weights = list(accumulate(weight for _, weight in DEPARTMENTS))
+        centers = [center for center, _ in DISTRIBUTION_CENTER_WEIGHTS]
+        center_weights = list(accumulate(weight for _, weight in DISTRIBUTION_CENTER_WEIGHTS))
+        sku_prefix = f"{self.seed}:".encode()
+
+        for product_id in range(1, self.products + 1):
+            department = rng.choices(departments, cum_weights=department_weights)[0]
+            categories, category_weights, brands, brand_weights = choices[department]
+            category, _, median_price, nouns = rng.choices(categories, cum_weights=category_weights)[0]
+            brand = rng.choices(brands, cum_weights=brand_weights)[0]
+
+            name = f"{brand} {rng.choice(ADJECTIVES)} {rng.choice(nouns)}"
+            if rng.random() < 0.5:
+                name += f" - {rng.choice(COLORS)}"
+            retail_price = round(min(max(median_price * rng.lognormvariate(0, 0.5), 1.5), 999.0), 2)
+            cost = round(retail_price * rng.uniform(0.35, 0.65), 2)
+            created_at = CREATED_START + timedelta(
+                seconds=(product_id - 1) * CREATED_SPAN_SECONDS // self.products)
+
+            yield (
+                product_id, cost, category, name, brand, retail_price, department,
+                hashlib.md5(sku_prefix + str(product_id).encode()).hexdigest().upper(),
+                rng.choices(centers, cum_weights=center_weights)[0],
+                created_at.strftime('%Y-%m-%d %H:%M:%S')
+            )
+
+    def batches(self, checksum, progress=True):
+        """rows() in lists of BATCH_SIZE, feeding each row into the checksum"""
+        started = time.perf_counter()
+        batch = []
+        for row in self.rows():
+            checksum.update(("\t".join(map(str, row)) + "\n").encode())
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = []
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    print(f"  {row[0]:,} / {self.products:,} products ({row[0] / elapsed:,.0f}/s)",
+                          end="\r", flush=True)
+        if batch:
+            yield batch
+        if progress:
+            print()
+
+
+def manifest(generator, checksum, output, seconds):
+    return {
+        **generator.options(),
+        'rows_sha256': checksum.hexdigest(),
+        'output': os.path.basename(output),
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'generation_seconds': round(seconds, 1)
+    }
+
+
+def write_csv(generator, output):
+    """Write the catalog as CSV plus <output>.manifest.json; returns the manifest"""
+    started = time.perf_counter()
+    checksum = hashlib.sha256()
+    with open(output, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_COLUMNS)
+        for batch in generator.batches(checksum):
+            writer.writerows(batch)
+
+    result = manifest(generator, checksum, output, time.perf_counter() - started)
+    with open(output + '.manifest.json', 'w', encoding='utf-8') as manifest_file:
+        json.dump(result, manifest_file, indent=2)
+    return result
+
+
+def write_database(generator, output):
+    """
+    Write the catalog as a serving database: products, departments and
+    every migration, with the manifest in the catalog_generation table.
+    Returns the manifest.
+    """
+    started = time.perf_counter()
+    checksum = hashlib.sha256()
+    conn = db_tuning.connect(output, 'bulk_load')
+    try:
+        if not create_database.create_products_table(conn):
+            raise RuntimeError("could not create the products table")
+        # Rows go in before any index, trigger or FTS table exists; the
+        # migrations then build those in bulk
+        for batch in generator.batches(checksum):
+            conn.executemany(f"INSERT INTO products ({', '.join(CSV_COLUMNS)}) "
+                             f"VALUES ({', '.join('?' * len(CSV_COLUMNS))})", batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+    refactor = DatabaseRefactor(output)
+    if not refactor.connect():
+        raise RuntimeError(f"could not open {output}")
+    try:
+        steps = [
+            refactor.create_departments_table,
+            lambda: refactor.populate_departments_table(refactor.extract_unique_departments()),
+            refactor.add_department_id_column,
+            refactor.update_products_with_department_ids,
+            refactor.apply_schema_migrations
+        ]
+        for step in steps:
+            if not step():
+                raise RuntimeError("schema setup failed, see the log above")
+
+        result = manifest(generator, checksum, output, time.perf_counter() - started)
+        refactor.connection.execute(
+            "CREATE TABLE IF NOT EXISTS catalog_generation (manifest TEXT NOT NULL)")
+        refactor.connection.execute("DELETE FROM catalog_generation")
+        refactor.connection.execute("INSERT INTO catalog_generation (manifest) VALUES (?)",
+                                    (json.dumps(result),))
+        refactor.connection.commit()
+    finally:
+        refactor.close()
+    return result
+
+
+def read_manifest(database):
+    """Manifest of a generated database, or None for any other database"""
+    conn = sqlite3.connect(database)
+    try:
+        row = conn.execute("SELECT manifest FROM catalog_generation").fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog")
+    parser.add_argument('--products', type=parse_count, default=parse_count('1M'),
+                        help="number of products, e.g. 250k, 1M, 10M (default: 1M)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--brands', type=int, default=DEFAULT_BRANDS, help="number of brands")
+    parser.add_argument('--brand-skew', type=float, default=DEFAULT_BRAND_SKEW,
+                        help="Zipf exponent of brand popularity (0: uniform)")
+    parser.add_argument('--category-skew', type=float, default=DEFAULT_CATEGORY_SKEW,
+                        help="Zipf exponent of category popularity (0: uniform)")
+    parser.add_argument('--output', default='ecommerce.db',
+                        help="database to create, or a .csv file (default: ecommerce.db)")
+    parser.add_argument('--force', action='store_true', help="replace an existing output file")
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        if not args.force:
+            print(f"{args.output} already exists; pass --force to replace it")
+            sys.exit(1)
+        for path in (args.output, args.output + '-wal', args.output + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    generator = CatalogGenerator(args.products, seed=args.seed, brands=args.brands,
+                                 brand_skew=args.brand_skew, category_skew=args.category_skew)
+    print(f"Generating {args.products:,} products (seed {args.seed}) into {args.output}")
+    try:
+        if args.output.lower().endswith('.csv'):
+            result = write_csv(generator, args.output)
+        else:
+            result = write_database(generator, args.output)
+    except (OSError, sqlite3.Error, RuntimeError) as e:
+        print(f"Catalog generation failed: {e}")
+        sys.exit(1)
+
+    print(f"Done in {result['generation_seconds']}s")
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Listing Count Strategies
+Total-count handling for the paginated product listings: a bounded cache for
+exact counts of repeated filter combinations, and precomputed per-filter
+statistics, read from the summary tables, used to estimate counts without
+scanning the products table.
+"""
+
+import bisect
+import random
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# count=exact runs (or reuses) COUNT(*), count=estimate uses the statistics,
+# count=none skips the total entirely and relies on has_next
+COUNT_MODES = ['exact', 'estimate', 'none']
+
+# Trigger-maintained summary tables (migration 3) holding the row count per
+# value of a filter column; department names map through department_id
+STATS_TABLES = [
+    ('product_stats_by_category', 'category'),
+    ('product_stats_by_brand', 'brand'),
+    ('product_stats_by_department', 'department_id'),
+]
+
+
+class CountCache:
+    """LRU cache of exact listing counts with a time-to-live per entry"""
+
+    def __init__(self, max_entries=2048, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached count for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            count, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key, count):
+        """Store an exact count, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (count, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached count"""
+        with self._lock:
+            self._entries.clear()
+
+
+class CatalogStatistics:
+    """
+    Per-filter selectivity statistics for estimating listing counts.
+
+    Row counts per category, brand and department are read from the summary
+    tables the product_stats triggers keep current, so loading reads a few
+    hundred small rows instead of scanning products, and the retail price
+    distribution is summarised by quantiles taken from a random sample of
+    rows looked up by primary key. Filters are assumed to be
+    independent, so an estimate is the total row count multiplied by the
+    selectivity of each active filter. Text search has no statistics; callers
+    fall back to an exact count for it.
+
+    A catalog change reloads the statistics at most once every
+    min_reload_interval seconds, so a stream of writes does not reread the
+    statistics on every request; estimates lag the catalog until then.
+    """
+
+    def __init__(self, refresh_interval=300.0, min_reload_interval=10.0, price_sample_size=2000, seed=42):
+        self.refresh_interval = refresh_interval
+        self.min_reload_interval = min_reload_interval
+        self.price_sample_size = price_sample_size
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._revision = None
+        self.total = 0
+        self.by_column = {}
+        self.price_quantiles = []
+
+    def _load(self, conn):
+        """Read the statistics from the database"""
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT product_count FROM product_stats_overall WHERE id = 1")
+        row = cursor.fetchone()
+        total = row[0] if row else 0
+        # Separate subqueries, so each is a single primary key lookup
+        cursor.execute("SELECT (SELECT MIN(id) FROM products), (SELECT MAX(id) FROM products)")
+        min_id, max_id = cursor.fetchone()
+
+        by_column = {}
+        for table, column in STATS_TABLES:
+            cursor.execute(f"SELECT {column}, product_count FROM {table}")
+            by_column[column] = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT d.name, s.product_count
+            FROM product_stats_by_department s
+            JOIN departments d ON d.id = s.department_id
+        """)
+        by_column['department'] = {row[0]: row[1] for row in cursor.fetchall()}
+
+        # Sample rows by primary key so this stays cheap on large catalogs
+        prices = []
+        if total:
+            rng = random.Random(self.seed)
+            sample_ids = [rng.randint(min_id, max_id) for _ in range(self.price_sample_size)]
+            for start in range(0, len(sample_ids), 500):
+                chunk = sample_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(
+                    f"SELECT retail_price FROM products WHERE id IN ({placeholders})",
+                    chunk
+                )
+                prices.extend(row[0] for row in cursor.fetchall())
+        prices.sort()
+
+        self.total = total
+        self.by_column = by_column
+        self.price_quantiles = prices
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded catalog statistics for {total} products")
+
+    def ensure_loaded(self, conn, revision=None):
+        """Load the statistics on first use and refresh them when stale"""
+        with self._lock:
+            age = None if self._loaded_at is None else time.monotonic() - self._loaded_at
+            if (age is None or age > self.refresh_interval
+                    or (revision is not None and revision != self._revision
+                        and age >= self.min_reload_interval)):
+                self._load(conn)
+                self._revision = revision
+
+    def invalidate(self):
+        """Force a reload on next use"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _price_fraction_below(self, price, inclusive):
+        """Estimated fraction of products priced below (or at) price"""
+        if not self.price_quantiles:
+            return 0.0
+        if inclusive:
+            position = bisect.bisect_right(self.price_quantiles, price)
+        else:
+            position = bisect.bisect_left(self.price_quantiles, price)
+        return position / len(self.price_quantiles)
+
+    def estimate(self, conn, filters, revision=None):
+        """
+        Estimate the number of products matching filters.
+
+        Passing the catalog revision reloads the statistics as soon as the
+        catalog changes. Returns None when a filter has no statistics
+        (text search).
+        """
+        if filters.get('search'):
+            return None
+
+        self.ensure_loaded(conn, revision)
+        if not self.total:
+            return 0
+
+        selectivity = 1.0
+        for column in ('category', 'brand', 'department', 'department_id'):
+            value = filters.get(column)
+            if value is not None:
+                selectivity *= self.by_column[column].get(value, 0) / self.total
+
+        min_price = filters.get('min_price')
+        max_price = filters.get('max_price')
+        if min_price is not None or max_price is not None:
+            upper = 1.0 if max_price is None else self._price_fraction_below(max_price, True)
+            lower = 0.0 if min_price is None else self._price_fraction_below(min_price, False)
+            selectivity *= max(upper - lower, 0.0)
+
+        return int(round(self.total * selectivity))
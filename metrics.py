@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Request Metrics
+Per-route request instrumentation for the products API, exposed at /metrics
+in the Prometheus text format. Flask request hooks time every request and
+count it by route template, method and status, and keep an in-flight gauge
+per route. Pooled connections hand out TimedCursor, which adds the time
+spent in SQLite (execute and fetch) and the rows fetched to the current
+request, and feeds the slow query log. The JSON provider's response() is
+timed as serialization.
+
+Everything is plain counters and fixed-bucket histograms behind one lock,
+a few microseconds per request, so it stays on in production. Each worker
+process keeps its own numbers; rows fetched by a streamed export body after
+the response has started are not counted, and its duration is the time to
+the first byte.
+"""
+
+import bisect
+import threading
+import time
+import sqlite3
+
+from flask import request
+
+# Histogram bucket upper bounds (Prometheus "le"); +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ROW_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 500, 1000, 5000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Label of requests that matched no route (404s), to keep label values bounded
+UNMATCHED_ROUTE = 'unmatched'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Stats of the request running on this thread, if any
+_current = threading.local()
+
+
+def current_request():
+    """RequestStats of the request running on this thread, or None"""
+    return getattr(_current, 'stats', None)
+
+
+class RequestStats:
+    """What one request spent, filled in while it runs"""
+
+    __slots__ = ('route', 'method', 'started', 'sql_seconds', 'statements', 'rows',
+                 'serialization_seconds', 'recorded')
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.sql_seconds = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+        self.recorded = False
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that adds its SQLite time and fetched rows to the current
+    request, and hands statements that turn out slow to the connection's
+    slow_query_log (see slow_queries.py). A statement's time is its
+    execute plus the fetches that follow it.
+    """
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        # [log, sql, parameters, seconds so far] of a statement not yet logged
+        self._pending = None
+
+    def _account(self, seconds, rows=0, statements=0):
+        stats = getattr(_current, 'stats', None)
+        if stats is not None:
+            stats.sql_seconds += seconds
+            stats.rows += rows
+            stats.statements += statements
+        pending = self._pending
+        if pending is not None:
+            pending[3] += seconds
+            log = pending[0]
+            if pending[3] >= log.threshold:
+                self._pending = None
+                log.record(self.connection, pending[1], pending[2], pending[3],
+                           stats.route if stats is not None else None)
+
+    def execute(self, sql, parameters=()):
+        log = getattr(self.connection, 'slow_query_log', None)
+        self._pending = [log, sql, parameters, 0.0] if log is not None else None
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._account(time.perf_counter() - started, statements=1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._account(time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._account(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._account(time.perf_counter() - started, len(rows))
+        return rows
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] holds values <= buckets[i], the last +Inf"""
+
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    """Everything recorded for one route template"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.requests = {}
+        self.durations = {}
+        self.sql_statements = 0
+        self.sql_seconds = Histogram(LATENCY_BUCKETS)
+        self.serialization_seconds = Histogram(LATENCY_BUCKETS)
+        self.rows = Histogram(ROW_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+
+
+class MetricsRegistry:
+    """Per-route counters and histograms of one worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def _route(self, route):
+        metrics = self._routes.get(route)
+        if metrics is None:
+            metrics = self._routes[route] = RouteMetrics()
+        return metrics
+
+    def started(self, stats):
+        with self._lock:
+            self._route(stats.route).in_flight += 1
+
+    def finished(self, stats):
+        with self._lock:
+            self._route(stats.route).in_flight -= 1
+
+    def record(self, stats, status, response_bytes):
+        """Add a finished request's numbers; response_bytes is None for streams"""
+        duration = time.perf_counter() - stats.started
+        with self._lock:
+            metrics = self._route(stats.route)
+            key = (stats.method, str(status))
+            metrics.requests[key] = metrics.requests.get(key, 0) + 1
+            histogram = metrics.durations.get(stats.method)
+            if histogram is None:
+                histogram = metrics.durations[stats.method] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+            metrics.sql_statements += stats.statements
+            metrics.sql_seconds.observe(stats.sql_seconds)
+            metrics.serialization_seconds.observe(stats.serialization_seconds)
+            metrics.rows.observe(stats.rows)
+            if response_bytes is not None:
+                metrics.response_bytes.observe(response_bytes)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+
+            def family(name, kind, help_text):
+                lines.append(f"# HELP products_api_{name} {help_text}")
+                lines.append(f"# TYPE products_api_{name} {kind}")
+
+            def histogram(name, labels, values):
+                cumulative = 0
+                for bound, count in zip(values.buckets + (float('inf'),), values.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f"products_api_{name}_bucket{_labels(labels, le=le)} {cumulative}")
+                lines.append(f"products_api_{name}_sum{_labels(labels)} {_number(values.sum)}")
+                lines.append(f"products_api_{name}_count{_labels(labels)} {cumulative}")
+
+            family('http_requests_total', 'counter', "Requests by route, method and status")
+            for route, metrics in routes:
+                for (method, status), count in sorted(metrics.requests.items()):
+                    lines.append(f"products_api_http_requests_total"
+                                 f"{_labels({'route': route, 'method': method, 'status': status})} {count}")
+
+            family('http_requests_in_flight', 'gauge', "Requests being handled by route")
+            for route, metrics in routes:
+                lines.append(f"products_api_http_requests_in_flight{_labels({'route': route})} "
+                             f"{metrics.in_flight}")
+
+            family('http_request_duration_seconds', 'histogram', "Request latency by route and method")
+            for route, metrics in routes:
+                for method, values in sorted(metrics.durations.items()):
+                    histogram('http_request_duration_seconds', {'route': route, 'method': method}, values)
+
+            family('sql_statements_total', 'counter', "SQL statements executed by route")
+            for route, metrics in routes:
+                lines.append(f"products_api_sql_statements_total{_labels({'route': route})} "
+                             f"{metrics.sql_statements}")
+
+            for name, attribute, help_text in (
+                ('sql_duration_seconds', 'sql_seconds', "Time per request spent executing SQL and fetching rows"),
+                ('serialization_duration_seconds', 'serialization_seconds', "Time per request spent encoding JSON"),
+                ('rows_returned', 'rows', "Rows fetched from SQLite per request"),
+                ('response_size_bytes', 'response_bytes', "Response body size (streamed responses excluded)")
+            ):
+                family(name, 'histogram', help_text)
+                for route, metrics in routes:
+                    histogram(name, {'route': route}, getattr(metrics, attribute))
+
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels, **extra):
+    pairs = {**labels, **extra}
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in pairs.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(pairs, escaped)) + "}"
+
+
+def install_metrics(app, registry):
+    """Record every request of app in registry, and time its JSON responses"""
+
+    @app.before_request
+    def start_request_metrics():
+        rule = request.url_rule
+        stats = RequestStats(rule.rule if rule is not None else UNMATCHED_ROUTE, request.method)
+        _current.stats = stats
+        registry.started(stats)
+
+    @app.after_request
+    def record_request_metrics(response):
+        stats = getattr(_current, 'stats', None)
+        if stats is not None:
+            registry.record(stats, response.status_code,
+                            None if response.is_streamed else response.content_length)
+            stats.recorded = True
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        stats = getattr(_current, 'stats', None)
+        if stats is None:
+            return
+        _current.stats = None
+        if not stats.recorded:
+            # The request failed before a response was made
+            registry.record(stats, 500, None)
+        registry.finished(stats)
+
+    respond = app.json.response
+
+    def timed_response(*args, **kwargs):
+        stats = getattr(_current, 'stats', None)
+        if stats is None:
+            return respond(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return respond(*args, **kwargs)
+        finally:
+            stats.serialization_seconds += time.perf_counter() - started
+
+    app.json.response = timed_response
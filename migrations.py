@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Versioned Schema Migrations
+Applies numbered schema changes to the e-commerce database on top of the
+structure built by create_database.py and refactor_database.py. The current
+schema version is tracked in PRAGMA user_version, so each migration runs once.
+"""
+
+import sqlite3
+import sys
+import logging
+
+import db_tuning
+
+logger = logging.getLogger(__name__)
+
+
+def migration_001_product_indexes(cursor):
+    """
+    Secondary indexes matched to the filters and sorts the API issues.
+
+    Every equality filter is paired with retail_price so price ranges and
+    price sorts within a filter are index range scans, and the pairs double
+    as covering indexes for the per-category/brand/department COUNT and
+    AVG(retail_price) aggregates. Single-column indexes back the remaining
+    sort fields and the distribution center breakdown.
+    """
+    indexes = [
+        ('idx_products_category_price', 'category, retail_price'),
+        ('idx_products_brand_price', 'brand, retail_price'),
+        ('idx_products_department_price', 'department, retail_price'),
+        ('idx_products_department_id_price', 'department_id, retail_price'),
+        ('idx_products_department_id_category', 'department_id, category, retail_price'),
+        ('idx_products_department_id_brand', 'department_id, brand, retail_price'),
+        ('idx_products_retail_price', 'retail_price, cost'),
+        ('idx_products_cost', 'cost'),
+        ('idx_products_name', 'name'),
+        ('idx_products_distribution_center', 'distribution_center_id'),
+    ]
+    for index_name, columns in indexes:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON products({columns})")
+
+
+def fts5_available(cursor):
+    """Check whether this SQLite build includes the FTS5 extension"""
+    cursor.execute("PRAGMA compile_options")
+    return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def migration_002_products_fts(cursor):
+    """
+    FTS5 index over product name, brand and category for the search filter.
+
+    The index is external-content (it stores only the inverted index and
+    reads column values from products), kept in sync by triggers, and ranks
+    with BM25 weighted towards the product name. Prefix indexes for 2 and 3
+    characters keep typeahead-style prefix queries cheap. On builds without
+    FTS5 nothing is created and the API keeps using LIKE; ensure_search_index
+    creates the index later if the database moves to a build with FTS5.
+    """
+    if not fts5_available(cursor):
+        logger.warning("FTS5 is not available in this SQLite build; search will use LIKE")
+        return
+
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, brand, category,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, name, brand, category)
+            VALUES (new.id, new.name, new.brand, new.category);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, brand, category)
+            VALUES ('delete', old.id, old.name, old.brand, old.category);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_update
+        AFTER UPDATE OF id, name, brand, category ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, brand, category)
+            VALUES ('delete', old.id, old.name, old.brand, old.category);
+            INSERT INTO products_fts(rowid, name, brand, category)
+            VALUES (new.id, new.name, new.brand, new.category);
+        END
+    """)
+    cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO products_fts(products_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 2.0)')")
+
+
+# Summary table per grouping column served by /api/products/stats
+PRODUCT_STATS_GROUPS = [
+    ('product_stats_by_department', 'department_id'),
+    ('product_stats_by_category', 'category'),
+    ('product_stats_by_brand', 'brand'),
+    ('product_stats_by_distribution_center', 'distribution_center_id'),
+]
+
+
+def _stats_add_row_sql(table, column):
+    """Fold the new product row into its group of a summary table"""
+    return f"""
+        INSERT INTO {table} ({column}, product_count, price_sum, cost_sum, min_price, max_price)
+        SELECT new.{column}, 1, new.retail_price, new.cost, new.retail_price, new.retail_price
+        WHERE new.{column} IS NOT NULL
+        ON CONFLICT({column}) DO UPDATE SET
+            product_count = product_count + 1,
+            price_sum = price_sum + excluded.price_sum,
+            cost_sum = cost_sum + excluded.cost_sum,
+            min_price = COALESCE(MIN(min_price, excluded.min_price), excluded.min_price),
+            max_price = COALESCE(MAX(max_price, excluded.max_price), excluded.max_price);
+    """
+
+
+def _stats_remove_row_sql(table, column):
+    """
+    Take the old product row out of its group of a summary table.
+
+    Counts and sums are adjusted in place; min/max are only re-read (from
+    the (column, retail_price) indexes) when the removed row held them.
+    """
+    return f"""
+        UPDATE {table} SET
+            product_count = product_count - 1,
+            price_sum = price_sum - old.retail_price,
+            cost_sum = cost_sum - old.cost,
+            min_price = CASE WHEN old.retail_price <= min_price
+                THEN (SELECT MIN(retail_price) FROM products WHERE {column} = old.{column})
+                ELSE min_price END,
+            max_price = CASE WHEN old.retail_price >= max_price
+                THEN (SELECT MAX(retail_price) FROM products WHERE {column} = old.{column})
+                ELSE max_price END
+        WHERE {column} = old.{column};
+        DELETE FROM {table} WHERE {column} = old.{column} AND product_count <= 0;
+    """
+
+
+OVERALL_STATS_ADD_ROW_SQL = """
+    UPDATE product_stats_overall SET
+        product_count = product_count + 1,
+        price_sum = price_sum + new.retail_price,
+        cost_sum = cost_sum + new.cost,
+        min_price = COALESCE(MIN(min_price, new.retail_price), new.retail_price),
+        max_price = COALESCE(MAX(max_price, new.retail_price), new.retail_price),
+        min_cost = COALESCE(MIN(min_cost, new.cost), new.cost),
+        max_cost = COALESCE(MAX(max_cost, new.cost), new.cost)
+    WHERE id = 1;
+"""
+
+OVERALL_STATS_REMOVE_ROW_SQL = """
+    UPDATE product_stats_overall SET
+        product_count = product_count - 1,
+        price_sum = price_sum - old.retail_price,
+        cost_sum = cost_sum - old.cost,
+        min_price = CASE WHEN old.retail_price <= min_price
+            THEN (SELECT MIN(retail_price) FROM products) ELSE min_price END,
+        max_price = CASE WHEN old.retail_price >= max_price
+            THEN (SELECT MAX(retail_price) FROM products) ELSE max_price END,
+        min_cost = CASE WHEN old.cost <= min_cost
+            THEN (SELECT MIN(cost) FROM products) ELSE min_cost END,
+        max_cost = CASE WHEN old.cost >= max_cost
+            THEN (SELECT MAX(cost) FROM products) ELSE max_cost END
+    WHERE id = 1;
+"""
+
+
+def rebuild_product_stats(cursor):
+    """Recompute every summary table from scratch (backfill / repair)"""
+    cursor.execute("DELETE FROM product_stats_overall")
+    cursor.execute("""
+        INSERT INTO product_stats_overall
+            (id, product_count, price_sum, cost_sum, min_price, max_price, min_cost, max_cost)
+        SELECT 1, COUNT(*), COALESCE(SUM(retail_price), 0), COALESCE(SUM(cost), 0),
+               MIN(retail_price), MAX(retail_price), MIN(cost), MAX(cost)
+        FROM products
+    """)
+    for table, column in PRODUCT_STATS_GROUPS:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} ({column}, product_count, price_sum, cost_sum, min_price, max_price)
+            SELECT {column}, COUNT(*), SUM(retail_price), SUM(cost), MIN(retail_price), MAX(retail_price)
+            FROM products
+            WHERE {column} IS NOT NULL
+            GROUP BY {column}
+        """)
+
+
+def migration_003_product_stats(cursor):
+    """
+    Incrementally maintained summary tables for /api/products/stats.
+
+    One row of counts, sums and min/max per department, category, brand and
+    distribution center, plus a single overall row. Triggers on products
+    keep them current, so the stats endpoint reads a handful of small rows
+    instead of aggregating the whole catalog.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS product_stats_overall (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            product_count INTEGER NOT NULL,
+            price_sum REAL NOT NULL,
+            cost_sum REAL NOT NULL,
+            min_price REAL,
+            max_price REAL,
+            min_cost REAL,
+            max_cost REAL
+        )
+    """)
+    for table, column in PRODUCT_STATS_GROUPS:
+        key_type = 'INTEGER' if column.endswith('_id') else 'TEXT'
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {column} {key_type} PRIMARY KEY NOT NULL,
+                product_count INTEGER NOT NULL,
+                price_sum REAL NOT NULL,
+                cost_sum REAL NOT NULL,
+                min_price REAL,
+                max_price REAL
+            )
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_count ON {table}(product_count)")
+
+    add_row = OVERALL_STATS_ADD_ROW_SQL + "".join(
+        _stats_add_row_sql(table, column) for table, column in PRODUCT_STATS_GROUPS)
+    remove_row = OVERALL_STATS_REMOVE_ROW_SQL + "".join(
+        _stats_remove_row_sql(table, column) for table, column in PRODUCT_STATS_GROUPS)
+    tracked_columns = ", ".join(
+        ['retail_price', 'cost'] + [column for _, column in PRODUCT_STATS_GROUPS])
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS product_stats_insert AFTER INSERT ON products BEGIN
+            {add_row}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS product_stats_delete AFTER DELETE ON products BEGIN
+            {remove_row}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS product_stats_update
+        AFTER UPDATE OF {tracked_columns} ON products BEGIN
+            {remove_row}
+            {add_row}
+        END
+    """)
+
+    rebuild_product_stats(cursor)
+
+
+def migration_004_catalog_revision(cursor):
+    """
+    Catalog revision counter bumped by every change to products or departments.
+
+    The API compares it to serve ETag/Last-Modified conditional requests and
+    to invalidate its caches without re-reading any catalog data.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO catalog_revision (id, revision, updated_at)
+        VALUES (1, 1, strftime('%Y-%m-%d %H:%M:%S', 'now'))
+    """)
+    for table in ('products', 'departments'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS catalog_revision_{table}_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    UPDATE catalog_revision
+                    SET revision = revision + 1,
+                        updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now')
+                    WHERE id = 1;
+                END
+            """)
+
+
+def migration_005_facet_index(cursor):
+    """
+    Covering index for the facet counts.
+
+    The grouped facet scan reads category, brand, department and
+    retail_price of every product; with this index it reads the index
+    instead of the table rows.
+    """
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_products_facets
+        ON products(category, brand, department, retail_price)
+    """)
+
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, 'Product filter and sort indexes', migration_001_product_indexes),
+    (2, 'Full-text search index for products', migration_002_products_fts),
+    (3, 'Materialized product statistics', migration_003_product_stats),
+    (4, 'Catalog revision counter', migration_004_catalog_revision),
+    (5, 'Facet covering index', migration_005_facet_index),
+]
+
+
+def get_schema_version(conn):
+    """Return the schema version recorded in the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migration(conn, migrate, version=None):
+    """Run one migration in a transaction, recording version if given"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN")
+        migrate(cursor)
+        if version is not None:
+            cursor.execute(f"PRAGMA user_version = {version}")
+        cursor.execute("COMMIT")
+    except sqlite3.Error:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+
+
+def ensure_search_index(conn):
+    """
+    Create the FTS5 search index on a database that went past migration 2
+    on a SQLite build without FTS5, once the running build has it. The
+    version is not touched; returns True if the index was created.
+    """
+    if get_schema_version(conn) < 2 or not fts5_available(conn.cursor()):
+        return False
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    ).fetchone():
+        return False
+    logger.info("Creating the full-text search index skipped by migration 2")
+    run_migration(conn, migration_002_products_fts)
+    return True
+
+
+def apply_migrations(conn):
+    """
+    Apply every pending migration in order and refresh planner statistics.
+
+    Each migration runs in its own transaction together with the version
+    bump, so a failure leaves the database at the last good version. A
+    search index skipped by migration 2 is created as soon as the SQLite
+    build has FTS5 (see ensure_search_index). Returns the list of versions
+    that were applied.
+    """
+    current_version = get_schema_version(conn)
+    applied = []
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        logger.info(f"Applying migration {version}: {description}")
+        run_migration(conn, migrate, version)
+        applied.append(version)
+
+    if ensure_search_index(conn) or applied:
+        # Give the query planner up to date statistics for the new indexes
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    return applied
+
+
+def main():
+    """Apply pending migrations to the database given on the command line"""
+    logging.basicConfig(level=logging.INFO)
+    db_name = sys.argv[1] if len(sys.argv) > 1 else "ecommerce.db"
+
+    conn = db_tuning.connect(db_name, 'bulk_load', isolation_level=None)
+    try:
+        before = get_schema_version(conn)
+        applied = apply_migrations(conn)
+        if applied:
+            print(f"Migrated {db_name} from version {before} to {applied[-1]}")
+        else:
+            print(f"{db_name} is up to date (version {before})")
+    except sqlite3.Error as e:
+        print(f"Migration failed: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
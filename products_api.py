@@ -4,39 +4,467 @@ Products REST API
 A Flask-based REST API that provides endpoints for accessing product data from the e-commerce database.
 """
 
-from flask import Flask, jsonify, request, abort
+from flask import Flask, jsonify, request, abort, g, Response
 from flask_cors import CORS
 import sqlite3
 import math
+import json
+import base64
+import binascii
+import csv
+import io
+import zlib
+import functools
+import hmac
+import os
+import sys
+import time
 from datetime import datetime
 import logging
 
+from db_pool import ConnectionPool, PoolTimeout
+from db_tuning import serving_profile
+import db_tuning
+from listing_counts import COUNT_MODES, CountCache, CatalogStatistics
+from migrations import apply_migrations
+from catalog_version import get_catalog_revision
+from response_cache import ResponseCache
+from serialization import install_json_provider, column_names, rows_to_dicts, fetch_dicts
+from columnar_index import ColumnarIndex, columnar_index_enabled
+from facets import count_facets, format_facets
+from suggest_index import SuggestIndex, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from metrics import MetricsRegistry, TimedCursor, install_metrics
+import metrics
+from slow_queries import SlowQueryLog
+from access_log import AccessLog, access_log_path
+import serialization
+import query_builder
+from query_builder import VALID_SORT_FIELDS, PRODUCT_FIELDS, build_fts_query
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-app.config['JSON_SORT_KEYS'] = False
 
-# Enable CORS for all domains on all routes
-CORS(app)
+# orjson for jsonify when installed, stdlib json otherwise
+json_backend = install_json_provider(app)
+
+# Per-route latency, SQL time, rows and response size, served at /metrics
+metrics_registry = MetricsRegistry()
+install_metrics(app, metrics_registry)
+
+# Structured per-request log for replay_requests.py; only the servers start it
+access_log = None
+
+# Enable CORS for the catalog routes only; the operational routes (/metrics,
+# /api/admin/*, /api/cache/*) are not meant to be read from browsers
+CORS(app, resources={r"/api/(?!admin/|cache/).*": {"origins": "*"}})
+
+# Operational routes (/metrics, /api/admin/*, /api/cache/*) answer requests
+# from this host, and from elsewhere only with PRODUCTS_API_ADMIN_TOKEN as a
+# bearer token
+admin_token = os.environ.get('PRODUCTS_API_ADMIN_TOKEN') or None
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
 
 # Database configuration
 DATABASE = 'ecommerce.db'
 
-def get_db_connection():
-    """Get database connection with row factory for dict-like access"""
+# Statements slower than PRODUCTS_API_SLOW_QUERY_MS, with their query plans
+slow_query_log = SlowQueryLog.from_env()
+
+# Warm connections shared by all request handlers, with room in each
+# connection's statement cache for the hot query shapes, tuned for reading
+# (WAL, mmap; see db_tuning.py)
+pool = ConnectionPool(DATABASE, cached_statements=query_builder.STATEMENT_CACHE_SIZE,
+                      profile=serving_profile(), cursor_factory=TimedCursor,
+                      slow_query_log=slow_query_log)
+
+# Exports keep their connection until the client has read the whole body, so
+# they check out from a small pool of their own; slow or stalled downloads
+# can then never take connections away from the other routes. An export
+# that finds every export connection busy gets a 503.
+EXPORT_POOL_SIZE = 2
+export_pool = ConnectionPool(DATABASE, max_size=EXPORT_POOL_SIZE, timeout=1.0,
+                             profile=serving_profile(), cursor_factory=TimedCursor,
+                             slow_query_log=slow_query_log)
+
+# Serialized responses of the read endpoints, dropped on every catalog change
+response_cache = ResponseCache()
+
+# Search backend ('fts5' or 'like') detected per database file. Detected
+# once per process: a search index created later by
+# migrations.ensure_search_index is used after a restart or reload.
+_search_backends = {}
+
+# Exact counts for repeated filter combinations, and statistics for estimates
+count_cache = CountCache()
+catalog_stats = CatalogStatistics()
+
+# In-memory listing engine for plain filter/sort listings (needs NumPy)
+columnar_index = ColumnarIndex() if columnar_index_enabled() else None
+
+# Prefix index over names, brands and categories for the search typeahead
+suggest_index = SuggestIndex()
+
+def init_database():
+    """Apply pending schema migrations (indexes etc.) before serving requests"""
+    conn = db_tuning.connect(DATABASE, serving_profile())
     try:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        logger.error(f"Database connection error: {e}")
-        return None
+        applied = apply_migrations(conn)
+        if applied:
+            logger.info(f"Applied schema migrations: {applied}")
+    finally:
+        conn.close()
+
+def start_access_log(path=None):
+    """
+    Start writing the access log from this process. path defaults to
+    PRODUCTS_API_ACCESS_LOG; without a path the log stays off.
+    """
+    global access_log
+    if path is None:
+        path = access_log_path()
+    if path and access_log is None:
+        access_log = AccessLog(path)
+        logger.info(f"Writing access log to {path}")
+    return access_log
+
+def stop_access_log():
+    """Flush and close the access log, if it was started"""
+    global access_log
+    if access_log is not None:
+        access_log.close()
+        access_log = None
+
+@app.after_request
+def log_access(response):
+    """Hand each finished request to the access log"""
+    if access_log is not None:
+        stats = metrics.current_request()
+        if stats is not None:
+            access_log.record(request, response.status_code, time.perf_counter() - stats.started,
+                              None if response.is_streamed else response.content_length, stats.route)
+    return response
+
+def conditional_response(view):
+    """
+    Answer conditional GETs from the catalog revision before running the view.
+    
+    The ETag combines the catalog revision with the request URL. It is weak:
+    bodies for one URL and revision are equivalent but not byte-identical
+    (timestamps, gzip or identity exports). A matching If-None-Match gets a
+    304 without touching the query path. If-Modified-Since is ignored, since
+    Last-Modified only has one-second resolution and would hide a write made
+    in the same second; the ETag decides. The revision is left in
+    g.catalog_revision for the view's own caches. A view answering from an
+    in-memory index that is still being rebuilt sets g.stale_snapshot, and
+    its response gets no ETag.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            with pool.connection() as conn:
+                revision, last_modified = get_catalog_revision(conn)
+        except sqlite3.Error as e:
+            logger.error(f"Database error reading catalog revision: {e}")
+            abort(500)
+        
+        g.catalog_revision = revision
+        etag = f"{revision}-{zlib.crc32(request.full_path.encode('utf-8')):08x}"
+        
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or g.get('stale_snapshot'):
+                return response
+        
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+    
+    return wrapper
+
+def admin_only(view):
+    """Reject requests from other hosts to an operational route unless they carry the admin token"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            supplied = request.headers.get('Authorization', '').encode('utf-8')
+            if admin_token is None or not hmac.compare_digest(supplied, f"Bearer {admin_token}".encode('utf-8')):
+                abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+def cached_response(ttl):
+    """
+    Serve a read endpoint from the response cache for up to ttl seconds.
+    
+    The key is the endpoint, its URL arguments and the query parameters
+    (sorted, empty values dropped), and entries are tied to the catalog
+    revision set by conditional_response, so this goes underneath it.
+    Only 200 responses are stored, and none from a stale index snapshot.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            revision = g.catalog_revision
+            params = tuple(sorted(
+                (key, value) for key, value in request.args.items(multi=True) if value != ''
+            ))
+            key = (request.endpoint, tuple(sorted(kwargs.items())), params)
+            
+            entry = response_cache.get(key, revision)
+            if entry is not None:
+                response = app.response_class(entry.body, status=entry.status, mimetype=entry.mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+            
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed and not g.get('stale_snapshot'):
+                response_cache.put(key, revision, response.get_data(), response.status_code,
+                                   response.mimetype, ttl)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        
+        return wrapper
+    return decorator
+
+def snapshot_connection():
+    """A connection of its own for rebuilding an in-memory index in the background"""
+    return db_tuning.connect(pool.database, pool.profile)
 
 def dict_from_row(row):
     """Convert sqlite3.Row to dictionary"""
-    return {key: row[key] for key in row.keys()}
+    return dict(zip(row.keys(), row))
+
+# json: a list of objects; compact: column names once, rows as arrays
+RESPONSE_FORMATS = ['json', 'compact']
+
+def parse_fields(value):
+    """
+    Parse the fields= parameter into a list of product columns.
+    
+    Returns None (all columns) when absent; unknown names are a 400. The id
+    is always included since it identifies the row.
+    """
+    if not value:
+        return None
+    
+    fields = ['id']
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in PRODUCT_FIELDS:
+            abort(400)
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+def format_product_rows(rows, output_fields, response_format):
+    """Render listing rows as objects, or as columns plus row arrays for compact"""
+    if response_format == 'compact':
+        return {
+            'columns': output_fields,
+            'rows': [[row[name] for name in output_fields] for row in rows]
+        }
+    return {'products': [{name: row[name] for name in output_fields} for row in rows]}
+
+def encode_cursor(sort_by, sort_order, direction, row):
+    """Encode an opaque keyset cursor for the (sort_by value, id) of a row"""
+    payload = [sort_by, sort_order, direction, row[sort_by], row['id']]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Decode a keyset cursor, returning None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_by, sort_order, direction, value, row_id = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    
+    if (sort_by not in VALID_SORT_FIELDS or sort_order not in ('asc', 'desc')
+            or direction not in ('next', 'prev')):
+        return None
+    # Both are bound as SQL parameters; JSON true/false would pass as int
+    if (not isinstance(value, (str, int, float)) or isinstance(value, bool)
+            or not isinstance(row_id, int) or isinstance(row_id, bool)):
+        return None
+    
+    return {
+        'sort_by': sort_by,
+        'sort_order': sort_order,
+        'direction': direction,
+        'value': value,
+        'id': row_id
+    }
+
+def resolve_listing_cursor(args, sort_by, sort_order):
+    """
+    Read the cursor/after parameter of a listing request.
+    
+    Returns (keyset, sort_by, sort_order). A cursor carries the sort it was
+    issued for, so it decides the sort unless the caller asks for a
+    different one explicitly, which is rejected with 400.
+    """
+    token = args.get('cursor') or args.get('after')
+    if not token:
+        return None, sort_by, sort_order
+    
+    keyset = decode_cursor(token)
+    if keyset is None:
+        abort(400)
+    
+    if 'sort_by' in args and args['sort_by'] != keyset['sort_by']:
+        abort(400)
+    if 'sort_order' in args and args['sort_order'] != keyset['sort_order']:
+        abort(400)
+    
+    return keyset, keyset['sort_by'], keyset['sort_order']
+
+def get_search_backend():
+    """Use the FTS5 index for search when the database has one, LIKE otherwise"""
+    backend = _search_backends.get(pool.database)
+    if backend is None:
+        with pool.connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+            ).fetchone()
+        backend = 'fts5' if row else 'like'
+        _search_backends[pool.database] = backend
+    return backend
+
+def build_keyset_pagination(rows, limit, keyset):
+    """
+    Trim a limit+1 keyset fetch and work out the pagination links.
+    
+    Returns (rows, has_next, has_prev) with rows in display order.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if keyset['direction'] == 'prev':
+        rows.reverse()
+        return rows, True, has_more
+    return rows, has_more, True
+
+def lookup_total_count(conn, count_mode, count_key, filters):
+    """
+    Answer total_count for a listing without counting, if possible.
+    
+    Returns (total_count, needs_count). count=none needs nothing, a cached
+    exact count answers exact and estimate, and count=estimate falls back
+    to the catalog statistics. When needs_count is True the listing query
+    counts and the result goes to store_total_count.
+    """
+    if count_mode == 'none':
+        return None, False
+    
+    total_count = count_cache.get(_count_cache_key(count_key))
+    if total_count is not None:
+        return total_count, False
+    
+    if count_mode == 'estimate':
+        estimate = catalog_stats.estimate(conn, filters, g.get('catalog_revision'))
+        if estimate is not None:
+            return estimate, False
+    
+    return None, True
+
+def store_total_count(count_key, total_count):
+    """Cache an exact count from a listing query"""
+    count_cache.put(_count_cache_key(count_key), total_count)
+
+def _count_cache_key(count_key):
+    # Keyed by catalog revision so a catalog change never serves a stale count
+    return (g.get('catalog_revision'),) + count_key
+
+def split_listing_rows(cursor, source):
+    """
+    Separate the metadata row of a listing statement from its page rows.
+    
+    Returns (meta, rows) with the page rows as dicts in page order.
+    """
+    meta_columns = query_builder.LISTING_META_COLUMNS[source]
+    start = 1 + len(meta_columns)
+    columns = column_names(cursor)[start:]
+    rows = cursor.fetchall()
+    # The metadata row sorts first, even for an empty page
+    meta = dict(zip(meta_columns, rows[0][1:start]))
+    return meta, rows_to_dicts(columns, (row[start:] for row in rows[1:]))
+
+MAX_BATCH_IDS = 500
+
+def parse_product_ids(raw_ids):
+    """
+    Validate the IDs of a batch lookup, aborting with 400 if any is invalid.
+    
+    Accepts integers or strings of ASCII digits; duplicates are dropped
+    while the caller's order is kept.
+    """
+    if not isinstance(raw_ids, list) or not raw_ids or len(raw_ids) > MAX_BATCH_IDS:
+        abort(400)
+    
+    product_ids = []
+    seen = set()
+    for raw_id in raw_ids:
+        # isdigit() alone would let through digits int() rejects, like '²'
+        if isinstance(raw_id, str) and raw_id.strip().isascii() and raw_id.strip().isdecimal():
+            product_id = int(raw_id)
+        elif isinstance(raw_id, int) and not isinstance(raw_id, bool):
+            product_id = raw_id
+        else:
+            abort(400)
+        
+        if product_id <= 0:
+            abort(400)
+        if product_id not in seen:
+            seen.add(product_id)
+            product_ids.append(product_id)
+    
+    return product_ids
+
+def batch_products_response(product_ids):
+    """Look up many products with one IN query, in the caller's order"""
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(*query_builder.batch_sql(product_ids))
+            rows_by_id = {row['id']: row for row in fetch_dicts(cursor)}
+        
+        products_list = [rows_by_id[product_id]
+                         for product_id in product_ids if product_id in rows_by_id]
+        missing_ids = [product_id for product_id in product_ids if product_id not in rows_by_id]
+        
+        return jsonify({
+            'products': products_list,
+            'missing_ids': missing_ids,
+            'requested_count': len(product_ids)
+        })
+        
+    except sqlite3.Error as e:
+        logger.error(f"Database error in batch product lookup: {e}")
+        abort(500)
+    except Exception as e:
+        logger.error(f"Error in batch product lookup: {e}")
+        abort(500)
+
+def cursor_links(rows, has_next, has_prev, sort_by, sort_order):
+    """next_cursor/prev_cursor values for a page of rows"""
+    next_cursor = None
+    prev_cursor = None
+    if sort_by not in VALID_SORT_FIELDS:
+        # Relevance order has no stable keyset; use page numbers instead
+        return next_cursor, prev_cursor
+    if rows and has_next:
+        next_cursor = encode_cursor(sort_by, sort_order, 'next', rows[-1])
+    if rows and has_prev:
+        prev_cursor = encode_cursor(sort_by, sort_order, 'prev', rows[0])
+    return next_cursor, prev_cursor
 
 @app.errorhandler(404)
 def not_found(error):
@@ -56,6 +484,15 @@ def bad_request(error):
         'status_code': 400
     }), 400
 
+@app.errorhandler(403)
+def forbidden(error):
+    """Handle 403 errors"""
+    return jsonify({
+        'error': 'Forbidden',
+        'message': 'This route is only available locally or with the admin token',
+        'status_code': 403
+    }), 403
+
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
@@ -65,6 +502,15 @@ def internal_error(error):
         'status_code': 500
     }), 500
 
+@app.errorhandler(503)
+def service_unavailable(error):
+    """Handle 503 errors"""
+    return jsonify({
+        'error': 'Service Unavailable',
+        'message': 'The server is busy, please retry shortly',
+        'status_code': 503
+    }), 503, {'Retry-After': '1'}
+
 @app.route('/')
 def index():
     """API welcome endpoint"""
@@ -74,8 +520,14 @@ def index():
         'endpoints': {
             'GET /api/products': 'List all products (with pagination)',
             'GET /api/products/{id}': 'Get a specific product by ID',
+            'POST /api/products/batch': 'Get up to 500 products by ID in one request',
+            'GET /api/products/export': 'Stream all matching products as NDJSON or CSV',
             'GET /api/products/stats': 'Get product statistics',
-            'GET /health': 'API health check'
+            'GET /api/products/facets': 'Result counts per category, brand, department and price range',
+            'GET /api/products/suggest': 'Typeahead suggestions of product names, brands and categories',
+            'GET /health': 'API health check',
+            'GET /metrics': 'Per-route request metrics in the Prometheus text format',
+            'GET /api/admin/slow-queries': 'Recent slow SQL statements with their query plans'
         },
         'timestamp': datetime.now().isoformat()
     })
@@ -83,52 +535,106 @@ def index():
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    conn = get_db_connection()
-    if conn:
-        try:
+    try:
+        with pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM products")
             product_count = cursor.fetchone()[0]
-            conn.close()
-            
-            return jsonify({
-                'status': 'healthy',
-                'database': 'connected',
-                'product_count': product_count,
-                'timestamp': datetime.now().isoformat()
-            })
-        except Exception as e:
-            return jsonify({
-                'status': 'unhealthy',
-                'database': 'error',
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
-            }), 500
-    else:
+            database_settings = db_tuning.current_settings(conn)
+        
+        return jsonify({
+            'status': 'healthy',
+            'database': 'connected',
+            'product_count': product_count,
+            'pool': pool.stats(),
+            'export_pool': export_pool.stats(),
+            'database_settings': database_settings,
+            'json_backend': json_backend,
+            'columnar_index': columnar_index.stats() if columnar_index is not None else None,
+            'suggest_index': suggest_index.stats(),
+            'access_log': access_log.stats() if access_log is not None else None,
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
         return jsonify({
             'status': 'unhealthy',
-            'database': 'disconnected',
+            'database': 'error',
+            'error': str(e),
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/cache/stats')
+@admin_only
+def cache_stats():
+    """Hit/miss/eviction counters of the in-process caches for monitoring"""
+    return jsonify({
+        'responses': response_cache.stats(),
+        'counts': {
+            'hits': count_cache.hits,
+            'misses': count_cache.misses
+        },
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/metrics')
+@admin_only
+def get_metrics():
+    """Request metrics of this worker in the Prometheus text format"""
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/admin/slow-queries', methods=['GET', 'DELETE'])
+@admin_only
+def get_slow_queries():
+    """
+    GET /api/admin/slow-queries - Recent statements over the slow query threshold
+    DELETE /api/admin/slow-queries - Empty the buffer (the JSONL file is kept)
+    
+    Query Parameters:
+    - limit: Number of entries, newest first (default: 50)
+    """
+    if request.method == 'DELETE':
+        slow_query_log.clear()
+        return jsonify({'settings': slow_query_log.stats()})
+    
+    limit = request.args.get('limit', 50, type=int)
+    if limit < 1:
+        abort(400)
+    return jsonify({
+        'slow_queries': slow_query_log.entries(limit),
+        'settings': slow_query_log.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/products', methods=['GET'])
+@conditional_response
+@cached_response(ttl=60)
 def get_products():
     """
     GET /api/products - List all products with pagination and filtering
     
     Query Parameters:
     - page: Page number (default: 1)
+    - cursor / after: Opaque keyset cursor from a previous response (replaces page)
     - limit: Items per page (default: 20, max: 100)
     - category: Filter by category
     - department: Filter by department (Men/Women)
     - brand: Filter by brand
     - min_price: Minimum retail price
     - max_price: Maximum retail price
-    - search: Search in product name
-    - sort_by: Sort by field (name, price, cost, brand)
+    - search: Full-text search in product name, brand and category (prefix matching)
+    - sort_by: Sort by field (name, price, cost, brand, or relevance when searching)
     - sort_order: Sort order (asc, desc)
+    - count: Total count strategy (exact, estimate, none; default: exact)
+    - fields: Comma-separated product columns to return (default: all; id is always included)
+    - format: Response format (json, compact; default: json)
+    - ids: Comma-separated product IDs (max 500); returns those products instead of a listing
     """
     
+    # Batch lookup by ID instead of a listing
+    if 'ids' in request.args:
+        raw_ids = [value for value in request.args['ids'].split(',') if value.strip()]
+        return batch_products_response(parse_product_ids(raw_ids))
+    
     # Get query parameters
     page = request.args.get('page', 1, type=int)
     limit = min(request.args.get('limit', 20, type=int), 100)  # Max 100 items per page
@@ -138,105 +644,113 @@ def get_products():
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
     search = request.args.get('search')
-    sort_by = request.args.get('sort_by', 'id')
+    sort_by = request.args.get('sort_by', 'relevance' if search else 'id')
     sort_order = request.args.get('sort_order', 'asc')
+    count_mode = request.args.get('count', 'exact')
+    fields = parse_fields(request.args.get('fields'))
+    response_format = request.args.get('format', 'json')
     
     # Validate parameters
     if page < 1:
         abort(400)
     
-    valid_sort_fields = ['id', 'name', 'retail_price', 'cost', 'brand', 'category']
-    if sort_by not in valid_sort_fields:
+    if sort_by == 'relevance':
+        # Ranking needs the FTS5 index; LIKE search keeps the id order
+        if not search or get_search_backend() != 'fts5' or not build_fts_query(search):
+            sort_by = 'id'
+    elif sort_by not in VALID_SORT_FIELDS:
         sort_by = 'id'
     
     if sort_order not in ['asc', 'desc']:
         sort_order = 'asc'
     
-    conn = get_db_connection()
-    if not conn:
-        abort(500)
+    if count_mode not in COUNT_MODES:
+        count_mode = 'exact'
+    
+    if response_format not in RESPONSE_FORMATS:
+        response_format = 'json'
+    
+    keyset, sort_by, sort_order = resolve_listing_cursor(request.args, sort_by, sort_order)
     
     try:
-        cursor = conn.cursor()
-        
-        # Build the query
-        where_conditions = []
-        params = []
-        
-        if category:
-            where_conditions.append("category = ?")
-            params.append(category)
-        
-        if department:
-            where_conditions.append("department = ?")
-            params.append(department)
-        
-        if brand:
-            where_conditions.append("brand = ?")
-            params.append(brand)
-        
-        if min_price is not None:
-            where_conditions.append("retail_price >= ?")
-            params.append(min_price)
-        
-        if max_price is not None:
-            where_conditions.append("retail_price <= ?")
-            params.append(max_price)
-        
-        if search:
-            where_conditions.append("name LIKE ?")
-            params.append(f"%{search}%")
-        
-        # Build WHERE clause
-        where_clause = ""
-        if where_conditions:
-            where_clause = "WHERE " + " AND ".join(where_conditions)
-        
-        # Count total records for pagination
-        count_query = f"""
-            SELECT COUNT(*) 
-            FROM products p
-            LEFT JOIN departments d ON p.department_id = d.id
-            {where_clause}
-        """
-        cursor.execute(count_query, params)
-        total_count = cursor.fetchone()[0]
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Canonical filter shape; its SQL is compiled once and reused
+            count_filters = {
+                'category': category,
+                'department': department,
+                'brand': brand,
+                'min_price': min_price,
+                'max_price': max_price,
+                'search': search
+            }
+            selected, output_fields = query_builder.select_columns(fields, sort_by)
+            
+            if (columnar_index is not None and columnar_index.supports(count_filters, sort_by, keyset)
+                    and columnar_index.ensure_current(conn, g.get('catalog_revision'), snapshot_connection)):
+                # Plain filter/sort listings are answered from the in-memory
+                # index, unless it is being rebuilt after a catalog change
+                total_count, products = columnar_index.query(count_filters, sort_by, sort_order,
+                                                             (page - 1) * limit, limit + 1, selected)
+                if count_mode == 'none':
+                    total_count = None
+                needs_count = False
+            else:
+                shape, params = query_builder.bind_filters(count_filters, get_search_backend() == 'fts5')
+                
+                # A cached or estimated total spares the count
+                count_key = ('products', tuple(count_filters.items()))
+                total_count, needs_count = lookup_total_count(conn, count_mode, count_key, count_filters)
+                
+                if keyset:
+                    # Seek past the cursor position instead of skipping rows
+                    seek = keyset['direction']
+                    page_params = query_builder.seek_params(sort_by, keyset) + [limit + 1]
+                else:
+                    seek = None
+                    page_params = [limit + 1, (page - 1) * limit]
+                
+                # The page and its total count come back from one statement
+                query = query_builder.listing_sql('products', shape, selected, sort_by, sort_order,
+                                                  seek, needs_count)
+                
+                # Tuples zipped with the column list are cheaper than sqlite3.Row
+                cursor.row_factory = None
+                cursor.execute(query, query_builder.listing_params(params, page_params, needs_count))
+                meta, products = split_listing_rows(cursor, 'products')
+        
+        if needs_count:
+            total_count = meta['total_count']
+            store_total_count(count_key, total_count)
         
         # Calculate pagination info
-        total_pages = math.ceil(total_count / limit)
-        offset = (page - 1) * limit
-        
-        # Build main query with sorting, pagination, and department join
-        query = f"""
-            SELECT p.id, p.cost, p.category, p.name, p.brand, p.retail_price, 
-                   p.department, p.sku, p.distribution_center_id, p.created_at,
-                   d.name as department_name, d.description as department_description
-            FROM products p
-            LEFT JOIN departments d ON p.department_id = d.id
-            {where_clause}
-            ORDER BY p.{sort_by} {sort_order.upper()}
-            LIMIT ? OFFSET ?
-        """
-        
-        params.extend([limit, offset])
-        cursor.execute(query, params)
-        products = cursor.fetchall()
-        
-        # Convert to list of dictionaries
-        products_list = [dict_from_row(product) for product in products]
+        total_pages = math.ceil(total_count / limit) if total_count is not None else None
+        
+        if keyset:
+            products, has_next, has_prev = build_keyset_pagination(products, limit, keyset)
+        else:
+            # One extra row tells us whether another page exists
+            has_next = len(products) > limit
+            products = products[:limit]
+            has_prev = page > 1
+        next_cursor, prev_cursor = cursor_links(products, has_next, has_prev, sort_by, sort_order)
         
         # Build response
         response = {
-            'products': products_list,
+            **format_product_rows(products, output_fields, response_format),
             'pagination': {
-                'page': page,
+                'page': None if keyset else page,
                 'limit': limit,
                 'total_count': total_count,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1,
-                'next_page': page + 1 if page < total_pages else None,
-                'prev_page': page - 1 if page > 1 else None
+                'has_next': has_next,
+                'has_prev': has_prev,
+                'next_page': page + 1 if not keyset and has_next else None,
+                'prev_page': page - 1 if not keyset and has_prev else None,
+                'next_cursor': next_cursor,
+                'prev_cursor': prev_cursor,
+                'count_mode': count_mode
             },
             'filters': {
                 'category': category,
@@ -250,19 +764,154 @@ def get_products():
             }
         }
         
-        conn.close()
         return jsonify(response)
         
     except sqlite3.Error as e:
         logger.error(f"Database error in get_products: {e}")
-        conn.close()
         abort(500)
     except Exception as e:
         logger.error(f"Error in get_products: {e}")
-        conn.close()
         abort(500)
 
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+EXPORT_BATCH_SIZE = 500
+
+def export_rows(cursor, export_format):
+    """Yield the export body one fetchmany batch at a time"""
+    try:
+        columns = column_names(cursor)
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+        
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            if export_format == 'csv':
+                writer.writerows(rows)
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield b"".join(serialization.dumps(row) + b"\n" for row in rows_to_dicts(columns, rows))
+            
+        if export_format == 'csv' and buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    except sqlite3.Error as e:
+        # Headers are already sent; the truncated body is all we can signal
+        logger.error(f"Database error during product export: {e}")
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/products/export', methods=['GET'])
+@conditional_response
+def export_products():
+    """
+    GET /api/products/export - Stream every matching product as NDJSON or CSV
+    
+    Query Parameters:
+    - format: ndjson (default) or csv
+    - category, department, brand, min_price, max_price, search: Same filters as /api/products
+    
+    Rows are read from a single cursor and streamed in batches, gzip-compressed
+    when the client accepts it. There is no ORDER BY: sorting would buffer every
+    matching row, so rows come in index order (id order when unfiltered). The
+    cursor's connection comes from export_pool; 503 when all of them are busy.
+    """
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    
+    category = request.args.get('category')
+    department = request.args.get('department')
+    brand = request.args.get('brand')
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    search = request.args.get('search')
+    
+    pooled = None
+    try:
+        pooled = export_pool.acquire()
+        cursor = pooled.conn.cursor()
+        
+        shape, params = query_builder.bind_filters({
+            'category': category,
+            'department': department,
+            'brand': brand,
+            'min_price': min_price,
+            'max_price': max_price,
+            'search': search
+        }, get_search_backend() == 'fts5')
+        
+        # Plain tuples; the column names come from cursor.description
+        cursor.row_factory = None
+        cursor.execute(query_builder.export_sql(shape), params)
+    except PoolTimeout:
+        logger.warning(f"Export rejected: all {export_pool.max_size} export connections are busy")
+        abort(503)
+    except sqlite3.Error as e:
+        if pooled is not None:
+            export_pool.release(pooled)
+        logger.error(f"Database error in export_products: {e}")
+        abort(500)
+    except Exception as e:
+        if pooled is not None:
+            export_pool.release(pooled)
+        logger.error(f"Error in export_products: {e}")
+        abort(500)
+    
+    body = export_rows(cursor, export_format)
+    if 'gzip' in request.accept_encodings:
+        body = gzip_chunks(body)
+    response = Response(body, mimetype=EXPORT_FORMATS[export_format])
+    if 'gzip' in request.accept_encodings:
+        response.headers['Content-Encoding'] = 'gzip'
+    
+    # The connection stays checked out until the body is sent or the client
+    # goes away, so memory use does not grow with the size of the export
+    def release_connection():
+        cursor.close()
+        export_pool.release(pooled)
+    response.call_on_close(release_connection)
+    response.vary.add('Accept-Encoding')
+    response.headers['Content-Disposition'] = f'attachment; filename=products.{export_format}'
+    return response
+
+@app.route('/api/products/batch', methods=['POST'])
+def get_products_batch():
+    """
+    POST /api/products/batch - Get many products by ID in one request
+    
+    JSON Body:
+    - ids: List of product IDs (max 500)
+    
+    Products come back in the order requested, with the same fields as
+    GET /api/products/{id}; IDs that do not exist are listed in missing_ids.
+    """
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        abort(400)
+    
+    return batch_products_response(parse_product_ids(payload.get('ids')))
+
 @app.route('/api/products/<int:product_id>', methods=['GET'])
+@conditional_response
+@cached_response(ttl=300)
 def get_product(product_id):
     """
     GET /api/products/{id} - Get a specific product by ID
@@ -271,132 +920,212 @@ def get_product(product_id):
     if product_id <= 0:
         abort(400)
     
-    conn = get_db_connection()
-    if not conn:
-        abort(500)
-    
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.id, p.cost, p.category, p.name, p.brand, p.retail_price, 
-                   p.department, p.sku, p.distribution_center_id, p.created_at,
-                   d.name as department_name, d.description as department_description
-            FROM products p
-            LEFT JOIN departments d ON p.department_id = d.id
-            WHERE p.id = ?
-        """, (product_id,))
-        
-        product = cursor.fetchone()
-        conn.close()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT p.id, p.cost, p.category, p.name, p.brand, p.retail_price, 
+                       p.department, p.sku, p.distribution_center_id, p.created_at,
+                       d.name as department_name, d.description as department_description
+                FROM products p
+                LEFT JOIN departments d ON p.department_id = d.id
+                WHERE p.id = ?
+            """, (product_id,))
         
-        if product is None:
-            return jsonify({
-                'error': 'Product not found',
-                'message': f'Product with ID {product_id} does not exist',
-                'product_id': product_id
-            }), 404
+            product = cursor.fetchone()
         
-        return jsonify({
-            'product': dict_from_row(product)
-        })
+            if product is None:
+                return jsonify({
+                    'error': 'Product not found',
+                    'message': f'Product with ID {product_id} does not exist',
+                    'product_id': product_id
+                }), 404
+        
+            return jsonify({
+                'product': dict_from_row(product)
+            })
         
     except sqlite3.Error as e:
         logger.error(f"Database error in get_product: {e}")
-        conn.close()
         abort(500)
     except Exception as e:
         logger.error(f"Error in get_product: {e}")
-        conn.close()
         abort(500)
 
 @app.route('/api/products/stats', methods=['GET'])
+@conditional_response
+@cached_response(ttl=300)
 def get_product_stats():
     """
     GET /api/products/stats - Get product statistics
     """
     
-    conn = get_db_connection()
-    if not conn:
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+        
+            # All figures come from the summary tables kept current by triggers
+            # (see migrations.migration_003_product_stats)
+            
+            # Overall statistics
+            cursor.execute("""
+                SELECT 
+                    product_count as total_products,
+                    min_price,
+                    max_price,
+                    price_sum / NULLIF(product_count, 0) as avg_price,
+                    min_cost,
+                    max_cost,
+                    cost_sum / NULLIF(product_count, 0) as avg_cost
+                FROM product_stats_overall
+            """)
+            overall_stats = dict_from_row(cursor.fetchone())
+            
+            # Department statistics
+            cursor.execute("""
+                SELECT d.name as department, d.description, 
+                       COALESCE(s.product_count, 0) as count,
+                       s.price_sum / s.product_count as avg_price
+                FROM departments d
+                LEFT JOIN product_stats_by_department s ON s.department_id = d.id
+                ORDER BY count DESC, d.id
+            """)
+            dept_stats = fetch_dicts(cursor)
+            
+            # Category statistics (top 10)
+            cursor.execute("""
+                SELECT category, product_count as count, price_sum / product_count as avg_price
+                FROM product_stats_by_category 
+                ORDER BY product_count DESC, category 
+                LIMIT 10
+            """)
+            category_stats = fetch_dicts(cursor)
+            
+            # Brand statistics (top 10)
+            cursor.execute("""
+                SELECT brand, product_count as count, price_sum / product_count as avg_price
+                FROM product_stats_by_brand 
+                ORDER BY product_count DESC, brand 
+                LIMIT 10
+            """)
+            brand_stats = fetch_dicts(cursor)
+            
+            # Distribution center statistics
+            cursor.execute("""
+                SELECT distribution_center_id, product_count as count
+                FROM product_stats_by_distribution_center 
+                ORDER BY distribution_center_id
+            """)
+            dist_center_stats = fetch_dicts(cursor)
+        
+            return jsonify({
+                'overall': overall_stats,
+                'by_department': dept_stats,
+                'top_categories': category_stats,
+                'top_brands': brand_stats,
+                'distribution_centers': dist_center_stats,
+                'timestamp': datetime.now().isoformat()
+            })
+        
+    except sqlite3.Error as e:
+        logger.error(f"Database error in get_product_stats: {e}")
         abort(500)
+    except Exception as e:
+        logger.error(f"Error in get_product_stats: {e}")
+        abort(500)
+
+@app.route('/api/products/facets', methods=['GET'])
+@conditional_response
+@cached_response(ttl=60)
+def get_product_facets():
+    """
+    GET /api/products/facets - Result counts per category, brand, department and price bucket
+    
+    Query Parameters:
+    - category, department, brand, min_price, max_price, search: Same filters as /api/products
+    - limit: Values per facet, by descending count (default: 20, max: 100)
+    
+    Each facet is counted with every filter except its own, so the counts
+    show what picking a different value would return.
+    """
+    
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    if limit < 1:
+        abort(400)
+    
+    filters = {
+        'category': request.args.get('category'),
+        'department': request.args.get('department'),
+        'brand': request.args.get('brand'),
+        'min_price': request.args.get('min_price', type=float),
+        'max_price': request.args.get('max_price', type=float),
+        'search': request.args.get('search')
+    }
     
     try:
-        cursor = conn.cursor()
-        
-        # Overall statistics
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_products,
-                MIN(retail_price) as min_price,
-                MAX(retail_price) as max_price,
-                AVG(retail_price) as avg_price,
-                MIN(cost) as min_cost,
-                MAX(cost) as max_cost,
-                AVG(cost) as avg_cost
-            FROM products
-        """)
-        overall_stats = dict_from_row(cursor.fetchone())
-        
-        # Department statistics
-        cursor.execute("""
-            SELECT d.name as department, d.description, 
-                   COUNT(p.id) as count, AVG(p.retail_price) as avg_price
-            FROM departments d
-            LEFT JOIN products p ON d.id = p.department_id
-            GROUP BY d.id, d.name, d.description
-            ORDER BY count DESC
-        """)
-        dept_stats = [dict_from_row(row) for row in cursor.fetchall()]
-        
-        # Category statistics (top 10)
-        cursor.execute("""
-            SELECT category, COUNT(*) as count, AVG(retail_price) as avg_price
-            FROM products 
-            GROUP BY category 
-            ORDER BY count DESC 
-            LIMIT 10
-        """)
-        category_stats = [dict_from_row(row) for row in cursor.fetchall()]
-        
-        # Brand statistics (top 10)
-        cursor.execute("""
-            SELECT brand, COUNT(*) as count, AVG(retail_price) as avg_price
-            FROM products 
-            GROUP BY brand 
-            ORDER BY count DESC 
-            LIMIT 10
-        """)
-        brand_stats = [dict_from_row(row) for row in cursor.fetchall()]
-        
-        # Distribution center statistics
-        cursor.execute("""
-            SELECT distribution_center_id, COUNT(*) as count
-            FROM products 
-            GROUP BY distribution_center_id 
-            ORDER BY distribution_center_id
-        """)
-        dist_center_stats = [dict_from_row(row) for row in cursor.fetchall()]
-        
-        conn.close()
+        with pool.connection() as conn:
+            if (columnar_index is not None and columnar_index.supports(filters)
+                    and columnar_index.ensure_current(conn, g.get('catalog_revision'), snapshot_connection)):
+                # Bitmask counts over the in-memory index
+                total_count, counts = columnar_index.facet_counts(filters)
+            else:
+                # One grouped scan, combined per facet in Python
+                total_count, counts = count_facets(conn, filters, get_search_backend() == 'fts5')
         
         return jsonify({
-            'overall': overall_stats,
-            'by_department': dept_stats,
-            'top_categories': category_stats,
-            'top_brands': brand_stats,
-            'distribution_centers': dist_center_stats,
-            'timestamp': datetime.now().isoformat()
+            'facets': format_facets(counts, limit),
+            'total_count': total_count,
+            'filters': filters
         })
         
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_product_stats: {e}")
-        conn.close()
+        logger.error(f"Database error in get_product_facets: {e}")
         abort(500)
     except Exception as e:
-        logger.error(f"Error in get_product_stats: {e}")
-        conn.close()
+        logger.error(f"Error in get_product_facets: {e}")
+        abort(500)
+
+@app.route('/api/products/suggest', methods=['GET'])
+@conditional_response
+def get_product_suggestions():
+    """
+    GET /api/products/suggest - Typeahead suggestions for the search box
+    
+    Query Parameters:
+    - q: Text typed so far (required, at most 100 characters)
+    - limit: Number of suggestions (default: 8, max: 20)
+    
+    Product names, brands and categories with a word starting with q, those
+    carried by the most products first. Served from the in-memory prefix
+    index, so no query runs unless the catalog has changed.
+    """
+    
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', DEFAULT_SUGGESTIONS, type=int), MAX_SUGGESTIONS)
+    if not query or len(query) > 100 or limit < 1:
+        abort(400)
+    
+    try:
+        with pool.connection() as conn:
+            if not suggest_index.ensure_current(conn, g.get('catalog_revision'), snapshot_connection):
+                # The previous snapshot answers while the new one is built
+                g.stale_snapshot = True
+    
+        return jsonify({
+            'query': query,
+            'suggestions': suggest_index.suggest(query, limit)
+        })
+    
+    except sqlite3.Error as e:
+        logger.error(f"Database error in get_product_suggestions: {e}")
+        abort(500)
+    except Exception as e:
+        logger.error(f"Error in get_product_suggestions: {e}")
         abort(500)
 
 @app.route('/api/departments', methods=['GET'])
+@conditional_response
+@cached_response(ttl=300)
 def get_departments():
     """
     GET /api/departments - List all departments
@@ -404,52 +1133,45 @@ def get_departments():
     Returns all departments with their product counts and basic statistics.
     """
     
-    conn = get_db_connection()
-    if not conn:
-        abort(500)
-    
     try:
-        cursor = conn.cursor()
-        
-        # Get all departments with product counts and statistics
-        cursor.execute("""
-            SELECT 
-                d.id,
-                d.name,
-                d.description,
-                d.created_at,
-                COUNT(p.id) as product_count,
-                AVG(p.retail_price) as avg_price,
-                MIN(p.retail_price) as min_price,
-                MAX(p.retail_price) as max_price
-            FROM departments d
-            LEFT JOIN products p ON d.id = p.department_id
-            GROUP BY d.id, d.name, d.description, d.created_at
-            ORDER BY product_count DESC
-        """)
-        
-        departments = cursor.fetchall()
-        conn.close()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
         
-        # Convert to list of dictionaries
-        departments_list = [dict_from_row(dept) for dept in departments]
+            # Get all departments with product counts and statistics
+            cursor.execute("""
+                SELECT 
+                    d.id,
+                    d.name,
+                    d.description,
+                    d.created_at,
+                    COALESCE(s.product_count, 0) as product_count,
+                    s.price_sum / s.product_count as avg_price,
+                    s.min_price,
+                    s.max_price
+                FROM departments d
+                LEFT JOIN product_stats_by_department s ON s.department_id = d.id
+                ORDER BY product_count DESC, d.id
+            """)
         
-        return jsonify({
-            'departments': departments_list,
-            'total_departments': len(departments_list),
-            'timestamp': datetime.now().isoformat()
-        })
+            # Convert to list of dictionaries
+            departments_list = fetch_dicts(cursor)
+        
+            return jsonify({
+                'departments': departments_list,
+                'total_departments': len(departments_list),
+                'timestamp': datetime.now().isoformat()
+            })
         
     except sqlite3.Error as e:
         logger.error(f"Database error in get_departments: {e}")
-        conn.close()
         abort(500)
     except Exception as e:
         logger.error(f"Error in get_departments: {e}")
-        conn.close()
         abort(500)
 
 @app.route('/api/departments/<int:department_id>', methods=['GET'])
+@conditional_response
+@cached_response(ttl=300)
 def get_department(department_id):
     """
     GET /api/departments/{id} - Get specific department details
@@ -460,103 +1182,101 @@ def get_department(department_id):
     if department_id <= 0:
         abort(400)
     
-    conn = get_db_connection()
-    if not conn:
-        abort(500)
-    
     try:
-        cursor = conn.cursor()
-        
-        # Get department details with statistics
-        cursor.execute("""
-            SELECT 
-                d.id,
-                d.name,
-                d.description,
-                d.created_at,
-                COUNT(p.id) as product_count,
-                AVG(p.retail_price) as avg_price,
-                MIN(p.retail_price) as min_price,
-                MAX(p.retail_price) as max_price,
-                AVG(p.cost) as avg_cost
-            FROM departments d
-            LEFT JOIN products p ON d.id = p.department_id
-            WHERE d.id = ?
-            GROUP BY d.id, d.name, d.description, d.created_at
-        """, (department_id,))
-        
-        department = cursor.fetchone()
-        
-        if department is None:
-            conn.close()
-            return jsonify({
-                'error': 'Department not found',
-                'message': f'Department with ID {department_id} does not exist',
-                'department_id': department_id
-            }), 404
+        with pool.connection() as conn:
+            cursor = conn.cursor()
         
-        # Get top categories in this department
-        cursor.execute("""
-            SELECT category, COUNT(*) as count, AVG(retail_price) as avg_price
-            FROM products p
-            JOIN departments d ON p.department_id = d.id
-            WHERE d.id = ?
-            GROUP BY category
-            ORDER BY count DESC
-            LIMIT 5
-        """, (department_id,))
-        
-        top_categories = [dict_from_row(row) for row in cursor.fetchall()]
-        
-        # Get top brands in this department
-        cursor.execute("""
-            SELECT brand, COUNT(*) as count, AVG(retail_price) as avg_price
-            FROM products p
-            JOIN departments d ON p.department_id = d.id
-            WHERE d.id = ?
-            GROUP BY brand
-            ORDER BY count DESC
-            LIMIT 5
-        """, (department_id,))
-        
-        top_brands = [dict_from_row(row) for row in cursor.fetchall()]
+            # Get department details with statistics
+            cursor.execute("""
+                SELECT 
+                    d.id,
+                    d.name,
+                    d.description,
+                    d.created_at,
+                    COALESCE(s.product_count, 0) as product_count,
+                    s.price_sum / s.product_count as avg_price,
+                    s.min_price,
+                    s.max_price,
+                    s.cost_sum / s.product_count as avg_cost
+                FROM departments d
+                LEFT JOIN product_stats_by_department s ON s.department_id = d.id
+                WHERE d.id = ?
+            """, (department_id,))
         
-        conn.close()
+            department = cursor.fetchone()
         
-        # Build response
-        department_data = dict_from_row(department)
-        department_data['top_categories'] = top_categories
-        department_data['top_brands'] = top_brands
+            if department is None:
+                return jsonify({
+                    'error': 'Department not found',
+                    'message': f'Department with ID {department_id} does not exist',
+                    'department_id': department_id
+                }), 404
         
-        return jsonify({
-            'department': department_data,
-            'timestamp': datetime.now().isoformat()
-        })
+            # Get top categories in this department
+            cursor.execute("""
+                SELECT category, COUNT(*) as count, AVG(retail_price) as avg_price
+                FROM products p
+                JOIN departments d ON p.department_id = d.id
+                WHERE d.id = ?
+                GROUP BY category
+                ORDER BY count DESC
+                LIMIT 5
+            """, (department_id,))
+        
+            top_categories = fetch_dicts(cursor)
+        
+            # Get top brands in this department
+            cursor.execute("""
+                SELECT brand, COUNT(*) as count, AVG(retail_price) as avg_price
+                FROM products p
+                JOIN departments d ON p.department_id = d.id
+                WHERE d.id = ?
+                GROUP BY brand
+                ORDER BY count DESC
+                LIMIT 5
+            """, (department_id,))
+        
+            top_brands = fetch_dicts(cursor)
+        
+        
+            # Build response
+            department_data = dict_from_row(department)
+            department_data['top_categories'] = top_categories
+            department_data['top_brands'] = top_brands
+        
+            return jsonify({
+                'department': department_data,
+                'timestamp': datetime.now().isoformat()
+            })
         
     except sqlite3.Error as e:
         logger.error(f"Database error in get_department: {e}")
-        conn.close()
         abort(500)
     except Exception as e:
         logger.error(f"Error in get_department: {e}")
-        conn.close()
         abort(500)
 
 @app.route('/api/departments/<int:department_id>/products', methods=['GET'])
+@conditional_response
+@cached_response(ttl=60)
 def get_department_products(department_id):
     """
     GET /api/departments/{id}/products - Get all products in a department
     
     Query Parameters:
     - page: Page number (default: 1)
+    - cursor / after: Opaque keyset cursor from a previous response (replaces page)
     - limit: Items per page (default: 20, max: 100)
     - category: Filter by category within the department
     - brand: Filter by brand within the department
     - min_price: Minimum retail price
     - max_price: Maximum retail price
-    - search: Search in product name
-    - sort_by: Sort by field (name, price, cost, brand)
+    - search: Full-text search in product name, brand and category (prefix matching)
+    - sort_by: Sort by field (name, price, cost, brand, or relevance when searching)
     - sort_order: Sort order (asc, desc)
+    - count: Total count strategy (exact, estimate, none; default: exact)
+    - fields: Comma-separated product columns to return (default: all; id is always included)
+    - format: Response format (json, compact; default: json)
     """
     
     if department_id <= 0:
@@ -570,116 +1290,113 @@ def get_department_products(department_id):
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
     search = request.args.get('search')
-    sort_by = request.args.get('sort_by', 'id')
+    sort_by = request.args.get('sort_by', 'relevance' if search else 'id')
     sort_order = request.args.get('sort_order', 'asc')
+    count_mode = request.args.get('count', 'exact')
+    fields = parse_fields(request.args.get('fields'))
+    response_format = request.args.get('format', 'json')
     
     # Validate parameters
     if page < 1:
         abort(400)
     
-    valid_sort_fields = ['id', 'name', 'retail_price', 'cost', 'brand', 'category']
-    if sort_by not in valid_sort_fields:
+    if sort_by == 'relevance':
+        # Ranking needs the FTS5 index; LIKE search keeps the id order
+        if not search or get_search_backend() != 'fts5' or not build_fts_query(search):
+            sort_by = 'id'
+    elif sort_by not in VALID_SORT_FIELDS:
         sort_by = 'id'
     
     if sort_order not in ['asc', 'desc']:
         sort_order = 'asc'
     
-    conn = get_db_connection()
-    if not conn:
-        abort(500)
+    if count_mode not in COUNT_MODES:
+        count_mode = 'exact'
+    
+    if response_format not in RESPONSE_FORMATS:
+        response_format = 'json'
+    
+    keyset, sort_by, sort_order = resolve_listing_cursor(request.args, sort_by, sort_order)
     
     try:
-        cursor = conn.cursor()
-        
-        # First, verify department exists
-        cursor.execute("SELECT name FROM departments WHERE id = ?", (department_id,))
-        dept_result = cursor.fetchone()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Canonical filter shape; its SQL is compiled once and reused
+            count_filters = {
+                'department_id': department_id,
+                'category': category,
+                'brand': brand,
+                'min_price': min_price,
+                'max_price': max_price,
+                'search': search
+            }
+            shape, params = query_builder.bind_filters(count_filters, get_search_backend() == 'fts5')
+            
+            # A cached or estimated total spares the count
+            count_key = ('department_products', tuple(count_filters.items()))
+            total_count, needs_count = lookup_total_count(conn, count_mode, count_key, count_filters)
+            
+            if keyset:
+                # Seek past the cursor position instead of skipping rows
+                seek = keyset['direction']
+                page_params = query_builder.seek_params(sort_by, keyset) + [limit + 1]
+            else:
+                seek = None
+                page_params = [limit + 1, (page - 1) * limit]
+            
+            # Department name, total count and page come back from one statement
+            selected, output_fields = query_builder.select_columns(fields, sort_by)
+            query = query_builder.listing_sql('department', shape, selected, sort_by, sort_order,
+                                              seek, needs_count)
+            
+            cursor.row_factory = None
+            cursor.execute(query, query_builder.listing_params(params, page_params, needs_count,
+                                                               meta_params=[department_id]))
+            meta, products = split_listing_rows(cursor, 'department')
         
-        if dept_result is None:
-            conn.close()
+        # The department name is NULL when the department does not exist
+        department_name = meta['department_name']
+        if department_name is None:
             return jsonify({
                 'error': 'Department not found',
                 'message': f'Department with ID {department_id} does not exist',
                 'department_id': department_id
             }), 404
         
-        department_name = dept_result[0]
-        
-        # Build the query with department filter
-        where_conditions = ["p.department_id = ?"]
-        params = [department_id]
-        
-        if category:
-            where_conditions.append("p.category = ?")
-            params.append(category)
-        
-        if brand:
-            where_conditions.append("p.brand = ?")
-            params.append(brand)
-        
-        if min_price is not None:
-            where_conditions.append("p.retail_price >= ?")
-            params.append(min_price)
-        
-        if max_price is not None:
-            where_conditions.append("p.retail_price <= ?")
-            params.append(max_price)
-        
-        if search:
-            where_conditions.append("p.name LIKE ?")
-            params.append(f"%{search}%")
-        
-        where_clause = "WHERE " + " AND ".join(where_conditions)
-        
-        # Count total records for pagination
-        count_query = f"""
-            SELECT COUNT(*) 
-            FROM products p
-            JOIN departments d ON p.department_id = d.id
-            {where_clause}
-        """
-        cursor.execute(count_query, params)
-        total_count = cursor.fetchone()[0]
+        if needs_count:
+            total_count = meta['total_count']
+            store_total_count(count_key, total_count)
         
         # Calculate pagination info
-        total_pages = math.ceil(total_count / limit)
-        offset = (page - 1) * limit
-        
-        # Build main query
-        query = f"""
-            SELECT p.id, p.cost, p.category, p.name, p.brand, p.retail_price, 
-                   p.department, p.sku, p.distribution_center_id, p.created_at,
-                   d.name as department_name, d.description as department_description
-            FROM products p
-            JOIN departments d ON p.department_id = d.id
-            {where_clause}
-            ORDER BY p.{sort_by} {sort_order.upper()}
-            LIMIT ? OFFSET ?
-        """
-        
-        params.extend([limit, offset])
-        cursor.execute(query, params)
-        products = cursor.fetchall()
-        
-        # Convert to list of dictionaries
-        products_list = [dict_from_row(product) for product in products]
+        total_pages = math.ceil(total_count / limit) if total_count is not None else None
         
-        conn.close()
+        if keyset:
+            products, has_next, has_prev = build_keyset_pagination(products, limit, keyset)
+        else:
+            # One extra row tells us whether another page exists
+            has_next = len(products) > limit
+            products = products[:limit]
+            has_prev = page > 1
+        next_cursor, prev_cursor = cursor_links(products, has_next, has_prev, sort_by, sort_order)
         
         # Build response
         response = {
             'department_id': department_id,
             'department_name': department_name,
-            'products': products_list,
+            **format_product_rows(products, output_fields, response_format),
             'pagination': {
-                'page': page,
+                'page': None if keyset else page,
                 'limit': limit,
                 'total_count': total_count,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1,
-                'next_page': page + 1 if page < total_pages else None,
-                'prev_page': page - 1 if page > 1 else None
+                'has_next': has_next,
+                'has_prev': has_prev,
+                'next_page': page + 1 if not keyset and has_next else None,
+                'prev_page': page - 1 if not keyset and has_prev else None,
+                'next_cursor': next_cursor,
+                'prev_cursor': prev_cursor,
+                'count_mode': count_mode
             },
             'filters': {
                 'category': category,
@@ -697,16 +1414,20 @@ def get_department_products(department_id):
         
     except sqlite3.Error as e:
         logger.error(f"Database error in get_department_products: {e}")
-        conn.close()
         abort(500)
     except Exception as e:
         logger.error(f"Error in get_department_products: {e}")
-        conn.close()
         abort(500)
 
 if __name__ == '__main__':
+    if '--debug' not in sys.argv[1:]:
+        # Production: pre-forked, warmed workers (see serve.py for options)
+        import serve
+        serve.main(sys.argv[1:])
+        sys.exit(0)
+    
     print("=" * 60)
-    print("           PRODUCTS REST API")
+    print("           PRODUCTS REST API (debug server)")
     print("=" * 60)
     print("API Endpoints:")
     print("  GET /                     - API information")
@@ -719,4 +1440,6 @@ if __name__ == '__main__':
     print("Press Ctrl+C to stop the server")
     print("=" * 60)
     
+    init_database()
+    start_access_log()
     app.run(debug=True, host='0.0.0.0', port=5000)
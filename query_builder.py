@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Product Query Builder
+The one place where the product listing, count, export and batch queries
+are put together. Filter values are bound in a fixed canonical order, so
+every request with the same set of filters (the query "shape") produces
+the identical SQL text. The compiled SQL for each shape is memoized, and
+the identical text lets sqlite3's per-connection statement cache reuse the
+prepared statement instead of recompiling it. New filters are added to
+FILTER_CONDITIONS and, when they need one, an index in migrations.py.
+"""
+
+import functools
+import re
+
+# Prepared statements kept per pooled connection (sqlite3's default is 128).
+# The sweep in test_performance.py (every filter combination of both
+# listings, every sort and order, offset and keyset pages, count modes,
+# projections, batch buckets, facets, stats and suggestions) issues 166
+# distinct statements without the columnar index and 99 with it, so 256
+# keeps all of them prepared with room for the sort and filter mixes the
+# sweep does not cover. Past this size sqlite3 evicts the least recently
+# used statement and recompiles it on its next use.
+STATEMENT_CACHE_SIZE = 256
+
+# Compiled SQL strings kept per builder function; larger than the statement
+# cache since building a string is cheap to keep around
+SHAPE_CACHE_SIZE = 1024
+
+VALID_SORT_FIELDS = ['id', 'name', 'retail_price', 'cost', 'brand', 'category']
+
+# Listing columns that can be requested with fields=, in response order
+PRODUCT_FIELDS = {
+    'id': 'p.id',
+    'cost': 'p.cost',
+    'category': 'p.category',
+    'name': 'p.name',
+    'brand': 'p.brand',
+    'retail_price': 'p.retail_price',
+    'department': 'p.department',
+    'sku': 'p.sku',
+    'distribution_center_id': 'p.distribution_center_id',
+    'created_at': 'p.created_at',
+    'department_name': 'd.name',
+    'department_description': 'd.description'
+}
+
+# Filter conditions in canonical order; parameters are bound in this order
+FILTER_CONDITIONS = {
+    'department_id': "p.department_id = ?",
+    'category': "p.category = ?",
+    'department': "p.department = ?",
+    'brand': "p.brand = ?",
+    'min_price': "p.retail_price >= ?",
+    'max_price': "p.retail_price <= ?",
+    'search_fts': "products_fts MATCH ?",
+    'search_like': "p.name LIKE ?"
+}
+
+# How each listing source joins departments: every product, or only those
+# of one (existing) department
+SOURCE_JOINS = {
+    'products': "LEFT JOIN departments d ON p.department_id = d.id",
+    'department': "JOIN departments d ON p.department_id = d.id"
+}
+
+FTS_JOIN = "JOIN products_fts ON products_fts.rowid = p.id"
+
+# Batch lookups are padded up to one of these sizes so a handful of IN lists
+# cover every batch
+BATCH_BUCKETS = [8, 32, 128, 512]
+
+# Lower bounds of the retail price facet buckets; the last one is open-ended
+PRICE_BUCKETS = (0, 25, 50, 100, 200, 500)
+
+# Filters that are also facets, counted by their value
+FACET_COLUMNS = ('category', 'brand', 'department')
+
+
+def build_fts_query(search):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    terms = re.findall(r'\w+', search)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def bind_filters(filters, fts5=False):
+    """
+    Bind filter values to the canonical shape.
+
+    filters maps filter names (plus 'search') to values; None and empty
+    values are skipped. With fts5 the search text becomes an FTS5 prefix
+    query, otherwise (or when it has no word characters) a LIKE on the
+    name. Returns (shape, params), where shape is the tuple of filter names
+    the compiled SQL functions take.
+    """
+    values = dict(filters)
+    search = values.pop('search', None)
+    if search:
+        fts_query = build_fts_query(search) if fts5 else ''
+        if fts_query:
+            values['search_fts'] = fts_query
+        else:
+            values['search_like'] = f"%{search}%"
+
+    shape = []
+    params = []
+    for name in FILTER_CONDITIONS:
+        value = values.get(name)
+        if value is None or value == '':
+            continue
+        shape.append(name)
+        params.append(value)
+    return tuple(shape), params
+
+
+def _from_clause(source, shape, needs_fts=False):
+    """FROM/JOIN/WHERE for a source and filter shape"""
+    clauses = ["FROM products p", SOURCE_JOINS[source]]
+    if 'search_fts' in shape or needs_fts:
+        clauses.append(FTS_JOIN)
+    return " ".join(clauses)
+
+
+def _where(conditions):
+    return "WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _order_terms(sort_by, sort_order, reverse=False, outer=False):
+    """
+    Sort field with the id as a unique tie-breaker. outer names the result
+    columns of a listing statement instead of the table columns.
+    """
+    ascending = (sort_order == 'asc') != reverse
+    direction = 'ASC' if ascending else 'DESC'
+    table = '' if outer else 'p.'
+    if sort_by == 'relevance':
+        # BM25 rank is negative, lower is a better match
+        rank = 'relevance_rank' if outer else 'products_fts.rank'
+        return f"{rank}, {table}id"
+    if sort_by == 'id':
+        return f"{table}id {direction}"
+    return f"{table}{sort_by} {direction}, {table}id {direction}"
+
+
+def _seek_condition(sort_by, sort_order, direction):
+    """Keyset predicate for paging forward ('next') or backward ('prev')"""
+    operator = '>' if (direction == 'next') == (sort_order == 'asc') else '<'
+    if sort_by == 'id':
+        return f"p.id {operator} ?"
+    return f"(p.{sort_by}, p.id) {operator} (?, ?)"
+
+
+def select_columns(fields, sort_by):
+    """
+    Columns to read for a listing page: the requested fields (all by
+    default) plus the sort column, which the keyset cursors are built from.
+    Returns (selected, output_fields) as tuples.
+    """
+    output_fields = tuple(fields or PRODUCT_FIELDS)
+    selected = output_fields
+    if sort_by in PRODUCT_FIELDS and sort_by not in selected:
+        selected += (sort_by,)
+    return selected, output_fields
+
+
+# Metadata columns of a listing statement, after its row_kind column
+LISTING_META_COLUMNS = {
+    'products': ('total_count',),
+    'department': ('total_count', 'department_name')
+}
+
+# row_kind of the metadata row and of the page rows of a listing statement
+META_ROW = 0
+PAGE_ROW = 1
+
+
+def _count_sql(source, shape):
+    conditions = [FILTER_CONDITIONS[name] for name in shape]
+    return f"SELECT COUNT(*) {_from_clause(source, shape)} {_where(conditions)}"
+
+
+def _page_sql(source, shape, selected, sort_by, sort_order, seek):
+    conditions = [FILTER_CONDITIONS[name] for name in shape]
+    if seek:
+        conditions.append(_seek_condition(sort_by, sort_order, seek))
+        limit_clause = "LIMIT ?"
+    else:
+        limit_clause = "LIMIT ? OFFSET ?"
+    columns = [f"{PRODUCT_FIELDS[name]} AS {name}" for name in selected]
+    if sort_by == 'relevance':
+        columns.append("products_fts.rank AS relevance_rank")
+    return (f"SELECT {', '.join(columns)} "
+            f"{_from_clause(source, shape, sort_by == 'relevance')} "
+            f"{_where(conditions)} "
+            f"ORDER BY {_order_terms(sort_by, sort_order, seek == 'prev')} "
+            f"{limit_clause}")
+
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def listing_sql(source, shape, selected, sort_by, sort_order, seek=None, with_count=True):
+    """
+    A listing page and its metadata in one statement.
+
+    The page rows (row_kind PAGE_ROW) are UNION ALLed with one metadata row
+    (row_kind META_ROW) that comes first and holds LISTING_META_COLUMNS: the
+    total count, NULL unless with_count, and for a department listing the
+    department name, NULL if there is no such department. An empty page
+    still returns the metadata row.
+
+    The total is an uncorrelated COUNT(*) subquery, run once on the same
+    index as a separate count would be. COUNT(*) OVER () on the page query
+    would read every matching row before the LIMIT instead, and joining the
+    metadata to the page would make SQLite materialize the page, losing the
+    LIMIT on its sort.
+
+    Without seek the page is addressed by LIMIT ? OFFSET ?. With seek
+    ('next' or 'prev') it starts after a keyset cursor and takes LIMIT ?
+    only; 'prev' reads in reverse order and the caller flips the rows back.
+    Bind parameters with listing_params.
+    """
+    meta_columns = LISTING_META_COLUMNS[source]
+    page_columns = selected + (('relevance_rank',) if sort_by == 'relevance' else ())
+
+    page = (f"SELECT {PAGE_ROW} AS row_kind, {', '.join(f'NULL AS {name}' for name in meta_columns)}, page.* "
+            f"FROM ({_page_sql(source, shape, selected, sort_by, sort_order, seek)}) page")
+
+    meta = [f"({_count_sql(source, shape)})" if with_count else "NULL"]
+    if source == 'department':
+        meta.append("(SELECT name FROM departments WHERE id = ?)")
+    meta += ["NULL"] * len(page_columns)
+
+    order = _order_terms(sort_by, sort_order, seek == 'prev', outer=True)
+    return f"{page} UNION ALL SELECT {META_ROW}, {', '.join(meta)} ORDER BY row_kind, {order}"
+
+
+def listing_params(filter_params, page_params, with_count, meta_params=()):
+    """
+    Parameters for listing_sql: the filters and the page's own parameters,
+    the filters again for the count, then the department id of a department
+    listing.
+    """
+    count_params = list(filter_params) if with_count else []
+    return list(filter_params) + list(page_params) + count_params + list(meta_params)
+
+
+def seek_params(sort_by, keyset):
+    """Parameters of the keyset predicate of a listing page"""
+    if sort_by == 'id':
+        return [keyset['id']]
+    return [keyset['value'], keyset['id']]
+
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def export_sql(shape):
+    """Every matching product, unordered, for the streaming export"""
+    conditions = [FILTER_CONDITIONS[name] for name in shape]
+    select_list = ", ".join(f"{column} AS {name}" for name, column in PRODUCT_FIELDS.items())
+    return f"SELECT {select_list} {_from_clause('products', shape)} {_where(conditions)}"
+
+
+@functools.lru_cache(maxsize=len(BATCH_BUCKETS))
+def _batch_sql(bucket):
+    select_list = ", ".join(f"{column} AS {name}" for name, column in PRODUCT_FIELDS.items())
+    placeholders = ",".join("?" * bucket)
+    return f"SELECT {select_list} {_from_clause('products', ())} WHERE p.id IN ({placeholders})"
+
+
+def batch_sql(product_ids):
+    """
+    Lookup of many products by id. Returns (sql, params); the id list is
+    padded with NULLs (which match nothing) up to the next bucket size.
+    """
+    count = len(product_ids)
+    bucket = next((size for size in BATCH_BUCKETS if size >= count), count)
+    return _batch_sql(bucket), list(product_ids) + [None] * (bucket - count)
+
+
+def _price_bucket_case():
+    """CASE expression numbering the PRICE_BUCKETS a retail price falls in"""
+    whens = " ".join(f"WHEN p.retail_price < {bound} THEN {number}"
+                     for number, bound in enumerate(PRICE_BUCKETS[1:]))
+    return f"CASE {whens} ELSE {len(PRICE_BUCKETS) - 1} END"
+
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def facet_sql(shape):
+    """
+    Facet counts for a filter shape from one grouped scan.
+
+    Rows are grouped by category, brand, department, price bucket and an
+    in_price flag for the min/max price range, so the caller can count
+    each facet with every filter but its own. Only the search condition
+    is applied in SQL. Bind parameters with facet_params.
+    """
+    in_price = " AND ".join(FILTER_CONDITIONS[name] for name in shape
+                            if name in ('min_price', 'max_price')) or "1"
+    search = [FILTER_CONDITIONS[name] for name in shape if name.startswith('search')]
+    # No departments join: the department facet is the product's own column
+    joins = f" {FTS_JOIN}" if 'search_fts' in shape else ""
+    return (f"SELECT p.category, p.brand, p.department, {_price_bucket_case()} AS price_bucket, "
+            f"{in_price} AS in_price, COUNT(*) AS count "
+            f"FROM products p{joins} {_where(search)} "
+            f"GROUP BY 1, 2, 3, 4, 5")
+
+
+def facet_params(shape, params):
+    """Parameters for facet_sql from those of bind_filters"""
+    bound = dict(zip(shape, params))
+    return ([bound[name] for name in ('min_price', 'max_price') if name in bound]
+            + [bound[name] for name in shape if name.startswith('search')])
+
+
+def cache_info():
+    """Hit/miss counters of the compiled SQL caches, for monitoring"""
+    return {
+        function.__name__: function.cache_info()._asdict()
+        for function in (listing_sql, export_sql, facet_sql, _batch_sql)
+    }
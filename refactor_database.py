@@ -14,6 +14,9 @@ import sqlite3
 import logging
 from pathlib import Path
 
+import db_tuning
+from migrations import apply_migrations
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,7 +32,7 @@ class DatabaseRefactor:
     def connect(self):
         """Establish database connection."""
         try:
-            self.connection = sqlite3.connect(self.db_path)
+            self.connection = db_tuning.connect(self.db_path, 'bulk_load')
             self.connection.row_factory = sqlite3.Row
             logging.info(f"Connected to database: {self.db_path}")
             return True
@@ -174,6 +177,19 @@ class DatabaseRefactor:
         logging.info("ℹ️  Foreign key relationship established via department_id column")
         return True
     
+    def apply_schema_migrations(self):
+        """Apply pending versioned migrations (indexes etc.) to the refactored schema."""
+        try:
+            applied = apply_migrations(self.connection)
+            if applied:
+                logging.info(f"✅ Applied schema migrations: {applied}")
+            else:
+                logging.info("ℹ️  Schema migrations already up to date")
+            return True
+        except Exception as e:
+            logging.error(f"❌ Failed to apply schema migrations: {e}")
+            return False
+    
     def demo_join_query(self):
         """Demonstrate JOIN query between products and departments."""
         try:
@@ -297,6 +313,10 @@ class DatabaseRefactor:
             if not self.create_foreign_key_constraint():
                 return False
             
+            # Step 6: Bring indexes and other schema migrations up to date
+            if not self.apply_schema_migrations():
+                return False
+            
             # Verification
             if not self.verify_refactoring():
                 return False
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Access Log Replay
+Drives a running products API with the requests recorded in its access
+log (requests.jsonl, see access_log.py), so load tests follow the shape of
+real traffic: the same routes, filters and pages in the same mix. Requests
+are sent in log order from a number of keep-alive connections, optionally
+paced to a fixed overall rate, and the report gives throughput and
+p50/p95/p99 latency per route.
+
+Only GET requests are replayed; other methods are skipped since their
+bodies are not logged.
+
+Usage:
+    python replay_requests.py [requests.jsonl] --base-url http://localhost:5000 \\
+        [--concurrency 8] [--rate 0] [--limit 0] [--repeat 1]
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+
+def load_requests(path, limit=0):
+    """(route, url) of each replayable entry, in log order; and how many were skipped"""
+    requests = []
+    skipped = 0
+    with open(path, encoding='utf-8') as log_file:
+        for line in log_file:
+            try:
+                entry = json.loads(line)
+                if entry['method'] != 'GET':
+                    skipped += 1
+                    continue
+                query = urlencode([tuple(pair) for pair in entry.get('params') or ()])
+                requests.append((entry['route'], entry['path'] + (f"?{query}" if query else "")))
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            if limit and len(requests) >= limit:
+                break
+    return requests, skipped
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)]
+
+
+class Replay:
+    """Sends a request list from concurrency connections, paced to rate per second (0: flat out)"""
+
+    def __init__(self, base_url, requests, concurrency, rate, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.requests = requests
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _take(self):
+        with self._lock:
+            index = self._next
+            self._next += 1
+        return index if index < len(self.requests) else None
+
+    def _worker(self, started):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        while True:
+            index = self._take()
+            if index is None:
+                break
+            if self.rate:
+                # Request i is due i/rate seconds after the start
+                delay = started + index / self.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            route, url = self.requests[index]
+            sent = time.perf_counter()
+            try:
+                conn.request('GET', self.prefix + url)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors[route] += 1
+                else:
+                    latencies[route].append(time.perf_counter() - sent)
+            except (OSError, http.client.HTTPException):
+                errors[route] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        conn.close()
+
+        with self._lock:
+            for route, values in latencies.items():
+                self.latencies[route].extend(values)
+            for route, count in errors.items():
+                self.errors[route] += count
+
+    def run(self):
+        """Send every request; returns the elapsed seconds"""
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._worker, args=(started,))
+                   for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def report(replay, elapsed):
+    routes = sorted(set(replay.latencies) | set(replay.errors),
+                    key=lambda route: -len(replay.latencies.get(route, [])))
+    completed = sum(len(values) for values in replay.latencies.values())
+    errors = sum(replay.errors.values())
+
+    print(f"{completed} requests in {elapsed:.1f}s: {completed / elapsed:.0f} req/s, {errors} errors")
+    print(f"  {'route':<40} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route in routes + ['all']:
+        if route == 'all':
+            values = sorted(value for latencies in replay.latencies.values() for value in latencies)
+            route_errors = errors
+        else:
+            values = sorted(replay.latencies.get(route, []))
+            route_errors = replay.errors.get(route, 0)
+        print(f"  {route:<40} {len(values):>9} {route_errors:>7} {len(values) / elapsed:>8.1f} "
+              f"{percentile(values, 0.50) * 1000:>8.1f} {percentile(values, 0.95) * 1000:>8.1f} "
+              f"{percentile(values, 0.99) * 1000:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an access log against a running API")
+    parser.add_argument('log', nargs='?', default='requests.jsonl', help="access log (JSONL)")
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=8, help="keep-alive connections")
+    parser.add_argument('--rate', type=float, default=0,
+                        help="overall requests per second (default: as fast as possible)")
+    parser.add_argument('--limit', type=int, default=0, help="replay only the first N requests")
+    parser.add_argument('--repeat', type=int, default=1, help="replay the log this many times")
+    args = parser.parse_args()
+
+    requests, skipped = load_requests(args.log, args.limit)
+    if not requests:
+        print(f"No GET requests to replay in {args.log} ({skipped} lines skipped)")
+        return
+    print(f"Replaying {len(requests)} requests x {args.repeat} from {args.log} "
+          f"({skipped} lines skipped) at {args.concurrency} connections"
+          + (f", {args.rate:g} req/s" if args.rate else ""))
+
+    replay = Replay(args.base_url, requests * args.repeat, args.concurrency, args.rate)
+    report(replay, replay.run())
+
+
+if __name__ == '__main__':
+    main()
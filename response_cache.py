@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+In-Process Response Cache
+Memory-bounded LRU cache of serialized API responses with per-entry TTLs.
+Entries belong to a catalog revision; as soon as a newer revision is seen
+the whole cache is dropped, so a catalog change never serves stale data.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """A serialized response body together with what is needed to replay it"""
+
+    __slots__ = ('body', 'status', 'mimetype', 'expires_at')
+
+    def __init__(self, body, status, mimetype, expires_at):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """
+    LRU response cache bounded by total body size.
+
+    Counters for hits, misses, evictions, expirations and revision
+    invalidations are kept for monitoring.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entry_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._revision = None
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+    def _check_revision(self, revision):
+        """
+        Drop everything cached for an older catalog revision (caller holds the lock).
+
+        Returns False for a request that read an already superseded revision;
+        it must neither be served from nor stored in the cache.
+        """
+        if self._revision is not None and revision < self._revision:
+            return False
+        if revision != self._revision:
+            if self._entries:
+                self._counters['invalidations'] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._revision = revision
+        return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def get(self, key, revision):
+        """Return the cached response for key at this revision, or None"""
+        with self._lock:
+            entry = self._entries.get(key) if self._check_revision(revision) else None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            if entry.expires_at < time.monotonic():
+                self._remove(key)
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry
+
+    def put(self, key, revision, body, status, mimetype, ttl):
+        """Store a response body, evicting least recently used entries to fit"""
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if not self._check_revision(revision):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedResponse(body, status, mimetype, time.monotonic() + ttl)
+            self._bytes += len(body)
+            self._counters['stores'] += 1
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Snapshot of cache size and counters"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'revision': self._revision,
+                'hit_ratio': self._counters['hits'] / lookups if lookups else None,
+                **self._counters
+            }
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Response Serialization
+Pluggable JSON encoding for API responses and cheap row materialization.
+orjson is used when it is installed and the stdlib json module otherwise;
+both produce the same documents. Rows are turned into dicts by zipping them
+with the column list of the cursor, read once per result set, instead of
+calling keys() on every sqlite3.Row.
+"""
+
+import json
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKENDS = ['orjson', 'stdlib']
+
+
+def column_names(cursor):
+    """Column names of the last query on cursor, in SELECT order"""
+    return [column[0] for column in cursor.description]
+
+
+def rows_to_dicts(columns, rows):
+    """Materialize tuple (or sqlite3.Row) rows as dicts keyed by columns"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def fetch_dicts(cursor):
+    """Fetch every remaining row of cursor as a dict"""
+    return rows_to_dicts(column_names(cursor), cursor.fetchall())
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson.
+
+    Keeps the behaviour of the default provider: sort_keys and compact are
+    honoured, and values orjson does not handle natively (dates, Decimal,
+    UUID, dataclasses) go through the same default hook, so they encode
+    exactly as before. Responses are built from bytes without a round trip
+    through str.
+    """
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {'indent', 'separators'}:
+            # Options orjson has no equivalent for
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default,
+                            option=self._options(bool(kwargs.get('indent')))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def select_backend(preferred=None):
+    """
+    Pick the JSON backend: preferred, else PRODUCTS_API_JSON_BACKEND, else the
+    fastest one installed.
+    """
+    preferred = preferred or os.environ.get('PRODUCTS_API_JSON_BACKEND')
+    if preferred == 'stdlib' or orjson is None:
+        return 'stdlib'
+    return 'orjson'
+
+
+DEFAULT_BACKEND = select_backend()
+
+
+def install_json_provider(app, backend=None):
+    """Make jsonify on app use the selected backend; returns its name"""
+    backend = select_backend(backend)
+    app.json = OrjsonProvider(app) if backend == 'orjson' else DefaultJSONProvider(app)
+    return backend
+
+
+def dumps(obj, backend=None):
+    """Compact JSON document as bytes, for NDJSON lines and similar"""
+    if (backend or DEFAULT_BACKEND) == 'orjson':
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
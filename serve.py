@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Products API - Production Server
+Pre-forking multi-worker entry point for the products API, replacing the
+single-process debug server. The master opens the listening socket, applies
+schema migrations once and forks the workers. Each worker execs a fresh
+interpreter that imports the API and its modules from disk, warms its
+connection pool and caches, and only then accepts connections on the
+shared socket (inherited across the exec) with a threaded Werkzeug server.
+Because no worker inherits modules the master has imported, a reload runs
+the current code of every API module; only changes to the master's own
+process management in this file need a full restart.
+
+Signals (sent to the master):
+    SIGHUP          graceful reload: start a new set of workers, wait until
+                    they are warm, then let the old ones finish and exit
+    SIGTERM/SIGINT  graceful shutdown
+
+Workers exit on their own after max_requests requests (plus some jitter, so
+they do not all restart at once) and are replaced by the master.
+
+Configuration comes from the command line or PRODUCTS_API_* environment
+variables; debugging stays with `python products_api.py --debug`.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from migrations import apply_migrations
+
+logger = logging.getLogger('products_api.serve')
+
+# First argument of a worker's command line, followed by its descriptors
+WORKER_FLAG = '--worker'
+
+# Requests used to warm a worker before it starts accepting traffic
+WARM_UP_PATHS = [
+    '/health',
+    '/api/products?limit=20',
+    '/api/products?limit=20&count=estimate',
+    '/api/products/stats',
+    '/api/products/suggest?q=a',
+    '/api/departments',
+    '/api/departments/1/products?limit=20'
+]
+
+
+class ServerConfig:
+    """Serving options, read from PRODUCTS_API_* environment variables"""
+
+    OPTIONS = {
+        # name: (type, default, help)
+        'host': (str, '0.0.0.0', "address to listen on"),
+        'port': (int, 5000, "port to listen on"),
+        'workers': (int, os.cpu_count() or 1, "worker processes (default: one per core)"),
+        'pool_size': (int, 8, "database connections per worker"),
+        'export_pool_size': (int, 2, "database connections per worker reserved for exports"),
+        'max_requests': (int, 10000, "recycle a worker after this many requests (0: never)"),
+        'max_requests_jitter': (int, 1000, "random extra requests per worker before recycling"),
+        'graceful_timeout': (float, 30.0, "seconds a stopping worker gets to finish its requests"),
+        'backlog': (int, 2048, "listen backlog of the shared socket"),
+        'database': (str, 'ecommerce.db', "SQLite database file"),
+        'db_profile': (str, 'serving', "SQLite tuning profile (see db_tuning.py)"),
+        'access_log': (str, '', "JSONL access log per request, e.g. requests.jsonl (default: off)")
+    }
+
+    def __init__(self, **overrides):
+        for name, (cast, default, _) in self.OPTIONS.items():
+            value = overrides.get(name)
+            if value is None:
+                env_value = os.environ.get(f"PRODUCTS_API_{name.upper()}")
+                value = cast(env_value) if env_value is not None else default
+            setattr(self, name, value)
+
+    @classmethod
+    def from_args(cls, argv=None):
+        parser = argparse.ArgumentParser(description="Run the products API with pre-forked workers")
+        for name, (cast, _, help_text) in cls.OPTIONS.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=cast, dest=name, help=help_text)
+        return cls(**vars(parser.parse_args(argv)))
+
+
+class RequestCounter:
+    """
+    WSGI middleware counting handled and in-flight requests.
+
+    on_limit is called once the worker has accepted max_requests requests.
+    A request stays in flight until its response body has been closed, so
+    streamed exports count until they finish.
+    """
+
+    def __init__(self, app, max_requests, on_limit):
+        self.app = app
+        self.max_requests = max_requests
+        self.on_limit = on_limit
+        self.handled = 0
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        with self._cond:
+            self.handled += 1
+            self.in_flight += 1
+            reached = self.max_requests and self.handled == self.max_requests
+        if reached:
+            self.on_limit()
+
+        try:
+            return ClosingIterator(self.app(environ, start_response), self._finished)
+        except BaseException:
+            self._finished()
+            raise
+
+    def _finished(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout):
+        """Wait until no request is in flight; returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.in_flight == 0, timeout)
+
+
+def open_listener(config):
+    """Bind the socket all workers accept on"""
+    family = socket.AF_INET6 if ':' in config.host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((config.host, config.port))
+    sock.listen(config.backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_api(config):
+    """Import the API and point its connection pools at the configured database"""
+    api = importlib.import_module('products_api')
+    from db_pool import ConnectionPool
+
+    if (api.DATABASE != config.database or api.pool.max_size != config.pool_size
+            or api.pool.profile != config.db_profile):
+        api.pool.close()
+        api.pool = ConnectionPool(config.database, max_size=config.pool_size,
+                                  cached_statements=api.pool.cached_statements,
+                                  profile=config.db_profile,
+                                  cursor_factory=api.pool.cursor_factory,
+                                  slow_query_log=api.pool.slow_query_log)
+    if (api.DATABASE != config.database or api.export_pool.max_size != config.export_pool_size
+            or api.export_pool.profile != config.db_profile):
+        api.export_pool.close()
+        api.export_pool = ConnectionPool(config.database, max_size=config.export_pool_size,
+                                         timeout=api.export_pool.timeout,
+                                         profile=config.db_profile,
+                                         cursor_factory=api.export_pool.cursor_factory,
+                                         slow_query_log=api.export_pool.slow_query_log)
+    api.DATABASE = config.database
+    return api
+
+
+def warm_up(api, config):
+    """Open the pooled connections and run the hot read paths once"""
+    held = [api.pool.acquire() for _ in range(config.pool_size)]
+    for pooled in held:
+        api.pool.release(pooled)
+
+    client = api.app.test_client()
+    for path in WARM_UP_PATHS:
+        response = client.get(path)
+        if response.status_code != 200:
+            logger.warning(f"Warm-up request {path} returned {response.status_code}")
+
+
+def run_worker(listener, config, ready_fd):
+    """Body of a worker process started by Master.spawn; never returns"""
+    from werkzeug.serving import make_server
+
+    # Ctrl+C reaches the whole process group; the master decides what to do
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    exit_code = 0
+    try:
+        api = load_api(config)
+        warm_up(api, config)
+        api.start_access_log(config.access_log)
+
+        stopping = threading.Event()
+        limit = config.max_requests
+        if limit:
+            limit += random.randint(0, config.max_requests_jitter)
+        app = RequestCounter(api.app, limit, stopping.set)
+        server = make_server(config.host, config.port, app, threaded=True, fd=listener.fileno())
+        listener.close()
+
+        def stop(signum=None, frame=None):
+            stopping.set()
+        signal.signal(signal.SIGTERM, stop)
+
+        def watch():
+            stopping.wait()
+            server.shutdown()
+        threading.Thread(target=watch, daemon=True).start()
+
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+        server.serve_forever()
+
+        # No new connections are accepted; let running requests finish
+        if not app.wait_idle(config.graceful_timeout):
+            logger.warning(f"Worker {os.getpid()} exiting with {app.in_flight} requests in flight")
+        server.server_close()
+        api.stop_access_log()
+        api.pool.close()
+        api.export_pool.close()
+    except Exception as e:
+        logger.error(f"Worker {os.getpid()} failed: {e}")
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+class Master:
+    """Keeps config.workers warm workers running and handles the signals"""
+
+    def __init__(self, config):
+        self.config = config
+        self.listener = None
+        self.workers = {}        # pid -> generation
+        self.generation = 0
+        self.signals = []
+
+    def spawn(self):
+        """Start a worker of the current generation; returns its readiness pipe"""
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(ready_read)
+                os.set_inheritable(ready_write, True)
+                # Ignored signals stay ignored across the exec, until run_worker takes over
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                os.execv(sys.executable, worker_argv(self.config, self.listener.fileno(), ready_write))
+            finally:
+                os._exit(1)
+        os.close(ready_write)
+        self.workers[pid] = self.generation
+        return ready_read
+
+    def wait_ready(self, ready_fds, timeout=60.0):
+        """Wait for workers to report that they are warm; returns how many did"""
+        pending = set(ready_fds)
+        deadline = time.monotonic() + timeout
+        ready = 0
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending), [], [], 0.5)
+            for fd in readable:
+                # A worker that died during warm-up closes its end without writing
+                if os.read(fd, 1):
+                    ready += 1
+                os.close(fd)
+                pending.discard(fd)
+        for fd in pending:
+            os.close(fd)
+        return ready
+
+    def spawn_generation(self):
+        """Start a full set of workers and wait until they are all warm"""
+        self.generation += 1
+        return self.wait_ready([self.spawn() for _ in range(self.config.workers)])
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        """Collect exited workers; returns the generations they belonged to"""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                break
+            if pid == 0:
+                break
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code != 0:
+                logger.warning(f"Worker {pid} exited with status {exit_code}")
+            exited.append(self.workers.pop(pid, None))
+        return exited
+
+    def reload(self):
+        """
+        Bring up a warm new generation, then stop the old one gracefully.
+        The new workers are fresh interpreters, so they run the code now on
+        disk; the master itself keeps running the code it started with.
+        """
+        old_workers = list(self.workers)
+        started = time.monotonic()
+        ready = self.spawn_generation()
+        logger.info(f"Reloaded: {ready}/{self.config.workers} new workers warm "
+                    f"in {time.monotonic() - started:.1f}s")
+        for pid in old_workers:
+            self.kill(pid, signal.SIGTERM)
+
+    def shutdown(self):
+        """Stop every worker, killing those that outlive the graceful timeout"""
+        for pid in list(self.workers):
+            self.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.config.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            self.kill(pid, signal.SIGKILL)
+        while self.workers:
+            self.reap()
+            time.sleep(0.1)
+
+    def run(self):
+        apply_migrations_once(self.config.database, self.config.db_profile)
+        self.listener = open_listener(self.config)
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+
+        started = time.monotonic()
+        ready = self.spawn_generation()
+        print(f"Products API listening on http://{self.config.host}:{self.config.port} "
+              f"with {ready}/{self.config.workers} workers "
+              f"(warm in {time.monotonic() - started:.1f}s, master pid {os.getpid()})")
+
+        stopping = False
+        while not stopping:
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    stopping = True
+            if stopping:
+                break
+
+            # Replace workers recycled after max_requests (or crashed); old
+            # generations exiting after a reload are not replaced
+            lost = sum(1 for generation in self.reap() if generation == self.generation)
+            if lost and not self.wait_ready([self.spawn() for _ in range(lost)]):
+                # Replacements die during warm-up too; don't fork in a tight loop
+                time.sleep(1.0)
+            time.sleep(0.2)
+
+        logger.info("Shutting down workers")
+        self.shutdown()
+        self.listener.close()
+
+
+def worker_argv(config, listener_fd, ready_fd):
+    """Command line that starts a worker in a fresh interpreter on inherited descriptors"""
+    argv = [sys.executable, os.path.abspath(__file__), WORKER_FLAG, f"{listener_fd},{ready_fd}"]
+    for name in ServerConfig.OPTIONS:
+        argv += [f"--{name.replace('_', '-')}", str(getattr(config, name))]
+    return argv
+
+
+def apply_migrations_once(database, profile):
+    """
+    Apply pending schema migrations in the master before any worker starts.
+    This also switches the database to the profile's journal mode while no
+    worker has it open.
+    """
+    import db_tuning
+
+    conn = db_tuning.connect(database, profile)
+    try:
+        applied = apply_migrations(conn)
+        if applied:
+            logger.info(f"Applied schema migrations: {applied}")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == [WORKER_FLAG]:
+        # Started by Master.spawn: serve on the master's socket
+        listener_fd, ready_fd = (int(fd) for fd in argv[1].split(','))
+        run_worker(socket.socket(fileno=listener_fd), ServerConfig.from_args(argv[2:]), ready_fd)
+    config = ServerConfig.from_args(argv)
+
+    if not hasattr(os, 'fork'):
+        # No fork (Windows): serve from this process with a single warm worker
+        from werkzeug.serving import make_server
+        apply_migrations_once(config.database, config.db_profile)
+        api = load_api(config)
+        warm_up(api, config)
+        api.start_access_log(config.access_log)
+        print(f"Products API listening on http://{config.host}:{config.port} (single process)")
+        make_server(config.host, config.port, api.app, threaded=True).serve_forever()
+        return
+
+    Master(config).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Slow Query Log
+Captures every API statement whose SQLite time (execute plus fetching)
+crosses a threshold, together with its bound parameters, the route that
+issued it and the EXPLAIN QUERY PLAN output, so a slow filter combination
+can be traced back to the SQL the query builder generated and to how
+SQLite planned it. The most recent entries are kept in a bounded ring
+buffer for /api/admin/slow-queries and, when a path is configured, each is
+appended to a JSONL file for offline analysis.
+
+Statements are timed by metrics.TimedCursor on pooled connections that
+carry a log (ConnectionPool(slow_query_log=...)); the plan is only run for
+statements that were already slow, so fast queries pay nothing extra.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD_MS = 100.0
+DEFAULT_CAPACITY = 200
+
+
+def _json_value(value):
+    """Bound parameter as a JSON value; blobs become their length"""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    return repr(value)
+
+
+class SlowQueryLog:
+    """Ring buffer (plus optional JSONL file) of statements slower than threshold_ms"""
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, capacity=DEFAULT_CAPACITY, path=None):
+        self.threshold_ms = threshold_ms
+        self.threshold = threshold_ms / 1000.0
+        self.capacity = capacity
+        self.path = path
+        self.recorded = 0
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Configured by PRODUCTS_API_SLOW_QUERY_MS (threshold),
+        PRODUCTS_API_SLOW_QUERY_CAPACITY (entries kept) and
+        PRODUCTS_API_SLOW_QUERY_LOG (JSONL path; no file unless it is set)
+        """
+        return cls(
+            threshold_ms=float(os.environ.get('PRODUCTS_API_SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS)),
+            capacity=int(os.environ.get('PRODUCTS_API_SLOW_QUERY_CAPACITY', DEFAULT_CAPACITY)),
+            path=os.environ.get('PRODUCTS_API_SLOW_QUERY_LOG') or None
+        )
+
+    def explain(self, conn, sql, params):
+        """EXPLAIN QUERY PLAN rows of a statement as 'id parent detail' strings"""
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return []
+        try:
+            cursor = conn.cursor(sqlite3.Cursor)
+            cursor.row_factory = None
+            plan = cursor.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            cursor.close()
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {e}"]
+        return [f"{row[0]} {row[1]} {row[3]}" for row in plan]
+
+    def record(self, conn, sql, params, seconds, route=None):
+        """Add a slow statement, with its plan, to the buffer and the file"""
+        params = params or ()
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'duration_ms': round(seconds * 1000, 3),
+            'route': route,
+            'sql': " ".join(sql.split()),
+            'params': ([_json_value(value) for value in params] if isinstance(params, (list, tuple))
+                       else {key: _json_value(value) for key, value in params.items()}),
+            'plan': self.explain(conn, sql, params)
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as log_file:
+                        log_file.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    logger.warning(f"Could not write slow query log {self.path}: {e}")
+        logger.warning(f"Slow query ({entry['duration_ms']} ms) on {route}: {entry['sql'][:200]}")
+
+    def entries(self, limit=None):
+        """Buffered entries, newest first"""
+        with self._lock:
+            newest_first = list(reversed(self._entries))
+        return newest_first[:limit] if limit else newest_first
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'threshold_ms': self.threshold_ms,
+            'capacity': self.capacity,
+            'buffered': len(self._entries),
+            'recorded': self.recorded,
+            'path': self.path
+        }
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Snapshot Index Reloading
+The reload logic shared by the in-memory indexes built from the catalog
+(columnar_index.ColumnarIndex and suggest_index.SuggestIndex). The first
+snapshot is loaded by the request that needs it. After a catalog change,
+requests no longer wait for a rebuild: the first one to notice starts it in
+a background thread on a connection of its own, and until the new snapshot
+is in place callers are told the index is stale, so they answer from
+SQLite or from the previous snapshot. At most one rebuild runs per index;
+one that finishes behind the catalog is followed by another on the next
+request.
+"""
+
+import threading
+import logging
+
+from catalog_version import get_catalog_revision
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotIndex:
+    """
+    Base class for an index replaced whole on reload. Subclasses implement
+    _load(conn), which reads the catalog and sets self._snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._revision = None
+        self._rebuild = None
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.rebuild_errors = 0
+
+    def ensure_loaded(self, conn, revision=None):
+        """Load on first use and reload whenever the catalog revision changes"""
+        if self._snapshot is not None and (revision is None or revision == self._revision):
+            return
+        with self._lock:
+            if self._snapshot is not None and (revision is None or revision == self._revision):
+                return
+            self._load(conn)
+            self._revision = revision
+
+    def ensure_current(self, conn, revision, connect):
+        """
+        True if the snapshot is at least as new as revision. The first
+        snapshot is loaded here on conn; after that a newer revision starts
+        a rebuild on a connection from connect() in the background and
+        returns False, leaving the previous snapshot in place.
+        """
+        if self._snapshot is None:
+            self.ensure_loaded(conn, revision)
+            return True
+        current = self._revision
+        if revision is None or (current is not None and revision <= current):
+            return True
+        with self._lock:
+            if not self.rebuilding:
+                self._rebuild = threading.Thread(target=self._rebuild_from, args=(connect,),
+                                                 name=f"{type(self).__name__}-rebuild", daemon=True)
+                self._rebuild.start()
+        return False
+
+    @property
+    def rebuilding(self):
+        """True while a background rebuild is running"""
+        return self._rebuild is not None and self._rebuild.is_alive()
+
+    def wait_for_rebuild(self, timeout=None):
+        """Wait for a running background rebuild; returns False on timeout"""
+        rebuild = self._rebuild
+        if rebuild is not None:
+            rebuild.join(timeout)
+        return not self.rebuilding
+
+    def _rebuild_from(self, connect):
+        """Build the snapshot of the latest revision on a connection of its own"""
+        try:
+            conn = connect()
+            try:
+                # One read transaction, so the rows belong to the revision read
+                conn.execute("BEGIN")
+                revision, _ = get_catalog_revision(conn)
+                self._load(conn)
+                conn.rollback()
+            finally:
+                conn.close()
+            self._revision = revision
+        except Exception as e:
+            self.rebuild_errors += 1
+            logger.error(f"Rebuilding {type(self).__name__} failed: {e}")
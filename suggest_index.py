@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Search Suggestion Index
+An in-memory prefix index over product names, brands and categories for the
+/api/products/suggest typeahead. Every word start of every term is a key in
+one sorted list, so the terms matching a typed prefix are a bisect range,
+and a term matches whichever of its words the user starts typing. Terms are
+ranked by popularity: how many products carry the brand or category, or
+share the product name.
+
+Short or common prefixes match much of the catalog, so the most popular
+terms of each fixed-size block of keys are worked out when the index is
+built, and a lookup only merges those lists plus the keys in the partial
+blocks at the ends of its range. The index is rebuilt in the background
+whenever the catalog revision changes (see snapshot_index.py); lookups use
+the previous snapshot until then.
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import time
+import unicodedata
+
+from snapshot_index import SnapshotIndex
+
+logger = logging.getLogger(__name__)
+
+# Suggestions per request: default and upper bound
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+
+# Keys per block with precomputed top MAX_SUGGESTIONS terms; a lookup ranks
+# at most two partial blocks key by key
+BLOCK_SIZE = 256
+
+# Where the terms of each kind come from, with the number of products
+# behind each; brand and category counts are kept by the stats triggers
+TERM_SOURCES = {
+    'category': "SELECT category, product_count FROM product_stats_by_category",
+    'brand': "SELECT brand, product_count FROM product_stats_by_brand",
+    'product': "SELECT name, COUNT(*) FROM products WHERE name IS NOT NULL GROUP BY name"
+}
+
+
+def normalize(text):
+    """Lower case without accents and with single spaces, for prefix matching"""
+    if not text.isascii():
+        decomposed = unicodedata.normalize('NFKD', text)
+        text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+
+class _Snapshot:
+    """Sorted keys and precomputed rankings for one catalog revision"""
+
+    def __init__(self, terms):
+        # terms are (kind, value, count); a term's position in the
+        # popularity order doubles as its rank, lower is better
+        self.terms = sorted(terms, key=lambda term: (-term[2], len(term[1]), term[1], term[0]))
+
+        entries = set()
+        for rank, (_, value, _) in enumerate(self.terms):
+            text = normalize(value)
+            for match in re.finditer(r'\w+', text):
+                entries.add((text[match.start():], rank))
+        entries = sorted(entries)
+        self.keys = [key for key, _ in entries]
+        self.ranks = [rank for _, rank in entries]
+
+        # The most popular terms of each block of keys, so a long range is
+        # ranked from its blocks' lists instead of every key in it
+        self.block_tops = [self._most_popular(start, start + BLOCK_SIZE)
+                           for start in range(0, len(self.keys), BLOCK_SIZE)]
+
+    def _most_popular(self, start, end, limit=MAX_SUGGESTIONS):
+        # A term is in a range once per matching word; count it once
+        return heapq.nsmallest(limit, set(self.ranks[start:end]))
+
+    def lookup(self, prefix, limit):
+        """Ranks of the limit most popular terms with a word starting with prefix"""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\U0010ffff', start)
+        first_block = -(-start // BLOCK_SIZE)
+        last_block = end // BLOCK_SIZE
+        if first_block >= last_block:
+            return self._most_popular(start, end, limit)
+
+        # Partial blocks at either end, whole blocks in between
+        candidates = set(self.ranks[start:first_block * BLOCK_SIZE])
+        candidates.update(self.ranks[last_block * BLOCK_SIZE:end])
+        for block in range(first_block, last_block):
+            candidates.update(self.block_tops[block])
+        return heapq.nsmallest(limit, candidates)
+
+
+class SuggestIndex(SnapshotIndex):
+    """
+    Prefix index over the catalog's product names, brands and categories.
+
+    Snapshots are replaced whole on reload, so a lookup running in another
+    thread keeps reading the lists it started with.
+    """
+
+    def _load(self, conn):
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        terms = []
+        for kind, sql in TERM_SOURCES.items():
+            cursor.execute(sql)
+            terms.extend((kind, value, count) for value, count in cursor.fetchall() if value)
+        cursor.close()
+
+        self._snapshot = _Snapshot(terms)
+        self.loads += 1
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"Loaded suggestion index with {len(terms)} terms in {self.load_seconds:.2f}s")
+
+    def suggest(self, query, limit=DEFAULT_SUGGESTIONS):
+        """
+        Up to limit suggestions for what the user has typed so far, most
+        popular first, as dicts of type, value and count.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        snapshot = self._snapshot
+        suggestions = []
+        for rank in snapshot.lookup(prefix, min(limit, MAX_SUGGESTIONS)):
+            kind, value, count = snapshot.terms[rank]
+            suggestions.append({'type': kind, 'value': value, 'count': count})
+        return suggestions
+
+    def stats(self):
+        """Size and load time of the current snapshot, for monitoring"""
+        snapshot = self._snapshot
+        return {
+            'terms': len(snapshot.terms) if snapshot is not None else 0,
+            'keys': len(snapshot.keys) if snapshot is not None else 0,
+            'revision': self._revision,
+            'loads': self.loads,
+            'load_seconds': round(self.load_seconds, 3),
+            'rebuilding': self.rebuilding,
+            'rebuild_errors': self.rebuild_errors
+        }
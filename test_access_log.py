@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Access Log Test
+Sends requests through the Flask test client with the access log pointed
+at a temporary file and checks the entries it writes: route template,
+normalized parameters, status, latency and size, in a form the replay tool
+turns back into the same URLs.
+"""
+
+import json
+import os
+import unittest
+import logging
+
+import products_api
+import replay_requests
+import serve
+from api_fixtures import ApiTestCase
+from metrics import TimedCursor
+
+
+class AccessLogTest(ApiTestCase):
+    """Every request must leave one replayable line"""
+
+    product_count = 200
+    pool_options = {'cursor_factory': TimedCursor}
+    use_columnar_index = False
+    log_level = logging.WARNING
+
+    def start_log(self, name):
+        path = os.path.join(self.temp_dir, name)
+        products_api.start_access_log(path)
+        self.addCleanup(products_api.stop_access_log)
+        return path
+
+    def read_log(self, path):
+        products_api.stop_access_log()
+        with open(path, encoding='utf-8') as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def test_entries_carry_route_params_and_outcome(self):
+        path = self.start_log('access.jsonl')
+        listing = self.client.get('/api/products?sort_by=retail_price&category=Jeans&brand=&per_page=5')
+        self.assertEqual(listing.status_code, 200)
+        self.assertEqual(self.client.get('/api/products/1').status_code, 200)
+        self.assertEqual(self.client.get('/no/such/route').status_code, 404)
+
+        entries = self.read_log(path)
+        self.assertEqual(len(entries), 3)
+        first, detail, missing = entries
+        self.assertEqual(first['method'], 'GET')
+        self.assertEqual(first['route'], '/api/products')
+        self.assertEqual(first['path'], '/api/products')
+        self.assertEqual(first['params'], [['category', 'Jeans'], ['per_page', '5'], ['sort_by', 'retail_price']])
+        self.assertEqual(first['status'], 200)
+        self.assertEqual(first['bytes'], len(listing.data))
+        self.assertGreater(first['latency_ms'], 0)
+        self.assertEqual(detail['route'], '/api/products/<int:product_id>')
+        self.assertEqual(detail['path'], '/api/products/1')
+        self.assertEqual(missing['status'], 404)
+
+    def test_replay_rebuilds_urls(self):
+        path = self.start_log('replay.jsonl')
+        self.client.get('/api/products?category=Jeans&page=2')
+        self.client.get('/api/products/2')
+        self.read_log(path)
+        with open(path, 'a', encoding='utf-8') as log_file:
+            log_file.write("not json\n")
+
+        requests, skipped = replay_requests.load_requests(path)
+        self.assertEqual(requests, [('/api/products', '/api/products?category=Jeans&page=2'),
+                                    ('/api/products/<int:product_id>', '/api/products/2')])
+        self.assertEqual(skipped, 1)
+
+    def test_off_unless_started(self):
+        self.assertIsNone(products_api.access_log)
+        self.assertIsNone(products_api.start_access_log(''))
+        self.assertEqual(self.client.get('/api/products/1').status_code, 200)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'requests.jsonl')))
+
+    def test_off_without_a_configured_path(self):
+        previous = os.environ.pop('PRODUCTS_API_ACCESS_LOG', None)
+        if previous is not None:
+            self.addCleanup(os.environ.__setitem__, 'PRODUCTS_API_ACCESS_LOG', previous)
+        self.assertIsNone(products_api.start_access_log())
+        self.assertEqual(serve.ServerConfig().access_log, '')
+
+        path = os.path.join(self.temp_dir, 'env.jsonl')
+        os.environ['PRODUCTS_API_ACCESS_LOG'] = path
+        self.addCleanup(os.environ.pop, 'PRODUCTS_API_ACCESS_LOG', None)
+        self.assertIsNotNone(products_api.start_access_log())
+        self.addCleanup(products_api.stop_access_log)
+        self.client.get('/api/products/1')
+        self.assertEqual(len(self.read_log(path)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+ASGI Adapter Test
+Drives asgi_app.AsyncWSGIAdapter directly with in-memory receive and send
+callables, without a server: request headers and bodies reach the WSGI app
+intact, responses (buffered and streamed) come back unchanged, repeated
+response headers stay separate, a client that goes away stops an export,
+requests over max_pending get a 503 and the lifespan starts and stops the
+API.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import unittest
+
+import products_api
+from api_fixtures import ApiTestCase
+from asgi_app import AsyncWSGIAdapter, build_environ
+from db_pool import ConnectionPool
+
+
+def http_scope(path, method='GET', query=b'', headers=()):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000)
+    }
+
+
+def call(adapter, scope, body=b'', disconnect=False):
+    """Run one request through adapter; returns the ASGI messages it sent"""
+    sent = []
+
+    async def run():
+        incoming = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        if disconnect:
+            incoming.append({'type': 'http.disconnect'})
+        idle = asyncio.Event()
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            await idle.wait()
+
+        async def send(message):
+            sent.append(message)
+
+        await adapter(scope, receive, send)
+
+    asyncio.run(run())
+    return sent
+
+
+def response_of(messages):
+    """Status, header list and joined body of the sent messages"""
+    start, *bodies = messages
+    assert start['type'] == 'http.response.start'
+    assert not bodies[-1].get('more_body')
+    return start['status'], start['headers'], b"".join(message['body'] for message in bodies)
+
+
+def cookie_app(environ, start_response):
+    """WSGI app that echoes the Cookie header and sets two cookies"""
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Set-Cookie', 'a=1; Path=/'),
+                              ('Set-Cookie', 'b=2; Path=/')])
+    return [environ.get('HTTP_COOKIE', '').encode('latin-1')]
+
+
+class BuildEnvironTest(unittest.TestCase):
+    """The environ must carry what a WSGI server would put there"""
+
+    def test_environ(self):
+        environ = build_environ(http_scope('/api/café', method='POST', query=b'a=1&b=2', headers=[
+            ('content-type', 'application/json'), ('content-length', '3'),
+            ('accept', 'text/html'), ('accept', 'application/json'),
+            ('cookie', 'a=1'), ('cookie', 'b=2')
+        ]), b'{}\n')
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(environ['PATH_INFO'].encode('latin-1').decode('utf-8'), '/api/café')
+        self.assertEqual(environ['QUERY_STRING'], 'a=1&b=2')
+        self.assertEqual(environ['CONTENT_TYPE'], 'application/json')
+        self.assertEqual(environ['CONTENT_LENGTH'], '3')
+        self.assertEqual(environ['wsgi.input'].read(), b'{}\n')
+        self.assertEqual(environ['REMOTE_ADDR'], '127.0.0.1')
+        self.assertEqual(environ['HTTP_ACCEPT'], 'text/html,application/json')
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+
+
+class CookieTest(unittest.TestCase):
+    """Cookies must pass through in both directions"""
+
+    def test_repeated_cookie_headers(self):
+        adapter = AsyncWSGIAdapter(cookie_app, max_threads=1)
+        self.addCleanup(adapter.executor.shutdown)
+        status, headers, body = response_of(call(adapter, http_scope('/', headers=[
+            ('cookie', 'a=1'), ('cookie', 'b=2')])))
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'a=1; b=2')
+        self.assertEqual([value for name, value in headers if name == b'set-cookie'],
+                         [b'a=1; Path=/', b'b=2; Path=/'])
+
+
+class AsgiApiTest(ApiTestCase):
+    """Responses over ASGI must be the ones the WSGI app gives"""
+
+    product_count = 3000
+
+    def setUp(self):
+        self.adapter = AsyncWSGIAdapter(products_api.app, max_threads=2)
+        self.addCleanup(self.adapter.executor.shutdown)
+
+    def test_json_routes(self):
+        status, headers, body = response_of(call(self.adapter, http_scope('/api/products/7')))
+        self.assertEqual(status, 200)
+        self.assertIn((b'content-type', b'application/json'), headers)
+        self.assertEqual(json.loads(body), self.client.get('/api/products/7').get_json())
+
+        status, _, body = response_of(call(self.adapter, http_scope(
+            '/api/products', query=b'category=Jeans&limit=5')))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['products'],
+                         self.client.get('/api/products?category=Jeans&limit=5').get_json()['products'])
+
+        status, _, _ = response_of(call(self.adapter, http_scope('/api/products/999999')))
+        self.assertEqual(status, 404)
+
+    def test_request_body(self):
+        payload = json.dumps({'ids': [3, 1, 2]}).encode('utf-8')
+        status, _, body = response_of(call(self.adapter, http_scope(
+            '/api/products/batch', method='POST', headers=[('content-type', 'application/json')]), payload))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), self.client.post('/api/products/batch', json={'ids': [3, 1, 2]}).get_json())
+
+    def test_streamed_export(self):
+        messages = call(self.adapter, http_scope('/api/products/export'))
+        status, _, body = response_of(messages)
+        self.assertEqual(status, 200)
+        self.assertGreater(len(messages), 3)
+        with self.client.get('/api/products/export') as expected:
+            self.assertEqual(body, expected.get_data())
+        self.assertEqual(products_api.export_pool.stats()['in_use'], 0)
+
+    def test_disconnect_stops_the_export(self):
+        messages = call(self.adapter, http_scope('/api/products/export'), disconnect=True)
+        _, _, body = response_of(messages)
+        with self.client.get('/api/products/export') as expected:
+            self.assertLess(len(body), len(expected.get_data()))
+        self.assertEqual(products_api.export_pool.stats()['in_use'], 0)
+
+    def test_busy(self):
+        self.adapter.max_pending = 0
+        status, headers, _ = response_of(call(self.adapter, http_scope('/api/products/7')))
+        self.assertEqual(status, 503)
+        self.assertIn((b'retry-after', b'1'), headers)
+
+    def test_lifespan(self):
+        saved = {name: getattr(products_api, name) for name in ('DATABASE', 'pool', 'export_pool')}
+        self.addCleanup(lambda: [setattr(products_api, name, value) for name, value in saved.items()])
+        products_api.DATABASE = self.db_path
+        products_api.pool = ConnectionPool(self.db_path, max_size=1)
+        products_api.export_pool = ConnectionPool(self.db_path, max_size=1)
+        log_path = os.path.join(self.temp_dir, 'lifespan.jsonl')
+        os.environ['PRODUCTS_API_ACCESS_LOG'] = log_path
+        self.addCleanup(os.environ.pop, 'PRODUCTS_API_ACCESS_LOG', None)
+        self.addCleanup(products_api.stop_access_log)
+
+        sent = []
+        started = []
+
+        async def run():
+            incoming = asyncio.Queue()
+            await incoming.put({'type': 'lifespan.startup'})
+
+            async def send(message):
+                sent.append(message)
+                if message['type'] == 'lifespan.startup.complete':
+                    started.append(products_api.access_log is not None)
+                    await incoming.put({'type': 'lifespan.shutdown'})
+
+            await self.adapter({'type': 'lifespan'}, incoming.get, send)
+
+        asyncio.run(run())
+        self.assertEqual([message['type'] for message in sent],
+                         ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(started, [True])
+        self.assertIsNone(products_api.access_log)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            products_api.pool.acquire()
+
+
+if __name__ == '__main__':
+    unittest.main()
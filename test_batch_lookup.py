@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Batch Lookup Test
+Fetches products by id through GET /api/products?ids= and
+POST /api/products/batch and checks the rows come back in request order,
+without duplicates, with unknown ids reported as missing, that malformed ids (including
+non-ASCII digits) are a 400, and that the IN-list statements are served
+from the primary key.
+"""
+
+import unittest
+
+from api_fixtures import QueryPlanTestCase
+
+
+class BatchLookupTest(QueryPlanTestCase):
+    """Batch lookups must keep the request order and use the primary key"""
+
+    def test_batch_lookup_plans(self):
+        batch = self.get('/api/products?ids=17,3,999999,3')
+        self.assertEqual([p['id'] for p in batch['products']], [17, 3])
+        self.assertEqual(batch['missing_ids'], [999999])
+        response = self.client.post('/api/products/batch', json={'ids': list(range(500, 0, -1))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['products']), 500)
+        self.assert_no_full_scans()
+
+    def test_invalid_ids(self):
+        for ids in ('²', '3,²', '٣', '1.5', '-2', '0', 'x', ','):
+            url = f"/api/products?ids={ids}"
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+        for ids in (['²'], ['٣'], [True], [1.0], [], 'x'):
+            response = self.client.post('/api/products/batch', json={'ids': ids})
+            self.assertEqual(response.status_code, 400, ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
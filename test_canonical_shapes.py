@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Canonical Query Shape Test
+Sends listings that differ only in filter values and parameter order and
+checks that they compile to one shared statement, so SQLite's statement
+cache and the query builder's shape cache are reused.
+"""
+
+import unittest
+
+import query_builder
+from api_fixtures import QueryPlanTestCase
+
+
+class CanonicalShapeTest(QueryPlanTestCase):
+    """Filter values must not change the SQL text"""
+
+    def test_canonical_shapes(self):
+        """Requests differing only in filter values share one compiled query"""
+        query_builder.listing_sql.cache_clear()
+        for category, brand, min_price in (('Jeans', 'Brand 3', 10), ('Swim', 'Brand 7', 55.5),
+                                           ('Socks', 'Brand 1', 99)):
+            # Parameters in a different order each time
+            self.get(f"/api/products?min_price={min_price}&brand={brand}&category={category}")
+            self.get(f"/api/products?category={category}&min_price={min_price}&brand={brand}")
+        self.assertEqual(query_builder.listing_sql.cache_info().currsize, 1)
+        self.assertEqual(query_builder.listing_sql.cache_info().hits, 2)
+
+if __name__ == '__main__':
+    unittest.main()
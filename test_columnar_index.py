@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Columnar Index Test
+Requests the same listings with the in-memory columnar index and with the
+SQLite path and checks that the responses are identical, including ties,
+case and non-ASCII ordering, and that a catalog change rebuilds the index
+in the background while SQLite answers.
+"""
+
+import sqlite3
+import threading
+import unittest
+
+import columnar_index
+import products_api
+from api_fixtures import ApiTestCase, insert_products, listing_urls
+from catalog_version import get_catalog_revision
+
+# Names and prices that exercise tie-breaking and code point ordering
+EXTRA_ROWS = [
+    (90001, 10.0, 'Jeans', 'zebra Jeans', 'Brand 3', 49.99, 'Women', 'SKUX1', 1),
+    (90002, 10.0, 'Jeans', 'Zebra Jeans', 'Brand 3', 49.99, 'Women', 'SKUX2', 1),
+    (90003, 10.0, 'Jeans', 'Émile Jeans', 'Brand 3', 49.99, 'Women', 'SKUX3', 1),
+    (90004, 10.0, 'Jeans', 'Ämile Jeans', 'brand 3', 120.0, 'Men', 'SKUX4', 1),
+]
+
+
+@unittest.skipIf(columnar_index.np is None, "numpy is not installed")
+class ColumnarIndexTest(ApiTestCase):
+    """The columnar index must answer exactly like SQLite"""
+
+    product_count = 2000
+
+    @classmethod
+    def build_database(cls, db_path):
+        super().build_database(db_path)
+        insert_products(db_path, EXTRA_ROWS)
+
+    def setUp(self):
+        self.index = columnar_index.ColumnarIndex()
+
+    def compare(self, url):
+        """Fetch url from SQLite and from the index; return the index response"""
+        products_api.columnar_index = None
+        expected = self.client.get(url)
+        products_api.columnar_index = self.index
+        actual = self.client.get(url)
+        self.assertEqual(actual.status_code, expected.status_code, url)
+        self.assertEqual(actual.get_json(), expected.get_json(), url)
+        return actual.get_json()
+
+    def test_listings_match_sqlite(self):
+        for url in listing_urls('/api/products', {
+            'category': 'Jeans',
+            'brand': 'Brand%203',
+            'department': 'Women',
+            'min_price': '49.99',
+            'max_price': '120'
+        }):
+            self.compare(url)
+            self.compare(url + "&page=2&count=none")
+        self.assertEqual(self.index.loads, 1)
+
+    def test_pages_and_projections(self):
+        for url in ('/api/products?page=1&limit=100',
+                    '/api/products?page=21&limit=100',
+                    '/api/products?page=500',
+                    '/api/products?category=Nothing',
+                    '/api/products?category=Jeans&sort_by=name&fields=name,brand&limit=7',
+                    '/api/products?brand=Brand%203&sort_by=retail_price&format=compact',
+                    '/api/products?max_price=5'):
+            self.compare(url)
+
+        # Cursors continue on the SQLite path from an index page
+        first = self.compare('/api/products?category=Jeans&sort_by=name&sort_order=desc')
+        self.compare(f"/api/products?cursor={first['pagination']['next_cursor']}")
+
+    def test_unsupported_listings_use_sqlite(self):
+        self.assertTrue(self.index.supports({'category': 'Jeans', 'search': None}, 'name'))
+        self.assertFalse(self.index.supports({'search': 'jeans'}, 'relevance'))
+        self.assertFalse(self.index.supports({'category': 'Jeans'}, 'id', keyset={'id': 3}))
+        self.compare('/api/products?search=brand%203%20jea')
+        self.assertEqual(self.index.loads, 0)
+
+    def test_reloads_on_catalog_change(self):
+        self.compare('/api/products?sort_by=retail_price&sort_order=desc&limit=5')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE products SET retail_price = 999 WHERE id = 42")
+        conn.commit()
+        conn.close()
+
+        # SQLite answers while the index is rebuilt, then the index again
+        top = self.compare('/api/products?sort_by=retail_price&sort_order=desc&limit=5')
+        self.assertEqual(top['products'][0]['id'], 42)
+        self.assertTrue(self.index.wait_for_rebuild(30))
+        self.assertEqual(self.index.loads, 2)
+        revision = self.index.stats()['revision']
+        top = self.compare('/api/products?sort_by=retail_price&sort_order=desc&limit=5')
+        self.assertEqual(top['products'][0]['id'], 42)
+        self.assertEqual((self.index.loads, self.index.stats()['revision']), (2, revision))
+        self.assertEqual(self.index.rebuild_errors, 0)
+
+    def test_stale_index_is_not_used(self):
+        url = '/api/products?sort_by=retail_price&sort_order=desc&limit=5'
+        products_api.columnar_index = self.index
+        self.client.get(url)
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+        price = conn.execute("SELECT retail_price FROM products WHERE id = 77").fetchone()[0]
+        conn.execute("UPDATE products SET retail_price = (SELECT MAX(retail_price) + 1 FROM products) WHERE id = 77")
+        conn.commit()
+        self.addCleanup(conn.commit)
+        self.addCleanup(conn.execute, "UPDATE products SET retail_price = ? WHERE id = 77", (price,))
+
+        # Hold the rebuild until the stale index has been passed over
+        release = threading.Event()
+
+        def connect():
+            release.wait(30)
+            return products_api.snapshot_connection()
+
+        revision = get_catalog_revision(conn)[0]
+        self.assertFalse(self.index.ensure_current(conn, revision, connect))
+        self.assertTrue(self.index.rebuilding)
+        self.assertFalse(self.index.ensure_current(conn, revision, connect))
+        self.assertEqual(self.client.get(url).get_json()['products'][0]['id'], 77)
+        self.assertEqual(self.index.loads, 1)
+
+        release.set()
+        self.assertTrue(self.index.wait_for_rebuild(30))
+        self.assertEqual((self.index.loads, self.index.stats()['revision']), (2, revision))
+        self.assertTrue(self.index.ensure_current(conn, revision, connect))
+
+
+if __name__ == '__main__':
+    unittest.main()
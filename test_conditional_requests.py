@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Conditional Request Test
+Sends conditional GETs through the Flask test client against a scratch
+database and checks the ETag handling: a matching If-None-Match gets an
+empty 304, If-Modified-Since on its own never does, and any catalog write,
+even within the same second, changes the ETag and the body.
+"""
+
+import sqlite3
+import unittest
+
+from api_fixtures import ApiTestCase
+
+
+class ConditionalRequestTest(ApiTestCase):
+    """A 304 must only be sent while the catalog is unchanged"""
+
+    cache_responses = True
+
+    def write(self, sql, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def test_if_none_match(self):
+        for url in ('/api/products/7', '/api/products?category=Jeans', '/api/products/stats',
+                    '/api/products/facets', '/api/products/suggest?q=jea', '/api/departments',
+                    '/api/departments/1', '/api/departments/1/products'):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200, url)
+            etag, weak = first.get_etag()
+            self.assertTrue(weak, url)
+            self.assertIsNotNone(first.last_modified, url)
+
+            cached = self.client.get(url, headers={'If-None-Match': first.headers['ETag']})
+            self.assertEqual(cached.status_code, 304, url)
+            self.assertEqual(cached.get_data(), b'', url)
+            self.assertEqual(cached.get_etag(), (etag, True), url)
+
+            # A strong form of the same tag matches too
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': f'"{etag}"'}).status_code, 304, url)
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': 'W/"other"'}).status_code, 200, url)
+
+        self.assertNotEqual(self.client.get('/api/products/7').get_etag(),
+                            self.client.get('/api/products/8').get_etag())
+
+    def test_if_modified_since_alone_is_ignored(self):
+        first = self.client.get('/api/products/11')
+        response = self.client.get('/api/products/11',
+                                   headers={'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), first.get_json())
+
+    def test_write_in_the_same_second_invalidates(self):
+        first = self.client.get('/api/products/21')
+        self.write("UPDATE products SET retail_price = 12.34 WHERE id = 21")
+
+        # Last-Modified has not moved on to the next second yet, the ETag has
+        by_date = self.client.get('/api/products/21',
+                                  headers={'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(by_date.status_code, 200)
+        self.assertEqual(by_date.get_json()['product']['retail_price'], 12.34)
+        self.assertEqual(by_date.headers['X-Cache'], 'MISS')
+
+        response = self.client.get('/api/products/21', headers={
+            'If-None-Match': first.headers['ETag'],
+            'If-Modified-Since': first.headers['Last-Modified']
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['product']['retail_price'], 12.34)
+        self.assertNotEqual(response.get_etag(), first.get_etag())
+        self.assertEqual(self.client.get('/api/products/21', headers={
+            'If-None-Match': response.headers['ETag']}).status_code, 304)
+
+    def test_errors_carry_no_etag(self):
+        missing = self.client.get('/api/products/999999')
+        self.assertEqual(missing.status_code, 404)
+        self.assertNotIn('ETag', missing.headers)
+
+    def test_export_encodings_share_a_weak_etag(self):
+        with self.client.get('/api/products/export?category=Swim') as plain:
+            plain.get_data()
+        with self.client.get('/api/products/export?category=Swim',
+                             headers={'Accept-Encoding': 'gzip'}) as gzipped:
+            gzipped.get_data()
+        self.assertEqual(gzipped.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(plain.get_etag(), gzipped.get_etag())
+        self.assertTrue(plain.get_etag()[1])
+        self.assertIn('Accept-Encoding', gzipped.headers['Vary'])
+
+        with self.client.get('/api/products/export?category=Swim',
+                             headers={'If-None-Match': plain.headers['ETag']}) as cached:
+            self.assertEqual(cached.status_code, 304)
+
+
+if __name__ == '__main__':
+    unittest.main()
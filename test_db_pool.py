@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Connection Pool Test
+Checks out and returns connections of db_pool.ConnectionPool on a scratch
+database and checks the bookkeeping: warm connections are reused, a full
+pool times out, broken idle connections are replaced, old ones recycled,
+a forked child starts with no connections of its own, and the counters
+stay exact under concurrent use.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import logging
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    """The pool must hand out healthy connections and account for every one"""
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'pool.db')
+        sqlite3.connect(self.db_path).close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        logging.disable(logging.NOTSET)
+
+    def make_pool(self, **options):
+        pool = ConnectionPool(self.db_path, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_acquire_and_release(self):
+        pool = self.make_pool(max_size=2)
+        first = pool.acquire()
+        self.assertEqual(pool.stats()['in_use'], 1)
+        self.assertEqual(first.conn.execute("SELECT 1").fetchone()[0], 1)
+        pool.release(first)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+        # The warm connection comes back instead of a new one
+        with pool.connection() as conn:
+            self.assertIs(conn, first.conn)
+            self.assertEqual(pool.stats()['in_use'], 1)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['reused'], stats['open'], stats['in_use']), (1, 1, 1, 0))
+
+    def test_release_rolls_back(self):
+        pool = self.make_pool(max_size=1)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x)")
+            conn.commit()
+            conn.execute("INSERT INTO t VALUES (1)")
+            self.assertTrue(conn.in_transaction)
+        with pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+    def test_timeout_when_exhausted(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        held = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        # A waiter gets the connection as soon as it is returned
+        pool.timeout = 5.0
+        threading.Timer(0.05, pool.release, (held,)).start()
+        waited = pool.acquire()
+        self.assertIs(waited, held)
+        pool.release(waited)
+
+    def test_failed_health_check_replaces_connection(self):
+        pool = self.make_pool(health_check_interval=0)
+        broken = pool.acquire()
+        pool.release(broken)
+        broken.conn.close()
+
+        with pool.connection() as conn:
+            self.assertIsNot(conn, broken.conn)
+            self.assertEqual(conn.execute("SELECT 1").fetchone()[0], 1)
+        stats = pool.stats()
+        self.assertEqual((stats['failed_health_checks'], stats['created'], stats['open']), (1, 2, 1))
+
+    def test_max_age_recycles(self):
+        pool = self.make_pool(max_age=0.05)
+        first = pool.acquire()
+        pool.release(first)
+        time.sleep(0.1)
+
+        with pool.connection() as conn:
+            self.assertIsNot(conn, first.conn)
+        time.sleep(0.1)
+        self.assertEqual(pool.stats()['idle'], 1)
+        with pool.connection():
+            pass
+        stats = pool.stats()
+        self.assertEqual((stats['recycled'], stats['created'], stats['open']), (2, 3, 1))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs fork")
+    def test_fork_starts_empty(self):
+        pool = self.make_pool(max_size=2)
+        for pooled in [pool.acquire(), pool.acquire()]:
+            pool.release(pooled)
+        self.assertEqual(pool.stats()['open'], 2)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Child: nothing inherited is reused and the full pool is available
+            try:
+                os.close(read_fd)
+                held = [pool.acquire(), pool.acquire()]
+                stats = pool.stats()
+                ok = (stats['open'] == 2 and stats['reused'] == 0
+                      and all(h.conn.execute("SELECT 1").fetchone()[0] == 1 for h in held))
+                os.write(write_fd, b'1' if ok else b'0')
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        result = os.read(read_fd, 1)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        self.assertEqual(result, b'1')
+
+        # The parent's connections are untouched by the child
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT 1").fetchone()[0], 1)
+        self.assertEqual(pool.stats()['created'], 2)
+
+    def test_counters_under_concurrency(self):
+        pool = self.make_pool(max_size=4)
+        rounds = 50
+
+        def worker():
+            for _ in range(rounds):
+                with pool.connection() as conn:
+                    conn.execute("SELECT 1").fetchone()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = pool.stats()
+        self.assertEqual(stats['created'] + stats['reused'], 8 * rounds)
+        self.assertEqual(stats['created'], stats['open'])
+        self.assertLessEqual(stats['open'], 4)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_closed_pool_refuses_checkouts(self):
+        pool = self.make_pool()
+        with pool.connection():
+            pass
+        pool.close()
+        self.assertEqual(pool.stats()['open'], 0)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            pool.acquire()
+
+
+if __name__ == '__main__':
+    unittest.main()
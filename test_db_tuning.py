@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Database Tuning Test
+Checks that pooled API connections come up with the serving profile and
+that, in the WAL mode it sets, a reader still gets its answer while a
+loader holds an open write transaction on the catalog.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import logging
+
+import db_tuning
+from db_pool import ConnectionPool
+from api_fixtures import build_test_database
+
+
+class DatabaseTuningTest(unittest.TestCase):
+    """Connections must carry their profile's settings"""
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.INFO)
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.db_path = os.path.join(cls.temp_dir, 'ecommerce.db')
+        build_test_database(cls.db_path, product_count=500)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+        logging.disable(logging.NOTSET)
+
+    def test_pool_applies_serving_profile(self):
+        pool = ConnectionPool(self.db_path)
+        try:
+            with pool.connection() as conn:
+                settings = db_tuning.current_settings(conn)
+        finally:
+            pool.close()
+        expected = db_tuning.PROFILES['serving']
+        self.assertEqual(settings['journal_mode'], 'wal')
+        self.assertEqual(settings['synchronous'], 1)
+        self.assertEqual(settings['temp_store'], 2)
+        for pragma in ('mmap_size', 'cache_size', 'busy_timeout'):
+            self.assertEqual(settings[pragma], expected[pragma], pragma)
+        self.assertEqual(pool.stats()['profile'], 'serving')
+
+    def test_readers_not_blocked_by_writer(self):
+        loader = db_tuning.connect(self.db_path, 'bulk_load')
+        reader = db_tuning.connect(self.db_path, 'serving')
+        try:
+            before = reader.execute("SELECT retail_price FROM products WHERE id = 1").fetchone()[0]
+            loader.execute("BEGIN IMMEDIATE")
+            loader.execute("UPDATE products SET retail_price = retail_price + 1")
+
+            # The uncommitted write neither blocks nor shows through
+            reader.execute("PRAGMA busy_timeout = 0")
+            during = reader.execute("SELECT retail_price FROM products WHERE id = 1").fetchone()[0]
+            self.assertEqual(during, before)
+            loader.rollback()
+        finally:
+            loader.close()
+            reader.close()
+
+    def test_default_profile_changes_nothing(self):
+        conn = sqlite3.connect(os.path.join(self.temp_dir, 'untuned.db'))
+        before = db_tuning.current_settings(conn)
+        db_tuning.apply_profile(conn, 'default')
+        self.assertEqual(db_tuning.current_settings(conn), before)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Product Export Test
+Streams /api/products/export through the Flask test client and checks that
+every format returns exactly the rows the paginated listing does, that the
+export connection is handed back once the stream is closed, and that
+exports left open do not hold up the other routes.
+"""
+
+import csv
+import gzip
+import io
+import json
+import unittest
+
+import products_api
+from api_fixtures import ApiTestCase
+
+
+class ExportTest(ApiTestCase):
+    """Exports must match the listing for the same filters"""
+
+    product_count = 3000
+    cache_responses = True
+
+    def export(self, url, **kwargs):
+        with self.client.get(url, **kwargs) as response:
+            self.assertEqual(response.status_code, 200, url)
+            return response, response.get_data()
+
+    def listing_ids(self, query):
+        """Every product id the paginated listing returns for query"""
+        ids = []
+        url = f"/api/products?{query}&sort_by=id&limit=100&count=none"
+        while url:
+            data = self.client.get(url).get_json()
+            ids.extend(product['id'] for product in data['products'])
+            next_cursor = data['pagination']['next_cursor']
+            url = f"/api/products?{query}&cursor={next_cursor}&limit=100&count=none" if next_cursor else None
+        return sorted(ids)
+
+    def test_ndjson_matches_listing(self):
+        for query in ('', 'category=Jeans&min_price=50', 'department=Women&brand=Brand%203',
+                      'search=brand%2012'):
+            _, body = self.export(f"/api/products/export?{query}")
+            rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+            self.assertEqual(sorted(row['id'] for row in rows), self.listing_ids(query), query)
+
+        _, body = self.export("/api/products/export")
+        first = json.loads(body.decode('utf-8').splitlines()[0])
+        self.assertEqual(first, self.client.get('/api/products/1').get_json()['product'])
+
+    def test_csv_and_gzip(self):
+        response, body = self.export("/api/products/export?format=csv&category=Swim",
+                                     headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(body).decode('utf-8'))))
+        self.assertEqual(sorted(int(row['id']) for row in rows), self.listing_ids('category=Swim'))
+        self.assertTrue(all(row['category'] == 'Swim' for row in rows))
+
+    def test_connection_released(self):
+        with self.client.get("/api/products/export", buffered=False) as response:
+            next(iter(response.response))
+        self.assertEqual(self.client.get("/api/products/export?format=xml").status_code, 400)
+        self.assertEqual(products_api.export_pool.stats()['in_use'], 0)
+        self.assertEqual(products_api.pool.stats()['in_use'], 0)
+
+    def test_open_exports_do_not_block_other_routes(self):
+        # As small as the serving pool goes; stalled exports must not drain it
+        self.addCleanup(setattr, products_api.pool, 'max_size', products_api.pool.max_size)
+        products_api.pool.max_size = 2
+
+        stalled = []
+        for _ in range(products_api.export_pool.max_size):
+            response = self.client.get("/api/products/export", buffered=False)
+            next(iter(response.response))
+            stalled.append(response)
+        try:
+            busy = self.client.get("/api/products/export?format=csv")
+            self.assertEqual(busy.status_code, 503)
+            self.assertEqual(busy.headers['Retry-After'], '1')
+
+            for url in ('/api/products/1', '/api/products?category=Jeans', '/api/products/stats',
+                        '/api/departments/1/products', '/health'):
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+            self.assertEqual(products_api.pool.stats()['in_use'], 0)
+        finally:
+            for response in stalled:
+                response.close()
+
+        self.assertEqual(products_api.export_pool.stats()['in_use'], 0)
+        _, body = self.export("/api/products/export?category=Swim")
+        self.assertTrue(body)
+
+
+if __name__ == '__main__':
+    unittest.main()
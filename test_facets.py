@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Facet Count Test
+Checks /api/products/facets against plain COUNT(*) queries on a scratch
+database, for both the grouped SQLite scan and the columnar index: every
+facet value must count the products matching all the other filters.
+"""
+
+import sqlite3
+import unittest
+
+import columnar_index
+import products_api
+from api_fixtures import ApiTestCase
+from query_builder import PRICE_BUCKETS
+
+FILTER_SETS = [
+    {},
+    {'category': 'Jeans'},
+    {'brand': 'Brand 3', 'department': 'Women'},
+    {'category': 'Swim', 'min_price': 50.0, 'max_price': 120.0},
+    {'category': 'Jeans', 'brand': 'Brand 3', 'department': 'Men', 'min_price': 25.0},
+    {'category': 'No Such Category'},
+    {'search': 'brand 3 jea'},
+    {'search': 'sweat', 'max_price': 100.0, 'department': 'Women'},
+]
+
+CONDITIONS = {
+    'category': "category = ?",
+    'brand': "brand = ?",
+    'department': "department = ?",
+    'min_price': "retail_price >= ?",
+    'max_price': "retail_price <= ?",
+}
+
+
+class FacetTest(ApiTestCase):
+    """Facet counts must equal a COUNT(*) per facet value"""
+
+    product_count = 3000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.conn = sqlite3.connect(cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        super().tearDownClass()
+
+    def count(self, filters, exclude=()):
+        """COUNT(*) of the products matching filters, minus the excluded ones"""
+        conditions, params = [], []
+        for name, value in filters.items():
+            if name in exclude:
+                continue
+            if name == 'search':
+                conditions.append("id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+                params.append(products_api.build_fts_query(value))
+            else:
+                conditions.append(CONDITIONS[name])
+                params.append(value)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        return self.conn.execute(f"SELECT COUNT(*) FROM products {where}", params).fetchone()[0]
+
+    def expected_facets(self, filters):
+        facets = {}
+        for name in ('category', 'brand', 'department'):
+            others = {key: value for key, value in filters.items() if key != name}
+            counts = {}
+            for (value,) in self.conn.execute(f"SELECT DISTINCT {name} FROM products"):
+                count = self.count(dict(others, **{name: value}))
+                if count:
+                    counts[value] = count
+            facets[name] = counts
+
+        # The price facet leaves out the price range filter
+        others = {key: value for key, value in filters.items() if key not in ('min_price', 'max_price')}
+        upper_bounds = PRICE_BUCKETS[1:] + (None,)
+        facets['price'] = []
+        for low, high in zip(PRICE_BUCKETS, upper_bounds):
+            count = self.count(dict(others, min_price=low))
+            if high is not None:
+                count -= self.count(dict(others, min_price=high))
+            facets['price'].append({'min': low, 'max': high, 'count': count})
+        return facets
+
+    def check(self, engine):
+        products_api.columnar_index = engine
+        for filters in FILTER_SETS:
+            query = "&".join(f"{name}={value}" for name, value in filters.items())
+            response = self.client.get(f"/api/products/facets?{query}&limit=100")
+            self.assertEqual(response.status_code, 200, query)
+            data = response.get_json()
+
+            self.assertEqual(data['total_count'], self.count(filters), query)
+            expected = self.expected_facets(filters)
+            for name in ('category', 'brand', 'department'):
+                actual = {entry['value']: entry['count'] for entry in data['facets'][name]}
+                self.assertEqual(actual, expected[name], f"{name} {query}")
+                counts = [entry['count'] for entry in data['facets'][name]]
+                self.assertEqual(counts, sorted(counts, reverse=True))
+            self.assertEqual(data['facets']['price'], expected['price'], query)
+
+    def test_sqlite_facets(self):
+        self.check(None)
+
+    @unittest.skipIf(columnar_index.np is None, "numpy is not installed")
+    def test_columnar_facets(self):
+        self.check(columnar_index.ColumnarIndex())
+
+    def test_limit(self):
+        products_api.columnar_index = None
+        data = self.client.get('/api/products/facets?limit=3').get_json()
+        self.assertEqual(len(data['facets']['brand']), 3)
+        self.assertEqual(len(data['facets']['price']), len(PRICE_BUCKETS))
+        self.assertEqual(self.client.get('/api/products/facets?limit=0').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Catalog Generator Test
+Generates small catalogs and checks they are reproducible (same seed, same
+rows and checksum, whatever the output format), skewed the way the options
+say, and directly usable: the database by the API, the CSV by
+create_database.py.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import logging
+from collections import Counter
+
+import create_database
+import generate_catalog
+from generate_catalog import CatalogGenerator
+from migrations import MIGRATIONS
+
+
+class CatalogGeneratorTest(unittest.TestCase):
+    """Generated catalogs must be deterministic and ready to serve"""
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.WARNING)
+        cls.temp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+        logging.disable(logging.NOTSET)
+
+    def path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def test_same_seed_same_rows(self):
+        first = list(CatalogGenerator(3000, seed=5).rows())
+        self.assertEqual(first, list(CatalogGenerator(3000, seed=5).rows()))
+        self.assertNotEqual(first, list(CatalogGenerator(3000, seed=6).rows()))
+        self.assertEqual(len({row[7] for row in first}), 3000)
+
+    def test_skew(self):
+        rows = list(CatalogGenerator(20000, seed=1, brands=500).rows())
+        brand_counts = Counter(row[4] for row in rows).most_common()
+        # The ten biggest brands outsell the bottom half of the brands twice over
+        self.assertGreater(sum(count for _, count in brand_counts[:10]),
+                           2 * sum(count for _, count in brand_counts[len(brand_counts) // 2:]))
+
+        uniform = Counter(row[4] for row in CatalogGenerator(20000, seed=1, brands=500, brand_skew=0).rows())
+        self.assertLess(max(uniform.values()), brand_counts[0][1] / 5)
+        self.assertEqual({row[6] for row in rows}, {'Women', 'Men'})
+        self.assertTrue(all(0 < row[1] < row[5] for row in rows))
+
+    def test_database_and_csv_match(self):
+        db_manifest = generate_catalog.write_database(CatalogGenerator(2000, seed=9), self.path('catalog.db'))
+        csv_manifest = generate_catalog.write_csv(CatalogGenerator(2000, seed=9), self.path('catalog.csv'))
+        self.assertEqual(db_manifest['rows_sha256'], csv_manifest['rows_sha256'])
+        self.assertEqual(generate_catalog.read_manifest(self.path('catalog.db')), db_manifest)
+        with open(self.path('catalog.csv.manifest.json'), encoding='utf-8') as manifest_file:
+            self.assertEqual(json.load(manifest_file), csv_manifest)
+
+        conn = sqlite3.connect(self.path('catalog.db'))
+        try:
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], MIGRATIONS[-1][0])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM products p JOIN departments d "
+                                          "ON p.department_id = d.id AND d.name = p.department").fetchone()[0], 2000)
+            self.assertEqual(conn.execute("SELECT product_count FROM product_stats_overall").fetchone()[0], 2000)
+            rows = conn.execute(f"SELECT {', '.join(generate_catalog.CSV_COLUMNS)} FROM products ORDER BY id").fetchall()
+        finally:
+            conn.close()
+        checksum = hashlib.sha256()
+        for row in rows:
+            checksum.update(("\t".join(map(str, row)) + "\n").encode())
+        self.assertEqual(checksum.hexdigest(), db_manifest['rows_sha256'])
+
+        with open(self.path('catalog.csv'), newline='', encoding='utf-8') as csv_file:
+            self.assertEqual(next(csv.reader(csv_file)), generate_catalog.CSV_COLUMNS)
+
+    def test_csv_loads_with_create_database(self):
+        generate_catalog.write_csv(CatalogGenerator(500, seed=3), self.path('load.csv'))
+        conn = sqlite3.connect(self.path('loaded.db'))
+        try:
+            create_database.create_products_table(conn)
+            self.assertTrue(create_database.load_csv_data(conn, self.path('load.csv')))
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM products").fetchone()[0], 500)
+        finally:
+            conn.close()
+
+    def test_parse_count(self):
+        self.assertEqual(generate_catalog.parse_count('250k'), 250000)
+        self.assertEqual(generate_catalog.parse_count('2.5M'), 2500000)
+        self.assertEqual(generate_catalog.parse_count('1_000'), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Keyset Pagination Test
+Walks both listings with next_cursor to the end and back with prev_cursor,
+for every sort field and order, and checks each page against the offset
+page with the same number, so ties, page boundaries and the reversal of
+backward pages all agree. Cursors do not carry the filters, so every
+request repeats them. Also checks the 400s for malformed cursors and for
+a cursor used with a different sort.
+"""
+
+import base64
+import json
+import unittest
+
+import products_api
+from api_fixtures import ApiTestCase
+
+LIMIT = 40
+
+LISTINGS = ['/api/products?category=Jeans', '/api/departments/1/products?min_price=20']
+
+
+class KeysetPaginationTest(ApiTestCase):
+    """Cursor pages must be exactly the offset pages, forwards and backwards"""
+
+    product_count = 1500
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.get_json()
+
+    def ids(self, data):
+        return [product['id'] for product in data['products']]
+
+    def offset_pages(self, url):
+        """Product ids of every offset page, in order"""
+        pages = []
+        page = 1
+        while True:
+            data = self.get(f"{url}&page={page}&limit={LIMIT}")
+            pages.append(self.ids(data))
+            if not data['pagination']['has_next']:
+                return pages
+            page += 1
+
+    def test_cursors_match_offset_pages(self):
+        for listing in LISTINGS:
+            for sort_by in products_api.VALID_SORT_FIELDS:
+                for sort_order in ('asc', 'desc'):
+                    url = f"{listing}&sort_by={sort_by}&sort_order={sort_order}"
+                    expected = self.offset_pages(url)
+                    self.assertGreater(len(expected), 2, url)
+
+                    # Forwards to the last page
+                    data = self.get(f"{url}&limit={LIMIT}")
+                    forward = [self.ids(data)]
+                    while data['pagination']['next_cursor']:
+                        self.assertTrue(data['pagination']['has_next'])
+                        data = self.get(f"{listing}&cursor={data['pagination']['next_cursor']}&limit={LIMIT}")
+                        self.assertEqual(data['filters']['sort_by'], sort_by)
+                        self.assertEqual(data['filters']['sort_order'], sort_order)
+                        forward.append(self.ids(data))
+                    self.assertFalse(data['pagination']['has_next'], url)
+                    self.assertEqual(forward, expected, url)
+
+                    # And back to the first
+                    backward = [self.ids(data)]
+                    while data['pagination']['prev_cursor']:
+                        data = self.get(f"{listing}&cursor={data['pagination']['prev_cursor']}&limit={LIMIT}")
+                        backward.append(self.ids(data))
+                    self.assertFalse(data['pagination']['has_prev'], url)
+                    self.assertEqual(backward[::-1], expected, url)
+
+    def test_after_is_an_alias(self):
+        first = self.get(f"/api/products?sort_by=name&limit={LIMIT}")
+        token = first['pagination']['next_cursor']
+        after = self.get(f"/api/products?after={token}&limit={LIMIT}")
+        self.assertEqual(after['pagination'], self.get(f"/api/products?cursor={token}&limit={LIMIT}")['pagination'])
+        self.assertEqual(self.ids(after), self.ids(self.get(f"/api/products?page=2&sort_by=name&limit={LIMIT}")))
+
+    def test_malformed_cursor(self):
+        garbage = base64.urlsafe_b64encode(json.dumps(['name', 'asc', 'next', 'x']).encode()).decode()
+        bad_sort = base64.urlsafe_b64encode(json.dumps(['sku', 'asc', 'next', 'x', 1]).encode()).decode()
+        bad_id = base64.urlsafe_b64encode(json.dumps(['name', 'asc', 'next', 'x', '1']).encode()).decode()
+        bool_id = base64.urlsafe_b64encode(json.dumps(['name', 'asc', 'next', 'x', True]).encode()).decode()
+        list_value = base64.urlsafe_b64encode(json.dumps(['brand', 'asc', 'next', [1, 2], 5]).encode()).decode()
+        object_value = base64.urlsafe_b64encode(json.dumps(['cost', 'desc', 'prev', {}, 5]).encode()).decode()
+        bool_value = base64.urlsafe_b64encode(json.dumps(['cost', 'asc', 'next', False, 5]).encode()).decode()
+        null_value = base64.urlsafe_b64encode(json.dumps(['name', 'asc', 'next', None, 5]).encode()).decode()
+        for token in ('not-a-cursor', '%%%', garbage, bad_sort, bad_id, bool_id,
+                      list_value, object_value, bool_value, null_value):
+            for path in ('/api/products', '/api/departments/1/products'):
+                url = f"{path}?cursor={token}"
+                self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_cursor_for_another_sort(self):
+        first = self.get(f"/api/products?sort_by=retail_price&sort_order=desc&limit={LIMIT}")
+        token = first['pagination']['next_cursor']
+        self.assertEqual(self.client.get(f"/api/products?cursor={token}&sort_by=name").status_code, 400)
+        self.assertEqual(self.client.get(f"/api/products?cursor={token}&sort_order=asc").status_code, 400)
+        # Repeating the cursor's own sort is allowed
+        same = self.get(f"/api/products?cursor={token}&sort_by=retail_price&sort_order=desc&limit={LIMIT}")
+        self.assertEqual(self.ids(same),
+                         self.ids(self.get(f"/api/products?page=2&sort_by=retail_price&sort_order=desc&limit={LIMIT}")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Listing Count Test
+Checks the total count strategies of the paginated listings on a scratch
+database: count=exact is cached per filter combination, count=estimate
+comes from the catalog statistics and count=none leaves the total out.
+Also covers the CountCache TTL and LRU eviction, that the statistics are
+read from the summary tables without scanning products, and the rate limit
+on reloading them after catalog changes.
+"""
+
+import sqlite3
+import time
+import unittest
+
+import products_api
+from api_fixtures import ApiTestCase
+from listing_counts import CountCache, CatalogStatistics
+
+
+class CountCacheTest(unittest.TestCase):
+    """Exact counts expire after ttl and the least recently used go first"""
+
+    def test_ttl(self):
+        cache = CountCache(ttl=0.05)
+        cache.put('a', 10)
+        self.assertEqual(cache.get('a'), 10)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = CountCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+        cache.put('a', 4)
+        self.assertEqual(cache.get('a'), 4)
+        cache.clear()
+        self.assertIsNone(cache.get('c'))
+
+
+class ListingCountTest(ApiTestCase):
+    """Each count mode must give the total it promises"""
+
+    product_count = 2000
+    # The columnar index always has the exact count; these are the SQL path's strategies
+    use_columnar_index = False
+
+    def setUp(self):
+        products_api.count_cache.clear()
+        self.conn = sqlite3.connect(self.db_path)
+        self.addCleanup(self.conn.close)
+
+    def count(self, where="", params=()):
+        return self.conn.execute(f"SELECT COUNT(*) FROM products {where}", params).fetchone()[0]
+
+    def pagination(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.get_json()['pagination']
+
+    def test_exact_counts_are_cached(self):
+        url = '/api/products?category=Jeans&brand=Brand%203'
+        expected = self.count("WHERE category = ? AND brand = ?", ('Jeans', 'Brand 3'))
+        self.assertEqual(self.pagination(url)['total_count'], expected)
+        hits = products_api.count_cache.hits
+        second = self.pagination(url + '&page=2')
+        self.assertEqual(second['total_count'], expected)
+        self.assertEqual(products_api.count_cache.hits, hits + 1)
+
+    def test_estimate(self):
+        # A single column filter is estimated from its exact group count
+        pagination = self.pagination('/api/products?category=Swim&count=estimate')
+        self.assertEqual(pagination['count_mode'], 'estimate')
+        self.assertEqual(pagination['total_count'], self.count("WHERE category = 'Swim'"))
+
+        # Prices come from a sample, so only close
+        estimated = self.pagination('/api/products?min_price=50&max_price=150&count=estimate')['total_count']
+        actual = self.count("WHERE retail_price BETWEEN 50 AND 150")
+        self.assertLess(abs(estimated - actual), actual * 0.1)
+
+        department = self.pagination('/api/departments/1/products?count=estimate')
+        self.assertEqual(department['total_count'], self.count("WHERE department_id = 1"))
+
+        # Search has no statistics and is counted exactly
+        search = self.pagination('/api/products?search=brand%203&count=estimate')
+        self.assertEqual(search['total_count'], self.count(
+            "WHERE id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)",
+            (products_api.build_fts_query('brand 3'),)))
+
+    def test_none(self):
+        expected = self.count("WHERE category = 'Socks'")
+        first = self.pagination('/api/products?category=Socks&count=none&limit=50')
+        self.assertIsNone(first['total_count'])
+        self.assertIsNone(first['total_pages'])
+        self.assertTrue(first['has_next'])
+
+        last_page = -(-expected // 50)
+        last = self.pagination(f'/api/products?category=Socks&count=none&limit=50&page={last_page}')
+        self.assertFalse(last['has_next'])
+        self.assertIsNone(last['total_count'])
+
+    def test_statistics_reload_is_rate_limited(self):
+        stats = CatalogStatistics(min_reload_interval=60.0)
+        stats.ensure_loaded(self.conn, revision=1)
+        total = stats.total
+        self.conn.execute("""
+            INSERT INTO products (id, cost, category, name, brand, retail_price, department, sku,
+                                  distribution_center_id)
+            VALUES (90001, 10.0, 'Jeans', 'New Jeans', 'Brand 3', 49.99, 'Women', 'SKUX1', 1)
+        """)
+        try:
+            # A new revision within min_reload_interval keeps the loaded statistics
+            stats.ensure_loaded(self.conn, revision=2)
+            self.assertEqual(stats.total, total)
+
+            stats.min_reload_interval = 0
+            stats.ensure_loaded(self.conn, revision=2)
+            self.assertEqual(stats.total, total + 1)
+        finally:
+            self.conn.rollback()
+
+        stats.ensure_loaded(self.conn, revision=2)
+        self.assertEqual(stats.total, total + 1)
+        stats.invalidate()
+        stats.ensure_loaded(self.conn, revision=2)
+        self.assertEqual(stats.total, total)
+
+    def test_statistics_come_from_the_summary_tables(self):
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        stats = CatalogStatistics()
+        stats.ensure_loaded(self.conn)
+        self.conn.set_trace_callback(None)
+
+        # The price sample looks rows up by id, which on a catalog this small
+        # the planner may serve from a covering index instead
+        counting = [sql for sql in statements if 'retail_price' not in sql]
+        self.assertEqual(len(counting), len(statements) - 4)
+        for sql in counting:
+            plan = self.conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            # products is only read by primary key, never scanned (not even an index)
+            scans = [row[3] for row in plan if row[3].startswith('SCAN') and 'products' in row[3].split()]
+            self.assertEqual(scans, [], sql)
+        self.assertEqual(stats.total, self.count())
+        for column in ('category', 'brand', 'department', 'department_id'):
+            expected = dict(self.conn.execute(
+                f"SELECT {column}, COUNT(*) FROM products WHERE {column} IS NOT NULL GROUP BY {column}"))
+            self.assertEqual(stats.by_column[column], expected, column)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Metrics Test
+Drives a few routes through the Flask test client against a scratch
+database and checks what /metrics reports for them: request counts by
+route template and status, latency histograms, SQL statements and rows
+per request, response sizes and the in-flight gauge. Also checks that
+only local requests, or ones with the admin token, can read it and
+/api/cache/stats, and that neither sends CORS headers.
+"""
+
+import re
+import unittest
+
+import products_api
+from api_fixtures import ApiTestCase
+from metrics import Histogram, MetricsRegistry, RequestStats, TimedCursor
+
+SAMPLE = re.compile(r'^(\w+)(\{.*\})? (\S+)$')
+
+
+def parse_metrics(text):
+    """{(name, labels): value} of every sample in a Prometheus text body"""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        samples[(name, labels or '')] = float(value)
+    return samples
+
+
+class MetricsTest(ApiTestCase):
+    """/metrics must account for every request"""
+
+    pool_options = {'cursor_factory': TimedCursor}
+
+    def metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        return parse_metrics(response.get_data(as_text=True))
+
+    def test_route_metrics(self):
+        detail = '{route="/api/products/<int:product_id>"}'
+        before = self.metrics()
+        self.client.get('/api/products/42')
+        self.client.get('/api/products/999999')
+        self.client.get('/no/such/route')
+        after = self.metrics()
+
+        def delta(name, labels):
+            return after.get((name, labels), 0) - before.get((name, labels), 0)
+
+        self.assertEqual(delta('products_api_http_requests_total',
+                               '{route="/api/products/<int:product_id>",method="GET",status="200"}'), 1)
+        self.assertEqual(delta('products_api_http_requests_total',
+                               '{route="/api/products/<int:product_id>",method="GET",status="404"}'), 1)
+        self.assertEqual(delta('products_api_http_requests_total',
+                               '{route="unmatched",method="GET",status="404"}'), 1)
+        self.assertEqual(delta('products_api_http_request_duration_seconds_count',
+                               '{route="/api/products/<int:product_id>",method="GET"}'), 2)
+        self.assertGreater(delta('products_api_sql_statements_total', detail), 0)
+        self.assertGreater(delta('products_api_sql_duration_seconds_sum', detail), 0)
+        # The product found, plus the catalog revision lookups
+        self.assertGreaterEqual(delta('products_api_rows_returned_sum', detail), 1)
+        self.assertGreater(delta('products_api_response_size_bytes_sum', detail), 0)
+        self.assertGreater(delta('products_api_serialization_duration_seconds_sum', detail), 0)
+        self.assertEqual(after[('products_api_http_requests_in_flight', detail)], 0)
+        self.assertEqual(after[('products_api_http_requests_in_flight', '{route="/metrics"}')], 1)
+
+    def test_streamed_response_size_not_counted(self):
+        before = self.metrics()
+        response = self.client.get('/api/products/export?format=csv')
+        self.assertGreater(len(response.get_data()), 0)
+        after = self.metrics()
+        labels = '{route="/api/products/export"}'
+        self.assertEqual(after[('products_api_response_size_bytes_count', labels)],
+                         before.get(('products_api_response_size_bytes_count', labels), 0))
+        self.assertEqual(after[('products_api_http_requests_in_flight', labels)], 0)
+
+    def test_remote_access_needs_the_token(self):
+        remote = {'REMOTE_ADDR': '203.0.113.7'}
+        self.assertEqual(self.client.get('/metrics', environ_base=remote).status_code, 403)
+
+        saved = products_api.admin_token
+        self.addCleanup(setattr, products_api, 'admin_token', saved)
+        products_api.admin_token = 'scrape-secret'
+        self.assertEqual(self.client.get('/metrics', environ_base=remote).status_code, 403)
+        self.assertEqual(self.client.get('/metrics', environ_base=remote, headers={
+            'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get('/metrics', environ_base=remote, headers={
+            'Authorization': 'Bearer scrape-secret'}).status_code, 200)
+        self.assertEqual(self.client.get('/metrics', environ_base={'REMOTE_ADDR': '::1'}).status_code, 200)
+
+        # The catalog itself stays public
+        self.assertEqual(self.client.get('/api/products/42', environ_base=remote).status_code, 200)
+
+    def test_no_cors_on_metrics(self):
+        origin = {'Origin': 'https://shop.example'}
+        self.assertIn('Access-Control-Allow-Origin', self.client.get('/api/products/42', headers=origin).headers)
+        self.assertNotIn('Access-Control-Allow-Origin', self.client.get('/metrics', headers=origin).headers)
+        self.assertNotIn('Access-Control-Allow-Origin', self.client.get('/api/cache/stats', headers=origin).headers)
+
+    def test_cache_stats_needs_the_token(self):
+        remote = {'REMOTE_ADDR': '203.0.113.7'}
+        saved = products_api.admin_token
+        self.addCleanup(setattr, products_api, 'admin_token', saved)
+        products_api.admin_token = 'scrape-secret'
+        self.assertEqual(self.client.get('/api/cache/stats', environ_base=remote).status_code, 403)
+        self.assertEqual(self.client.get('/api/cache/stats', environ_base=remote, headers={
+            'Authorization': 'Bearer scrape-secret'}).status_code, 200)
+        self.assertEqual(self.client.get('/api/cache/stats').status_code, 200)
+
+    def test_histogram_rendering(self):
+        histogram = Histogram((1, 5))
+        for value in (0.5, 1, 3, 7):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+
+        registry = MetricsRegistry()
+        stats = RequestStats('/a"b', 'GET')
+        registry.started(stats)
+        registry.record(stats, 200, 10)
+        registry.finished(stats)
+        samples = parse_metrics(registry.render())
+        labels = '{route="/a\\"b",method="GET"'
+        self.assertEqual(samples[('products_api_http_request_duration_seconds_bucket', labels + ',le="+Inf"}')], 1)
+        self.assertEqual(samples[('products_api_http_request_duration_seconds_count', labels + '}')], 1)
+        self.assertEqual(samples[('products_api_response_size_bytes_bucket', '{route="/a\\"b",le="256"}')], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Performance Regression Test
+Drives every API route through the Flask test client against a generated
+catalog (generate_catalog.py, fixed seed and size): every filter
+combination of both listings, every sort, deep offset and keyset pages,
+count strategies, projections, exports, facets, stats, suggestions and the
+admin routes. Each request is warmed up once, timed REPEAT times (best run
+kept) and run once more under tracemalloc for its peak allocation.
+
+The results are compared with performance_baselines.json and the test
+fails when a request allocates more than the tolerance allows, or, with
+PERF_CHECK=1, got slower. Timings of a few milliseconds swing too much
+with machine load for the default run, so the latency check is opt-in;
+run it on a quiet machine. Latency limits are scaled by a fixed calibration workload, so a
+slower or faster machine does not read as a regression; baselines recorded
+under another Python, SQLite or JSON backend, or without the columnar
+index, are not compared at all.
+
+    python -m pytest test_performance.py                       # check allocations
+    PERF_CHECK=1 python -m pytest test_performance.py          # and latency
+    PERF_UPDATE_BASELINES=1 python -m pytest test_performance.py  # re-record
+
+PERF_TIME_TOLERANCE (default 0.5, i.e. +50%) and PERF_ALLOC_TOLERANCE
+(default 0.25) set how much worse a request may get.
+"""
+
+import contextlib
+import gc
+import io
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import time
+import tracemalloc
+import unittest
+import logging
+
+import products_api
+import query_builder
+from api_fixtures import ApiTestCase
+from generate_catalog import CatalogGenerator, write_database
+from metrics import TimedCursor
+from query_builder import VALID_SORT_FIELDS
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'performance_baselines.json')
+
+CATALOG = {'products': 20000, 'seed': 2024}
+REPEAT = 7
+TIME_TOLERANCE = float(os.environ.get('PERF_TIME_TOLERANCE', 0.5))
+ALLOC_TOLERANCE = float(os.environ.get('PERF_ALLOC_TOLERANCE', 0.25))
+# Absolute allowances on top, so sub-millisecond requests don't fail on jitter
+TIME_SLACK_MS = 1.0
+ALLOC_SLACK_KIB = 32
+UPDATE_BASELINES = os.environ.get('PERF_UPDATE_BASELINES') == '1'
+# The latency comparison only runs when asked for; see the module docstring
+CHECK_LATENCY = os.environ.get('PERF_CHECK') == '1'
+
+# Routes without a scenario; static files are not part of the API
+UNMEASURED_ENDPOINTS = {'static'}
+
+
+def environment():
+    """What the numbers depend on besides the code and the machine's speed"""
+    return {
+        'python': platform.python_version().rsplit('.', 1)[0],
+        'sqlite': sqlite3.sqlite_version,
+        'json_backend': products_api.json_backend,
+        'columnar_index': products_api.columnar_index is not None
+    }
+
+
+def calibrate(db_path):
+    """Best time in ms of a fixed SQLite and Python workload, the machine's speed"""
+    conn = sqlite3.connect(db_path)
+    try:
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            rows = conn.execute("SELECT brand, COUNT(*), SUM(retail_price) FROM products "
+                                "GROUP BY brand").fetchall()
+            json.dumps(sorted(rows, key=lambda row: -row[1]))
+            sorted(str(value) for value in range(50000))
+            timings.append(time.perf_counter() - started)
+    finally:
+        conn.close()
+    return round(min(timings) * 1000, 3)
+
+
+def combinations(filter_values):
+    """Query strings of every subset of the filters, the empty one first"""
+    names = list(filter_values)
+    for size in range(len(names) + 1):
+        for combo in itertools.combinations(names, size):
+            yield "&".join(f"{name}={filter_values[name]}" for name in combo)
+
+
+def with_query(path, query):
+    return f"{path}?{query}" if query else path
+
+
+class PerformanceRegressionTest(ApiTestCase):
+    """No route may get slower or allocate more than its baseline allows"""
+
+    # The same set-up as production, minus the response cache so every
+    # request does its work, and with no slow query file
+    pool_options = {'cached_statements': query_builder.STATEMENT_CACHE_SIZE, 'cursor_factory': TimedCursor}
+    log_level = logging.WARNING
+
+    @classmethod
+    def build_database(cls, db_path):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.catalog = write_database(CatalogGenerator(**CATALOG), db_path)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.results = {}
+        for name, method, url, body in cls.scenarios():
+            cls.results[name] = cls.measure(method, url, body)
+        cls.calibration_ms = calibrate(cls.db_path)
+
+        if UPDATE_BASELINES:
+            with open(BASELINES_PATH, 'w', encoding='utf-8') as baselines_file:
+                json.dump({
+                    'catalog': {key: cls.catalog[key] for key in
+                                ('generator_version', 'seed', 'products', 'rows_sha256')},
+                    'environment': environment(),
+                    'calibration_ms': cls.calibration_ms,
+                    'routes': cls.results
+                }, baselines_file, indent=2)
+                baselines_file.write("\n")
+
+    @classmethod
+    def values(cls):
+        """Filter values that match a fair share of the generated catalog"""
+        conn = sqlite3.connect(cls.db_path)
+        try:
+            brand = conn.execute("SELECT brand FROM products WHERE department = 'Women' AND category = 'Jeans' "
+                                 "GROUP BY brand ORDER BY COUNT(*) DESC, brand LIMIT 1").fetchone()[0]
+            women_id = conn.execute("SELECT id FROM departments WHERE name = 'Women'").fetchone()[0]
+            jeans_count = conn.execute("SELECT COUNT(*) FROM products WHERE category = 'Jeans'").fetchone()[0]
+        finally:
+            conn.close()
+        return brand, women_id, jeans_count
+
+    @classmethod
+    def scenarios(cls):
+        """(name, method, url, JSON body) of every measured request"""
+        brand, women_id, jeans_count = cls.values()
+        products = CATALOG['products']
+        scenarios = []
+
+        def get(url, name=None):
+            scenarios.append((name or f"GET {url}", 'GET', url, None))
+
+        # Every filter combination of both listings
+        for query in combinations({'category': 'Jeans', 'brand': brand.replace(' ', '%20'),
+                                   'department': 'Women', 'min_price': '30', 'max_price': '120',
+                                   'search': 'merino'}):
+            get(with_query('/api/products', query))
+        for query in combinations({'category': 'Jeans', 'brand': brand.replace(' ', '%20'),
+                                   'min_price': '30', 'max_price': '120', 'search': 'merino'}):
+            get(with_query(f'/api/departments/{women_id}/products', query))
+
+        # Every sort, over the whole catalog and within a category
+        for sort_by, sort_order in itertools.product(VALID_SORT_FIELDS, ('asc', 'desc')):
+            get(f'/api/products?sort_by={sort_by}&sort_order={sort_order}')
+            get(f'/api/products?category=Jeans&sort_by={sort_by}&sort_order={sort_order}')
+        get('/api/products?search=merino&sort_by=relevance')
+
+        # Deep pages by offset, and the keyset page that replaces them
+        last_page = products // 20
+        for page in (50, last_page // 2, last_page):
+            get(f'/api/products?page={page}')
+            get(f'/api/products?sort_by=retail_price&page={page}')
+        get(f'/api/products?category=Jeans&sort_by=name&page={-(-jeans_count // 20)}')
+        deep = cls.client.get(f'/api/products?sort_by=retail_price&page={last_page // 2}').get_json()
+        get(f"/api/products?cursor={deep['pagination']['next_cursor']}",
+            f"GET /api/products?sort_by=retail_price cursor after page {last_page // 2}")
+
+        # Count strategies, page sizes, projections and id lookups
+        for count_mode in ('estimate', 'none'):
+            get(f'/api/products?category=Jeans&min_price=30&count={count_mode}')
+        get('/api/products?limit=100')
+        get('/api/products?fields=name,retail_price&limit=100')
+        get('/api/products?format=compact&limit=100')
+        get('/api/products?ids=' + ','.join(str(product_id) for product_id in range(1, products, products // 100)))
+        get(f'/api/products/{products // 2}')
+        scenarios.append(('POST /api/products/batch (200 ids)', 'POST', '/api/products/batch',
+                          {'ids': list(range(7, products, products // 200))}))
+
+        get('/api/products/export?category=Jeans')
+        get('/api/products/export?category=Jeans&format=csv')
+        get('/api/products/export?department=Women&min_price=100')
+
+        for query in ('', 'category=Jeans&min_price=30', 'department=Women&brand=' + brand.replace(' ', '%20'),
+                      'search=merino'):
+            get(with_query('/api/products/facets', query))
+        get('/api/products/stats')
+        for prefix in ('u', 'mer', 'merino%20jo', brand[:4].lower()):
+            get(f'/api/products/suggest?q={prefix}')
+
+        get('/api/departments')
+        get(f'/api/departments/{women_id}')
+        for url in ('/', '/health', '/api/cache/stats', '/api/admin/slow-queries', '/metrics'):
+            get(url)
+        return scenarios
+
+    @classmethod
+    def measure(cls, method, url, body):
+        """Best and median latency in ms over REPEAT runs, and peak KiB allocated by one run"""
+
+        def call():
+            response = cls.client.open(url, method=method, json=body)
+            response.get_data()
+            # Streamed exports hand their connection back on close
+            response.close()
+            if response.status_code != 200:
+                raise AssertionError(f"{method} {url} returned {response.status_code}")
+
+        # Caches, compiled statements and in-memory indexes as in steady state
+        call()
+        gc.collect()
+        timings = []
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'best_ms': round(min(timings) * 1000, 3),
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'peak_kib': round(peak / 1024, 1)
+        }
+
+    def baselines(self):
+        """The recorded baselines, or skip when there are none comparable to this run"""
+        if UPDATE_BASELINES:
+            self.skipTest(f"baselines re-recorded in {os.path.basename(BASELINES_PATH)}")
+        try:
+            with open(BASELINES_PATH, encoding='utf-8') as baselines_file:
+                baselines = json.load(baselines_file)
+        except FileNotFoundError:
+            self.skipTest("no baselines; record them with PERF_UPDATE_BASELINES=1")
+        if baselines['catalog']['rows_sha256'] != self.catalog['rows_sha256']:
+            self.skipTest("baselines were recorded on a different catalog; re-record them")
+        if baselines['environment'] != environment():
+            self.skipTest(f"baselines were recorded under {baselines['environment']}, "
+                          f"this run is {environment()}")
+        return baselines
+
+    def test_every_route_measured(self):
+        adapter = products_api.app.url_map.bind('localhost')
+        measured = {adapter.match(url.split('?')[0], method)[0]
+                    for _, method, url, _ in self.scenarios()}
+        routes = {rule.endpoint for rule in products_api.app.url_map.iter_rules()}
+        self.assertEqual(routes - UNMEASURED_ENDPOINTS - measured, set())
+
+    @unittest.skipUnless(CHECK_LATENCY, "latency is only compared with PERF_CHECK=1")
+    def test_latency(self):
+        baselines = self.baselines()
+        # How much slower (or faster) this machine is than the one that recorded the baselines
+        scale = self.calibration_ms / baselines['calibration_ms']
+        failures = []
+        for name, result in self.results.items():
+            baseline = baselines['routes'].get(name)
+            if baseline is None:
+                failures.append(f"{name}: no baseline")
+                continue
+            limit = baseline['best_ms'] * scale * (1 + TIME_TOLERANCE) + TIME_SLACK_MS
+            if result['best_ms'] > limit:
+                failures.append(f"{name}: {result['best_ms']:.2f} ms, baseline {baseline['best_ms']:.2f} ms "
+                                f"(limit {limit:.2f} ms at machine scale {scale:.2f})")
+        self.assertFalse(failures, "Slower than baseline:\n" + "\n".join(failures))
+
+    def test_allocations(self):
+        baselines = self.baselines()
+        failures = []
+        for name, result in self.results.items():
+            baseline = baselines['routes'].get(name)
+            if baseline is None:
+                failures.append(f"{name}: no baseline")
+                continue
+            limit = baseline['peak_kib'] * (1 + ALLOC_TOLERANCE) + ALLOC_SLACK_KIB
+            if result['peak_kib'] > limit:
+                failures.append(f"{name}: {result['peak_kib']:.1f} KiB, baseline {baseline['peak_kib']:.1f} KiB "
+                                f"(limit {limit:.1f} KiB)")
+        self.assertFalse(failures, "More allocation than baseline:\n" + "\n".join(failures))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Product Statistics Test
+Checks that the trigger-maintained summary tables behind /api/products/stats
+stay identical to a full recomputation after inserts, updates and deletes.
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import logging
+
+from migrations import PRODUCT_STATS_GROUPS, rebuild_product_stats
+from api_fixtures import build_test_database
+
+
+def snapshot_stats(conn):
+    """Read every summary table, rounding sums so float drift doesn't matter"""
+    snapshot = {
+        'overall': conn.execute("""
+            SELECT product_count, ROUND(price_sum, 4), ROUND(cost_sum, 4),
+                   min_price, max_price, min_cost, max_cost
+            FROM product_stats_overall
+        """).fetchall()
+    }
+    for table, column in PRODUCT_STATS_GROUPS:
+        snapshot[table] = conn.execute(f"""
+            SELECT {column}, product_count, ROUND(price_sum, 4), ROUND(cost_sum, 4),
+                   min_price, max_price
+            FROM {table} ORDER BY {column}
+        """).fetchall()
+    return snapshot
+
+
+class ProductStatsTest(unittest.TestCase):
+    """Incremental maintenance must match a rebuild from the products table"""
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(self.temp_dir, 'ecommerce.db')
+        build_test_database(db_path, product_count=2000)
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.temp_dir)
+        logging.disable(logging.NOTSET)
+
+    def assert_matches_rebuild(self):
+        maintained = snapshot_stats(self.conn)
+        self.conn.execute("BEGIN")
+        rebuild_product_stats(self.conn.cursor())
+        rebuilt = snapshot_stats(self.conn)
+        self.conn.execute("ROLLBACK")
+        self.assertEqual(maintained, rebuilt)
+
+    def test_random_mutations(self):
+        rng = random.Random(11)
+        for step in range(1500):
+            product_id = rng.randint(1, 2000)
+            roll = rng.random()
+            if roll < 0.3:
+                self.conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            elif roll < 0.7:
+                self.conn.execute("""
+                    UPDATE products
+                    SET retail_price = ?, cost = ?, category = ?, department_id = ?
+                    WHERE id = ?
+                """, (round(rng.uniform(1, 400), 2), round(rng.uniform(0.5, 120), 2),
+                      rng.choice(['Jeans', 'Swim', 'New Category']), rng.choice([1, 2, None]),
+                      product_id))
+            else:
+                self.conn.execute("""
+                    INSERT INTO products (id, cost, category, name, brand, retail_price,
+                                          department, sku, distribution_center_id, department_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (10000 + step, 2.5, 'Extremes', f'Extreme {step}', 'Edge Brand',
+                      rng.choice([0.01, 50.0, 9999.0]), 'Men', f'EXT{step}', 11, 1))
+        self.assert_matches_rebuild()
+
+    def test_empty_catalog(self):
+        self.conn.execute("DELETE FROM products")
+        self.assert_matches_rebuild()
+        row = self.conn.execute("SELECT product_count, min_price FROM product_stats_overall").fetchone()
+        self.assertEqual(row, (0, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
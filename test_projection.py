@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Projection Test
+Requests listings with fields= and format=compact and checks that only the
+requested columns are returned and selected, that cursors still work when
+the sort column is left out, and that unknown fields are rejected.
+"""
+
+import unittest
+
+from api_fixtures import QueryPlanTestCase
+
+
+class ProjectionTest(QueryPlanTestCase):
+    """Projected and compact listings must carry exactly the requested columns"""
+
+    def test_projection_plans(self):
+        url = '/api/products?category=Jeans&sort_by=retail_price&limit=20&fields=name,brand'
+        projected = self.get(url)
+        self.assertEqual(set(projected['products'][0]), {'id', 'name', 'brand'})
+        page_sql = [sql for sql in self.statements if 'LIMIT' in sql]
+        self.assertTrue(page_sql)
+        self.assertNotIn('p.sku', page_sql[-1])
+        self.assertNotIn('d.description', page_sql[-1])
+
+        # The sort column is read for the cursor even though it is not returned
+        following = self.get(f"/api/products?fields=name,brand&cursor={projected['pagination']['next_cursor']}")
+        self.assertEqual(set(following['products'][0]), {'id', 'name', 'brand'})
+
+        compact = self.get(url + '&format=compact')
+        self.assertEqual(compact['columns'], ['id', 'name', 'brand'])
+        self.assertEqual(compact['rows'], [[p['id'], p['name'], p['brand']] for p in projected['products']])
+        self.assertEqual(self.client.get('/api/products?fields=password').status_code, 400)
+
+        self.get('/api/departments/1/products?format=compact&fields=name,retail_price&sort_by=name')
+        self.assert_no_full_scans()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Query Plan Test
+Drives every API route through the Flask test client against a migrated
+scratch database, captures each SQL statement the API issues and runs
+EXPLAIN QUERY PLAN on it. Fails if any statement falls back to a full scan
+of the products table.
+"""
+
+import unittest
+
+import products_api
+from api_fixtures import QueryPlanTestCase, listing_urls
+
+
+class QueryPlanTest(QueryPlanTestCase):
+    """Every statement the API generates must be served from an index"""
+
+    def walk_listing(self, urls):
+        """Fetch page 1, page 3 and the keyset page after page 1 for each URL"""
+        for url in urls:
+            first = self.get(url)
+            self.get(url + "&page=3")
+            next_cursor = first['pagination']['next_cursor']
+            if next_cursor:
+                self.get(url.split('?')[0] + f"?cursor={next_cursor}&limit=20")
+
+    def test_product_listing_plans(self):
+        self.walk_listing(listing_urls('/api/products', {
+            'category': 'Jeans',
+            'brand': 'Brand%203',
+            'department': 'Women',
+            'min_price': '50',
+            'max_price': '120'
+        }))
+        self.assert_no_full_scans()
+
+    def test_department_listing_plans(self):
+        self.walk_listing(listing_urls('/api/departments/1/products', {
+            'category': 'Swim',
+            'brand': 'Brand%2011',
+            'min_price': '20',
+            'max_price': '80'
+        }))
+        self.assert_no_full_scans()
+
+    def test_search_plans(self):
+        self.assertEqual(products_api.get_search_backend(), 'fts5')
+        self.walk_listing(listing_urls('/api/products', {
+            'search': 'brand%203%20jea',
+            'category': 'Jeans',
+            'min_price': '50'
+        }))
+        self.walk_listing(listing_urls('/api/departments/2/products', {
+            'search': 'sweat',
+            'brand': 'Brand%205'
+        }))
+        for url in ('/api/products?search=brand%207', '/api/departments/1/products?search=swim'):
+            self.get(url)
+        self.assert_no_full_scans()
+
+    def test_count_strategy_plans(self):
+        for count_mode in ('estimate', 'none'):
+            self.get(f"/api/products?category=Jeans&count={count_mode}")
+            self.get(f"/api/departments/2/products?min_price=40&count={count_mode}")
+        self.assert_no_full_scans()
+
+    def test_detail_and_stats_plans(self):
+        for url in ('/health', '/api/products/42', '/api/products/stats',
+                    '/api/products/facets', '/api/products/facets?category=Jeans&min_price=50',
+                    '/api/products/facets?search=brand%203', '/api/products/suggest?q=jea',
+                    '/api/departments', '/api/departments/1'):
+            self.get(url)
+        self.assert_no_full_scans()
+
+
+if __name__ == '__main__':
+    unittest.main()
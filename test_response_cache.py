@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Response Cache Test
+Checks response_cache.ResponseCache on its own: the total body size stays
+within max_bytes by evicting the least recently used entries, oversized
+bodies and expired entries are not served, a newer catalog revision drops
+everything, and a request that read an older revision neither reads nor
+stores anything.
+"""
+
+import time
+import unittest
+
+from response_cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Cached bodies must fit the byte budget and belong to the current revision"""
+
+    def put(self, cache, key, size, revision=1, ttl=60):
+        cache.put(key, revision, b'x' * size, 200, 'application/json', ttl)
+
+    def test_byte_bounded_eviction(self):
+        cache = ResponseCache(max_bytes=1000, max_entry_bytes=600)
+        self.put(cache, 'a', 400)
+        self.put(cache, 'b', 400)
+        self.assertIsNotNone(cache.get('a', 1))
+
+        # 'b' is now the least recently used and makes room for 'c'
+        self.put(cache, 'c', 400)
+        self.assertIsNone(cache.get('b', 1))
+        self.assertIsNotNone(cache.get('a', 1))
+        self.assertIsNotNone(cache.get('c', 1))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (2, 800, 1))
+
+        # Larger than max_entry_bytes: never stored
+        self.put(cache, 'd', 601)
+        self.assertIsNone(cache.get('d', 1))
+        self.assertEqual(cache.stats()['bytes'], 800)
+
+        # Replacing an entry accounts for the old body
+        self.put(cache, 'a', 100)
+        self.assertEqual(cache.stats()['bytes'], 500)
+
+    def test_entry_round_trip_and_expiry(self):
+        cache = ResponseCache()
+        cache.put('a', 1, b'{"x": 1}', 200, 'application/json', 0.05)
+        entry = cache.get('a', 1)
+        self.assertEqual((entry.body, entry.status, entry.mimetype), (b'{"x": 1}', 200, 'application/json'))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a', 1))
+        stats = cache.stats()
+        self.assertEqual((stats['expirations'], stats['entries'], stats['bytes']), (1, 0, 0))
+
+    def test_new_revision_clears(self):
+        cache = ResponseCache()
+        self.put(cache, 'a', 10, revision=1)
+        self.put(cache, 'b', 10, revision=1)
+        self.assertIsNone(cache.get('a', 2))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['revision'], stats['invalidations']),
+                         (0, 0, 2, 1))
+
+        # A store at a newer revision clears too
+        self.put(cache, 'a', 10, revision=2)
+        self.put(cache, 'b', 10, revision=3)
+        self.assertIsNone(cache.get('a', 3))
+        self.assertIsNotNone(cache.get('b', 3))
+
+    def test_older_revision_rejected(self):
+        cache = ResponseCache()
+        self.put(cache, 'a', 10, revision=5)
+
+        # A request that read revision 4 is neither served nor stored
+        self.assertIsNone(cache.get('a', 4))
+        self.put(cache, 'b', 10, revision=4)
+        self.assertIsNone(cache.get('b', 5))
+        self.assertIsNotNone(cache.get('a', 5))
+        self.assertEqual(cache.stats()['revision'], 5)
+
+    def test_stats(self):
+        cache = ResponseCache()
+        self.assertIsNone(cache.stats()['hit_ratio'])
+        self.put(cache, 'a', 10)
+        cache.get('a', 1)
+        cache.get('b', 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores'], stats['hit_ratio']), (1, 1, 1, 0.5))
+        cache.clear()
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Product Search Test
+Checks the search filter of /api/products against the products_fts index of
+a scratch database: the triggers keep the index in step with inserts,
+updates and deletes, every word matches as a prefix, and sort_by=relevance
+follows BM25. On a catalog without the index the LIKE fallback returns the
+same rows in id order, and migrating it again on a build with FTS5 creates
+the index.
+"""
+
+import shutil
+import sqlite3
+import unittest
+from urllib.parse import quote
+
+import products_api
+from api_fixtures import ApiTestCase, insert_products
+from migrations import apply_migrations, fts5_available
+
+SEARCHES = ['swim', 'Swim', 'jea', 'tops tee', 'brand 3', 'outerwear coats']
+
+
+def fts5_missing():
+    conn = sqlite3.connect(':memory:')
+    try:
+        return not fts5_available(conn.cursor())
+    finally:
+        conn.close()
+
+
+@unittest.skipIf(fts5_missing(), "this SQLite build has no FTS5")
+class SearchTest(ApiTestCase):
+    """Search results must follow the catalog and rank by BM25"""
+
+    # Search goes through SQL either way; keep writes from starting rebuilds
+    use_columnar_index = False
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.conn = sqlite3.connect(cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        super().tearDownClass()
+
+    def search(self, query, **params):
+        url = f"/api/products?search={quote(query)}&limit=100&count=none" + "".join(
+            f"&{name}={value}" for name, value in params.items())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [product['id'] for product in response.get_json()['products']]
+
+    def test_backend(self):
+        self.assertEqual(products_api.get_search_backend(), 'fts5')
+
+    def test_follows_inserts_updates_and_deletes(self):
+        self.assertEqual(self.search('zebulon'), [])
+        insert_products(self.db_path, [(90001, 10.0, 'Jeans', 'Zebulon Slim Jeans', 'Quillfeather', 49.99,
+                                        'Women', 'SKUZ1', 1)])
+        self.assertEqual(self.search('zebulon'), [90001])
+        self.assertEqual(self.search('quillfeather'), [90001])
+
+        self.conn.execute("UPDATE products SET name = 'Xanthe Slim Jeans' WHERE id = 90001")
+        self.conn.commit()
+        self.assertEqual(self.search('zebulon'), [])
+        self.assertEqual(self.search('xanthe'), [90001])
+
+        self.conn.execute("DELETE FROM products WHERE id = 90001")
+        self.conn.commit()
+        self.assertEqual(self.search('xanthe'), [])
+        self.assertEqual(self.search('quillfeather'), [])
+
+    def test_prefix_matching(self):
+        insert_products(self.db_path, [(90011, 10.0, 'Jeans', 'Calvin Klein Straight', 'Calvin Klein', 79.0,
+                                        'Men', 'SKUC1', 1)])
+        self.addCleanup(self.conn.commit)
+        self.addCleanup(self.conn.execute, "DELETE FROM products WHERE id = 90011")
+
+        for query in ('calv', 'calv kle', 'KLE CALV', 'calvin klein straight'):
+            self.assertEqual(self.search(query), [90011], query)
+        # Words match from their start only, and every word has to match
+        self.assertEqual(self.search('alvin'), [])
+        self.assertEqual(self.search('calv zzz'), [])
+
+    def test_relevance_is_bm25(self):
+        insert_products(self.db_path, [
+            (90021, 10.0, 'Tops & Tees', 'Plain Tee', 'Zephyrine', 19.0, 'Men', 'SKUR1', 1),
+            (90022, 10.0, 'Tops & Tees', 'Zephyrine Zephyrine Tee', 'Acme', 19.0, 'Men', 'SKUR2', 1),
+            (90023, 10.0, 'Tops & Tees', 'Zephyrine Long Sleeve Tee', 'Acme', 19.0, 'Men', 'SKUR3', 1),
+        ])
+        self.addCleanup(self.conn.commit)
+        self.addCleanup(self.conn.execute, "DELETE FROM products WHERE id BETWEEN 90021 AND 90023")
+
+        for query in ['zephyrine'] + SEARCHES:
+            expected = [row[0] for row in self.conn.execute(
+                "SELECT rowid FROM products_fts WHERE products_fts MATCH ? "
+                "ORDER BY bm25(products_fts, 10.0, 4.0, 2.0), rowid",
+                (products_api.build_fts_query(query),))]
+            self.assertEqual(self.search(query, sort_by='relevance'), expected[:100], query)
+            self.assertEqual(self.search(query), expected[:100], query)
+        # The name outweighs the brand
+        self.assertEqual(self.search('zephyrine')[-1], 90021)
+
+
+class LikeFallbackTest(ApiTestCase):
+    """Without products_fts search must fall back to LIKE on the name"""
+
+    use_columnar_index = False
+
+    @classmethod
+    def build_database(cls, db_path):
+        super().build_database(db_path)
+        # The same catalog with its search index, for comparison
+        cls.fts_path = db_path + '.fts'
+        shutil.copy(db_path, cls.fts_path)
+
+        conn = sqlite3.connect(db_path)
+        for trigger in ('products_fts_insert', 'products_fts_delete', 'products_fts_update'):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute("DROP TABLE IF EXISTS products_fts")
+        conn.commit()
+        conn.close()
+
+    def setUp(self):
+        self.addCleanup(products_api._search_backends.pop, self.db_path, None)
+
+    def search(self, query, **params):
+        url = f"/api/products?search={quote(query)}&limit=100&count=none" + "".join(
+            f"&{name}={value}" for name, value in params.items())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [product['id'] for product in response.get_json()['products']]
+
+    def test_backend(self):
+        self.assertEqual(products_api.get_search_backend(), 'like')
+
+    @unittest.skipIf(fts5_missing(), "this SQLite build has no FTS5")
+    def test_same_rows_in_id_order(self):
+        conn = sqlite3.connect(self.fts_path)
+        self.addCleanup(conn.close)
+        # LIKE matches the name only, so the FTS rows compared are those whose name has the text
+        for query in ('swim', 'Jeans', 'Brand 3', 'Outerwear'):
+            expected = [row[0] for row in conn.execute(
+                "SELECT rowid FROM products_fts WHERE products_fts MATCH ? ORDER BY rowid",
+                (products_api.build_fts_query(query),))
+                if query.lower() in conn.execute("SELECT lower(name) FROM products WHERE id = ?",
+                                                 (row[0],)).fetchone()[0]]
+            self.assertTrue(expected, query)
+            self.assertEqual(self.search(query), expected[:100], query)
+            self.assertEqual(self.search(query, sort_by='relevance'), expected[:100], query)
+
+    @unittest.skipIf(fts5_missing(), "this SQLite build has no FTS5")
+    def test_migrating_again_creates_the_index(self):
+        db_path = self.db_path + '.again'
+        shutil.copy(self.db_path, db_path)
+        conn = sqlite3.connect(db_path)
+        self.addCleanup(conn.close)
+
+        self.assertEqual(apply_migrations(conn), [])
+        self.assertEqual(conn.execute(
+            "SELECT count(*) FROM products_fts WHERE products_fts MATCH 'swim*'").fetchone()[0],
+            conn.execute("SELECT count(*) FROM products WHERE category = 'Swim'").fetchone()[0])
+        # The triggers are back too
+        insert_products(db_path, [(90001, 10.0, 'Swim', 'Zebulon Trunks', 'Acme', 30.0, 'Men', 'SKUZ1', 1)])
+        self.assertEqual(conn.execute(
+            "SELECT rowid FROM products_fts WHERE products_fts MATCH 'zebulon'").fetchall(), [(90001,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
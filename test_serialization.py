@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Serialization Test
+Checks that the orjson provider produces the same documents as Flask's
+stdlib provider, and that tuple rows materialize like sqlite3.Row did.
+"""
+
+import json
+import sqlite3
+import unittest
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+
+SAMPLE = {
+    'products': [
+        {'id': 1, 'name': 'Café Jeans', 'retail_price': 49.0, 'cost': 27.049999,
+         'created_at': None, 'tags': ['a', 'b']},
+        {'id': 2, 'name': 'Tee "Classic"', 'retail_price': 0.1 + 0.2, 'cost': 1e-7,
+         'created_at': '2025-07-31 04:30:58', 'tags': []}
+    ],
+    'pagination': {'page': 1, 'has_next': False, 'total_count': None},
+    'timestamp': datetime(2025, 7, 31, 4, 30, 58, tzinfo=timezone.utc),
+    'day': date(2025, 7, 31),
+    'amount': Decimal('12.50'),
+    'by_id': {3: 'three'}
+}
+
+
+@unittest.skipIf(serialization.orjson is None, "orjson is not installed")
+class OrjsonProviderTest(unittest.TestCase):
+    """The orjson provider must be a drop-in replacement"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def test_same_document(self):
+        for sort_keys in (True, False):
+            stdlib = DefaultJSONProvider(self.app)
+            fast = serialization.OrjsonProvider(self.app)
+            stdlib.sort_keys = fast.sort_keys = sort_keys
+            expected = json.loads(stdlib.dumps(SAMPLE))
+            self.assertEqual(json.loads(fast.dumps(SAMPLE)), expected)
+            # Same key order too
+            self.assertEqual(list(json.loads(fast.dumps(SAMPLE))), list(expected))
+
+    def test_response(self):
+        self.assertEqual(serialization.install_json_provider(self.app, 'orjson'), 'orjson')
+        with self.app.app_context():
+            fast = self.app.json.response(SAMPLE)
+        serialization.install_json_provider(self.app, 'stdlib')
+        with self.app.app_context():
+            stdlib = self.app.json.response(SAMPLE)
+        self.assertEqual(fast.mimetype, 'application/json')
+        self.assertTrue(fast.get_data().endswith(b"\n"))
+        self.assertEqual(json.loads(fast.get_data()), json.loads(stdlib.get_data()))
+
+    def test_keys_stay_sorted(self):
+        self.app.config['JSON_SORT_KEYS'] = False
+        for backend in serialization.JSON_BACKENDS:
+            serialization.install_json_provider(self.app, backend)
+            with self.app.app_context():
+                document = json.loads(self.app.json.response({'b': 1, 'a': {'d': 2, 'c': 3}}).get_data())
+            self.assertEqual(list(document), ['a', 'b'], backend)
+            self.assertEqual(list(document['a']), ['c', 'd'], backend)
+
+
+class RowMaterializationTest(unittest.TestCase):
+
+    def test_rows_to_dicts(self):
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT, price REAL)")
+        conn.executemany("INSERT INTO t VALUES (?, ?, ?)", [(1, 'a', 1.5), (2, None, 2.0)])
+
+        conn.row_factory = sqlite3.Row
+        expected = [{key: row[key] for key in row.keys()}
+                    for row in conn.execute("SELECT id, name, price AS retail_price FROM t")]
+
+        conn.row_factory = None
+        cursor = conn.execute("SELECT id, name, price AS retail_price FROM t")
+        self.assertEqual(serialization.fetch_dicts(cursor), expected)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
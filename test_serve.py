@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Production Server Test
+Checks serve.py: options come from arguments, then PRODUCTS_API_*
+variables, then the defaults; RequestCounter keeps a streamed response in
+flight until it is closed and reports the request limit once; load_api
+repoints both connection pools at the configured database. The last test
+starts the real pre-forking server on a free port against a scratch
+database, sends requests through worker recycling and a reload, and shuts
+it down with SIGTERM; another, started through products_api.py from a copy
+of the sources, checks that a reload runs an edited helper module.
+"""
+
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import urllib.request
+
+import products_api
+import serve
+from api_fixtures import ApiTestCase, build_test_database
+
+
+class ServerConfigTest(unittest.TestCase):
+    """Arguments beat the environment, which beats the defaults"""
+
+    def setUp(self):
+        saved = {name: value for name, value in os.environ.items() if name.startswith('PRODUCTS_API_')}
+        for name in saved:
+            del os.environ[name]
+
+        def restore():
+            for name in [name for name in os.environ if name.startswith('PRODUCTS_API_')]:
+                del os.environ[name]
+            os.environ.update(saved)
+        self.addCleanup(restore)
+
+    def test_defaults(self):
+        config = serve.ServerConfig()
+        for name, (_, default, _) in serve.ServerConfig.OPTIONS.items():
+            self.assertEqual(getattr(config, name), default, name)
+        self.assertEqual(config.access_log, '')
+
+    def test_environment_and_arguments(self):
+        os.environ['PRODUCTS_API_PORT'] = '6001'
+        os.environ['PRODUCTS_API_GRACEFUL_TIMEOUT'] = '2.5'
+        os.environ['PRODUCTS_API_DATABASE'] = 'env.db'
+        config = serve.ServerConfig()
+        self.assertEqual((config.port, config.graceful_timeout, config.database), (6001, 2.5, 'env.db'))
+
+        config = serve.ServerConfig.from_args(['--port', '7001', '--export-pool-size', '3',
+                                               '--access-log', 'requests.jsonl'])
+        self.assertEqual((config.port, config.export_pool_size, config.access_log),
+                         (7001, 3, 'requests.jsonl'))
+        self.assertEqual(config.database, 'env.db')
+
+
+class RequestCounterTest(unittest.TestCase):
+    """A request counts until its body is closed"""
+
+    def test_in_flight_and_limit(self):
+        limits = []
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return iter([b'a', b'b'])
+
+        counter = serve.RequestCounter(app, 2, lambda: limits.append(counter.handled))
+        first = counter({}, lambda status, headers: None)
+        self.assertEqual(list(first), [b'a', b'b'])
+        self.assertEqual(counter.in_flight, 1)
+        self.assertFalse(counter.wait_idle(0.01))
+        first.close()
+        self.assertEqual(counter.in_flight, 0)
+        self.assertTrue(counter.wait_idle(0.01))
+
+        for _ in range(2):
+            counter({}, lambda status, headers: None).close()
+        self.assertEqual((counter.handled, counter.in_flight, limits), (3, 0, [2]))
+
+    def test_failing_app_is_not_left_in_flight(self):
+        def app(environ, start_response):
+            raise RuntimeError("boom")
+
+        counter = serve.RequestCounter(app, 0, lambda: self.fail("no limit"))
+        with self.assertRaises(RuntimeError):
+            counter({}, lambda status, headers: None)
+        self.assertEqual((counter.handled, counter.in_flight), (1, 0))
+
+
+class LoadApiTest(ApiTestCase):
+    """Workers must serve from the configured database and pool sizes"""
+
+    product_count = 200
+
+    def test_load_api_swaps_pools(self):
+        saved = {name: getattr(products_api, name) for name in ('DATABASE', 'pool', 'export_pool')}
+
+        def restore():
+            products_api.pool.close()
+            products_api.export_pool.close()
+            for name, value in saved.items():
+                setattr(products_api, name, value)
+        self.addCleanup(restore)
+
+        config = serve.ServerConfig(database=self.db_path, pool_size=3, export_pool_size=1,
+                                    db_profile='serving')
+        api = serve.load_api(config)
+        self.assertIs(api, products_api)
+        self.assertEqual(api.DATABASE, self.db_path)
+        self.assertIsNot(api.pool, saved['pool'])
+        self.assertEqual((api.pool.database, api.pool.max_size), (self.db_path, 3))
+        self.assertEqual((api.export_pool.database, api.export_pool.max_size), (self.db_path, 1))
+        self.assertIs(api.pool.slow_query_log, saved['pool'].slow_query_log)
+
+        # Same settings again: the warm pools are kept
+        pool, export_pool = api.pool, api.export_pool
+        serve.load_api(config)
+        self.assertIs(api.pool, pool)
+        self.assertIs(api.export_pool, export_pool)
+
+        serve.warm_up(api, config)
+        self.assertEqual(api.pool.stats()['open'], 3)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), "the pre-forking server needs os.fork")
+class ServeProcessTest(unittest.TestCase):
+    """The master must keep workers serving through recycling and reloads"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.db_path = os.path.join(self.temp_dir, 'serve.db')
+        build_test_database(self.db_path, product_count=200)
+
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+
+    def get(self, path):
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}{path}", timeout=10) as response:
+            return response.status
+
+    def test_serves_through_recycling_and_reload(self):
+        env = {name: value for name, value in os.environ.items() if not name.startswith('PRODUCTS_API_')}
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(serve.__file__), '--host', '127.0.0.1', '--port', str(self.port),
+             '--workers', '2', '--pool-size', '2', '--database', self.db_path,
+             '--max-requests', '15', '--max-requests-jitter', '0', '--graceful-timeout', '5'],
+            cwd=self.temp_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        try:
+            self.assertIn('listening', process.stdout.readline())
+
+            # 40 requests over two workers recycle at least one of them
+            for _ in range(40):
+                self.assertEqual(self.get('/api/products?limit=5'), 200)
+
+            # Requests during a reload are answered by the old or the new workers
+            process.send_signal(signal.SIGHUP)
+            for _ in range(40):
+                self.assertEqual(self.get('/api/products/3'), 200)
+                time.sleep(0.05)
+            self.assertIsNone(process.poll())
+
+            process.send_signal(signal.SIGTERM)
+            self.assertEqual(process.wait(timeout=30), 0)
+            self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'requests.jsonl')))
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+    def test_reload_runs_current_code_of_every_module(self):
+        # Started the usual way, from a copy of the sources that can be edited
+        source_dir = os.path.dirname(os.path.abspath(serve.__file__))
+        code_dir = os.path.join(self.temp_dir, 'code')
+        os.mkdir(code_dir)
+        for name in os.listdir(source_dir):
+            if name.endswith('.py'):
+                shutil.copy(os.path.join(source_dir, name), code_dir)
+
+        env = {name: value for name, value in os.environ.items() if not name.startswith('PRODUCTS_API_')}
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(code_dir, 'products_api.py'), '--host', '127.0.0.1',
+             '--port', str(self.port), '--workers', '1', '--pool-size', '2', '--database', self.db_path,
+             '--graceful-timeout', '5'],
+            cwd=self.temp_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        try:
+            self.assertIn('listening', process.stdout.readline())
+            metrics_url = f"http://127.0.0.1:{self.port}/metrics"
+            with urllib.request.urlopen(metrics_url, timeout=10) as response:
+                self.assertEqual(response.headers['Content-Type'], products_api.metrics.CONTENT_TYPE)
+
+            # A helper module the master imported too
+            metrics_path = os.path.join(code_dir, 'metrics.py')
+            with open(metrics_path) as f:
+                source = f.read()
+            with open(metrics_path, 'w') as f:
+                f.write(source.replace("charset=utf-8'", "charset=utf-8; reloaded=1'", 1))
+
+            process.send_signal(signal.SIGHUP)
+            deadline = time.monotonic() + 30
+            content_type = None
+            while time.monotonic() < deadline:
+                with urllib.request.urlopen(metrics_url, timeout=10) as response:
+                    content_type = response.headers['Content-Type']
+                if 'reloaded=1' in content_type:
+                    break
+                time.sleep(0.1)
+            self.assertIn('reloaded=1', content_type)
+
+            process.send_signal(signal.SIGTERM)
+            self.assertEqual(process.wait(timeout=30), 0)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
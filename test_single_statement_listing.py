@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Single-Statement Listing Test
+Checks that a listing page, its total count and the department name come
+back from one SQL statement, including pages past the end and missing
+departments, and that the statement is served from an index.
+"""
+
+import unittest
+
+from api_fixtures import QueryPlanTestCase
+
+
+class SingleStatementListingTest(QueryPlanTestCase):
+    """Each listing must cost one statement"""
+
+    def test_single_statement_listings(self):
+        """Page, total count and department name come back from one statement"""
+        for url in ('/api/products?category=Jeans&sort_by=retail_price',
+                    '/api/departments/1/products?brand=Brand 3&sort_order=desc',
+                    '/api/departments/2/products?search=jeans'):
+            del self.statements[:]
+            listing = self.get(url)
+            self.assertEqual(len([sql for sql in self.statements if 'products p' in sql]), 1, url)
+            self.assertGreater(listing['pagination']['total_count'], 0)
+
+        empty = self.get('/api/departments/1/products?page=999')
+        self.assertEqual(empty['products'], [])
+        self.assertEqual(empty['department_name'], 'Men')
+        self.assertGreater(empty['pagination']['total_count'], 0)
+        self.assertTrue(empty['pagination']['has_prev'])
+
+        missing = self.client.get('/api/departments/99/products')
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(missing.get_json()['department_id'], 99)
+        self.assert_no_full_scans()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Slow Query Log Test
+Runs listings through the Flask test client with a zero threshold, so every
+statement counts as slow, and checks what the log captured: SQL, bound
+parameters, route and query plan, in a bounded buffer, in the JSONL file
+and from /api/admin/slow-queries. The file is only written when configured
+and the admin route is only open to local requests or the admin token.
+"""
+
+import json
+import os
+import unittest
+import logging
+
+import products_api
+from api_fixtures import ApiTestCase
+from db_pool import ConnectionPool
+from metrics import TimedCursor
+from slow_queries import SlowQueryLog
+
+
+class SlowQueryLogTest(ApiTestCase):
+    """Statements over the threshold must be captured with their plans"""
+
+    use_columnar_index = False
+    log_level = logging.WARNING
+
+    def use_log(self, log):
+        products_api.pool.close()
+        products_api.slow_query_log = log
+        products_api.pool = ConnectionPool(self.db_path, cursor_factory=TimedCursor, slow_query_log=log)
+        self.addCleanup(products_api.pool.close)
+
+    def test_captures_statement_params_and_plan(self):
+        path = os.path.join(self.temp_dir, 'slow.jsonl')
+        log = SlowQueryLog(threshold_ms=0, capacity=100, path=path)
+        self.use_log(log)
+        self.assertEqual(self.client.get('/api/products?category=Jeans&sort_by=retail_price').status_code, 200)
+
+        listing = [entry for entry in log.entries() if 'p.category = ?' in entry['sql']]
+        self.assertEqual(len(listing), 1)
+        entry = listing[0]
+        self.assertEqual(entry['route'], '/api/products')
+        self.assertEqual(entry['params'][0], 'Jeans')
+        self.assertTrue(any('idx_products_category_price' in line for line in entry['plan']), entry['plan'])
+
+        with open(path, encoding='utf-8') as log_file:
+            lines = [json.loads(line) for line in log_file]
+        self.assertEqual(len(lines), log.recorded)
+        self.assertIn(entry, lines)
+
+    def test_buffer_is_bounded_and_served(self):
+        log = SlowQueryLog(threshold_ms=0, capacity=3)
+        self.use_log(log)
+        for product_id in (1, 2, 3, 4):
+            self.client.get(f'/api/products/{product_id}')
+        self.assertGreater(log.recorded, 3)
+
+        body = self.client.get('/api/admin/slow-queries?limit=2').get_json()
+        self.assertEqual(len(body['slow_queries']), 2)
+        self.assertEqual(body['settings']['buffered'], 3)
+        self.assertEqual(body['slow_queries'][0], log.entries()[0])
+        self.assertEqual(body['slow_queries'][0]['params'], [4])
+
+        self.client.delete('/api/admin/slow-queries')
+        self.assertEqual(self.client.get('/api/admin/slow-queries').get_json()['slow_queries'], [])
+
+    def test_no_file_unless_configured(self):
+        previous = os.environ.pop('PRODUCTS_API_SLOW_QUERY_LOG', None)
+        if previous is not None:
+            self.addCleanup(os.environ.__setitem__, 'PRODUCTS_API_SLOW_QUERY_LOG', previous)
+        self.assertIsNone(SlowQueryLog.from_env().path)
+
+        path = os.path.join(self.temp_dir, 'env.jsonl')
+        os.environ['PRODUCTS_API_SLOW_QUERY_LOG'] = path
+        self.addCleanup(os.environ.pop, 'PRODUCTS_API_SLOW_QUERY_LOG', None)
+        self.assertEqual(SlowQueryLog.from_env().path, path)
+
+    def test_admin_route_is_local_only(self):
+        self.use_log(SlowQueryLog(threshold_ms=0))
+        self.client.get('/api/products/1')
+        remote = {'REMOTE_ADDR': '198.51.100.4'}
+        self.assertEqual(self.client.get('/api/admin/slow-queries', environ_base=remote).status_code, 403)
+        self.assertEqual(self.client.delete('/api/admin/slow-queries', environ_base=remote).status_code, 403)
+        self.assertGreater(products_api.slow_query_log.stats()['buffered'], 0)
+
+        saved = products_api.admin_token
+        self.addCleanup(setattr, products_api, 'admin_token', saved)
+        products_api.admin_token = 'ops-secret'
+        response = self.client.get('/api/admin/slow-queries', environ_base=remote,
+                                   headers={'Authorization': 'Bearer ops-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Access-Control-Allow-Origin',
+                         self.client.get('/api/admin/slow-queries', headers={'Origin': 'https://shop.example'}).headers)
+
+    def test_fast_statements_not_logged(self):
+        log = SlowQueryLog(threshold_ms=60000)
+        self.use_log(log)
+        self.client.get('/api/products?brand=Brand%203')
+        self.assertEqual(log.recorded, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
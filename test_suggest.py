@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Search Suggestion Test
+Checks /api/products/suggest against a brute-force scan of the catalog on a
+scratch database: the same terms, in popularity order, for short and long
+prefixes, plus the request limits and a background reload after a catalog change.
+"""
+
+import re
+import sqlite3
+import unittest
+from urllib.parse import quote
+
+import products_api
+from api_fixtures import ApiTestCase, insert_products
+from suggest_index import SuggestIndex, MAX_SUGGESTIONS, normalize
+
+QUERIES = ['j', 'J', 'je', 'jea', 'JEANS', 'brand', 'brand 3', 'Brand 3 Jeans 1', 'swim',
+           'tees', 'tops & t', '12', 'sw', 'emi', 'zzz']
+
+
+class SuggestTest(ApiTestCase):
+    """Suggestions must be the most popular terms with a word starting with q"""
+
+    product_count = 3000
+
+    @classmethod
+    def build_database(cls, db_path):
+        super().build_database(db_path)
+        insert_products(db_path, [(90001, 10.0, 'Jeans', 'Émile Jeans', 'Brand 3', 49.99, 'Women', 'SKUX1', 1)])
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.conn = sqlite3.connect(cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        products_api.suggest_index = SuggestIndex()
+
+    def suggest(self, query, limit=None):
+        url = f"/api/products/suggest?q={quote(query)}" + (f"&limit={limit}" if limit else "")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [(s['type'], s['value'], s['count']) for s in response.get_json()['suggestions']]
+
+    def expected(self, query, limit):
+        """Every term with a word starting with query, ranked like the index"""
+        terms = []
+        for kind, column in (('category', 'category'), ('brand', 'brand'), ('product', 'name')):
+            terms += [(kind, value, count) for value, count in self.conn.execute(
+                f"SELECT {column}, COUNT(*) FROM products WHERE {column} IS NOT NULL GROUP BY {column}")]
+        prefix = normalize(query)
+        matches = [term for term in terms
+                   if any(normalize(term[1])[match.start():].startswith(prefix)
+                          for match in re.finditer(r'\w+', normalize(term[1])))]
+        matches.sort(key=lambda term: (-term[2], len(term[1]), term[1], term[0]))
+        return matches[:limit]
+
+    def test_matches_brute_force(self):
+        for query in QUERIES:
+            for limit in (1, 8, MAX_SUGGESTIONS):
+                self.assertEqual(self.suggest(query, limit), self.expected(query, limit), query)
+        self.assertEqual(products_api.suggest_index.loads, 1)
+
+    def test_popularity_and_accents(self):
+        top = self.suggest('j')
+        self.assertEqual(top[0][:2], ('category', 'Jeans'))
+        self.assertIn(('product', 'Émile Jeans', 1), self.suggest('emile'))
+        self.assertEqual(self.suggest('zzz'), [])
+
+    def test_bounds(self):
+        self.assertEqual(len(self.suggest('b', limit=500)), MAX_SUGGESTIONS)
+        for url in ('/api/products/suggest', '/api/products/suggest?q=%20',
+                    '/api/products/suggest?q=a&limit=0', '/api/products/suggest?q=' + 'a' * 101):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_reloads_on_catalog_change(self):
+        self.assertEqual(self.suggest('quux'), [])
+        self.conn.execute("""
+            INSERT INTO products (id, cost, category, name, brand, retail_price, department, sku,
+                                  distribution_center_id)
+            VALUES (90002, 10.0, 'Swim', 'Quux Trunks', 'Quux', 30.0, 'Men', 'SKUX2', 1)
+        """)
+        self.conn.commit()
+        try:
+            # The previous snapshot answers, without an ETag, while the new one is built
+            stale = self.client.get('/api/products/suggest?q=quux')
+            self.assertEqual(stale.get_json()['suggestions'], [])
+            self.assertNotIn('ETag', stale.headers)
+            self.assertTrue(products_api.suggest_index.wait_for_rebuild(30))
+
+            self.assertEqual(self.suggest('quux'), [('brand', 'Quux', 1), ('product', 'Quux Trunks', 1)])
+            self.assertEqual(products_api.suggest_index.loads, 2)
+            self.assertIn('ETag', self.client.get('/api/products/suggest?q=quux').headers)
+        finally:
+            self.conn.execute("DELETE FROM products WHERE id = 90002")
+            self.conn.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()